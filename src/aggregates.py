@@ -0,0 +1,275 @@
+"""Mergeable aggregate states used by the pivot engine.
+
+An aggregator is described by the components it needs (``sum``, ``count``,
+``min``, ``max``, ``distinct`` or a sketch). Components are computed once per
+measure over a vector of group codes; they can then be regrouped (to build
+subtotals) or merged (to combine partitions) before being finalized into
+values, so several aggregators over the same measure share one pass.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .sketches import (
+    HyperLogLogState,
+    QuantileState,
+    SketchError,
+    hash_series,
+    resolve_compression,
+    resolve_hll_precision,
+    resolve_quantile,
+)
+
+ComponentKey = Tuple[Any, ...]
+
+STATE_COMPONENTS: Dict[str, Tuple[str, ...]] = {
+    "sum": ("sum",),
+    "count": ("count",),
+    "mean": ("sum", "count"),
+    "min": ("min",),
+    "max": ("max",),
+    "nunique": ("distinct",),
+    "hll": ("hll",),
+    "quantile": ("quantile",),
+}
+
+_NUMERIC_COMPONENTS = {"sum", "min", "max", "quantile"}
+_EXTREMES = {"min": (np.minimum, np.inf), "max": (np.maximum, -np.inf)}
+
+
+class AggregateError(ValueError):
+    """Raised when an aggregate state cannot be built or combined."""
+
+
+def _state_name(agg_meta: Dict[str, Any]) -> str:
+    state = agg_meta.get("state")
+    if state not in STATE_COMPONENTS:
+        raise AggregateError(f"Agregação '{agg_meta.get('label')}' não suporta estados combináveis.")
+    return state
+
+
+def target_quantile(agg_meta: Dict[str, Any], options: Optional[Dict[str, Any]]) -> float:
+    """Fixed quantile of the aggregator (e.g. median) or the one requested in ``options``."""
+    if agg_meta.get("quantile") is not None:
+        return float(agg_meta["quantile"])
+    try:
+        return resolve_quantile(options, None)
+    except SketchError as exc:
+        raise AggregateError(str(exc)) from exc
+
+
+def component_keys(agg_meta: Dict[str, Any], options: Optional[Dict[str, Any]]) -> List[ComponentKey]:
+    """Components (with their parameters) needed to finalize ``agg_meta``."""
+    state = _state_name(agg_meta)
+    try:
+        if state == "hll":
+            return [("hll", resolve_hll_precision(options))]
+        if state == "quantile":
+            return [("quantile", resolve_compression(options))]
+    except SketchError as exc:
+        raise AggregateError(str(exc)) from exc
+    return [(name,) for name in STATE_COMPONENTS[state]]
+
+
+@dataclass
+class DistinctState:
+    """Exact distinct values per group, kept as deduplicated ``(group, hash)`` pairs."""
+
+    groups: np.ndarray
+    hashes: np.ndarray
+
+    @classmethod
+    def from_hashes(cls, hashes: np.ndarray, codes: np.ndarray) -> "DistinctState":
+        return cls(codes.astype(np.int64), hashes).compact()
+
+    @classmethod
+    def concat(cls, states: Iterable["DistinctState"]) -> "DistinctState":
+        states = list(states)
+        return cls(
+            np.concatenate([state.groups for state in states]),
+            np.concatenate([state.hashes for state in states]),
+        ).compact()
+
+    def compact(self) -> "DistinctState":
+        pairs = pd.DataFrame({"group": self.groups, "hash": self.hashes}).drop_duplicates()
+        return DistinctState(
+            pairs["group"].to_numpy(dtype=np.int64), pairs["hash"].to_numpy(dtype=np.uint64)
+        )
+
+    def regroup(self, mapping: np.ndarray) -> "DistinctState":
+        return DistinctState(mapping[self.groups], self.hashes).compact()
+
+    def estimate(self, ngroups: int) -> np.ndarray:
+        return np.bincount(self.groups, minlength=ngroups).astype(float)
+
+
+def _extreme(values: np.ndarray, codes: np.ndarray, ngroups: int, kind: str) -> np.ndarray:
+    ufunc, fill = _EXTREMES[kind]
+    result = np.full(ngroups, fill)
+    valid = ~np.isnan(values)
+    ufunc.at(result, codes[valid], values[valid])
+    return result
+
+
+def _build_component(
+    key: ComponentKey,
+    series: pd.Series,
+    numeric: Optional[np.ndarray],
+    codes: np.ndarray,
+    ngroups: int,
+) -> Any:
+    kind = key[0]
+    if kind == "sum":
+        valid = ~np.isnan(numeric)
+        return np.bincount(codes[valid], weights=numeric[valid], minlength=ngroups)
+    if kind == "count":
+        valid = series.notna().to_numpy()
+        return np.bincount(codes[valid], minlength=ngroups).astype(float)
+    if kind in _EXTREMES:
+        return _extreme(numeric, codes, ngroups, kind)
+    if kind == "distinct":
+        valid = series.notna().to_numpy()
+        return DistinctState.from_hashes(hash_series(series[valid]), codes[valid])
+    if kind == "hll":
+        return HyperLogLogState.from_series(series, codes, key[1])
+    if kind == "quantile":
+        return QuantileState.from_values(numeric, codes, compression=key[1])
+    raise AggregateError(f"Componente '{kind}' não é suportado.")
+
+
+def _regroup_component(key: ComponentKey, value: Any, mapping: np.ndarray, ngroups: int) -> Any:
+    kind = key[0]
+    if kind in ("sum", "count"):
+        return np.bincount(mapping, weights=value, minlength=ngroups)
+    if kind in _EXTREMES:
+        ufunc, fill = _EXTREMES[kind]
+        result = np.full(ngroups, fill)
+        ufunc.at(result, mapping, value)
+        return result
+    return value.regroup(mapping)
+
+
+def _merge_component(key: ComponentKey, values: List[Any]) -> Any:
+    kind = key[0]
+    if kind in ("sum", "count"):
+        return np.sum(values, axis=0)
+    if kind in _EXTREMES:
+        return _EXTREMES[kind][0].reduce(values, axis=0)
+    return type(values[0]).concat(values)
+
+
+@dataclass
+class MeasureState:
+    """Every component requested for one measure over ``ngroups`` groups."""
+
+    ngroups: int
+    components: Dict[ComponentKey, Any] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls,
+        series: pd.Series,
+        codes: np.ndarray,
+        ngroups: int,
+        keys: Iterable[ComponentKey],
+    ) -> "MeasureState":
+        keys = list(dict.fromkeys(keys))
+        numeric = None
+        if any(key[0] in _NUMERIC_COMPONENTS for key in keys):
+            numeric = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+        components = {
+            key: _build_component(key, series, numeric, codes, ngroups) for key in keys
+        }
+        return cls(ngroups, components)
+
+    @classmethod
+    def merge(cls, states: Iterable["MeasureState"]) -> "MeasureState":
+        """Combine states computed over the same group codes (e.g. partitions)."""
+        states = list(states)
+        if not states:
+            raise AggregateError("Nenhum estado para combinar.")
+        ngroups = states[0].ngroups
+        if any(state.ngroups != ngroups for state in states):
+            raise AggregateError("Estados com grupos diferentes não podem ser combinados.")
+        keys = list(states[0].components)
+        try:
+            components = {
+                key: _merge_component(key, [state.components[key] for state in states])
+                for key in keys
+            }
+        except (KeyError, SketchError) as exc:
+            raise AggregateError(str(exc)) from exc
+        return cls(ngroups, components)
+
+    def take(self, positions: np.ndarray) -> "MeasureState":
+        """Keep only the groups at ``positions`` (dense components only)."""
+        components: Dict[ComponentKey, Any] = {}
+        for key, value in self.components.items():
+            if not isinstance(value, np.ndarray):
+                raise AggregateError(f"Componente '{key[0]}' não permite selecionar grupos.")
+            components[key] = value[positions]
+        return MeasureState(len(positions), components)
+
+    def regroup(self, mapping: np.ndarray, ngroups: int) -> "MeasureState":
+        """Fold groups following ``mapping`` (old group code -> new group code)."""
+        return MeasureState(
+            ngroups,
+            {
+                key: _regroup_component(key, value, mapping, ngroups)
+                for key, value in self.components.items()
+            },
+        )
+
+    def finalize(self, agg_meta: Dict[str, Any], options: Optional[Dict[str, Any]]) -> np.ndarray:
+        state = _state_name(agg_meta)
+        key = component_keys(agg_meta, options)[0]
+        value = self.components[key]
+        if state in ("sum", "count"):
+            return value.copy()
+        if state == "mean":
+            counts = self.components[("count",)]
+            return np.divide(value, counts, out=np.full(self.ngroups, np.nan), where=counts > 0)
+        if state in ("min", "max"):
+            return np.where(np.isinf(value), np.nan, value)
+        if state == "quantile":
+            return value.estimate(self.ngroups, target_quantile(agg_meta, options))
+        return value.estimate(self.ngroups)
+
+    def describe(
+        self,
+        agg_meta: Dict[str, Any],
+        options: Optional[Dict[str, Any]],
+        totals: Optional["MeasureState"] = None,
+    ) -> Dict[str, Any]:
+        """Approximation metadata for sketch-backed aggregators (empty when exact).
+
+        ``totals`` is the merged (grand total) state: its sketch can go past
+        ``exact_limit`` while every cell stays exact, so cells and totals
+        report exactness separately.
+        """
+        state = _state_name(agg_meta)
+        if state not in ("hll", "quantile"):
+            return {}
+        key = component_keys(agg_meta, options)[0]
+        sketch = self.components[key]
+        if state == "hll":
+            return {
+                "method": "hyperloglog",
+                "precision": sketch.precision,
+                "relativeError": round(sketch.relative_error, 6),
+            }
+        cells_exact = sketch.is_exact
+        totals_exact = totals.components[key].is_exact if totals is not None else cells_exact
+        return {
+            "method": "t-digest",
+            "quantile": target_quantile(agg_meta, options),
+            "compression": sketch.compression,
+            "exactLimit": sketch.exact_limit,
+            "exact": cells_exact and totals_exact,
+            "cellsExact": cells_exact,
+            "totalsExact": totals_exact,
+        }
@@ -2,19 +2,20 @@
 from __future__ import annotations
 
 import copy
-import io
 import json
 import os
 import shutil
 import uuid
+from datetime import datetime
 from functools import wraps
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import subprocess
+import threading
 import time
 
+import numpy as np
 import pandas as pd
-from fpdf import FPDF
 from flask import (
     Flask,
     Response,
@@ -34,16 +35,45 @@ from urllib.parse import urljoin
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
 
+from .cubes import (
+    CUBE_LEARN_AFTER,
+    CUBE_MAX_PER_DATASET,
+    MaterializedCube,
+    configured_dimensions,
+    materialize,
+)
+from .backends import available_backends, resolve_backend
+from .columnar import ColumnarError, discover_stores
 from .data_loader import DataLoaderError, load_dataframe
+from .derived import DerivedColumns
+from .drillthrough import (
+    DRILL_DEFAULT_LIMIT,
+    DrillThroughError,
+    HandleStore,
+    PivotHandle,
+    cell_positions,
+    page_rows,
+)
+from .compression import compress_response
+from .conditional import cache_hints, matching_etag, not_modified, query_etag
+from .encodings import JSON_MIMETYPE, EncodingError, encode_pivot, negotiate
+from .export_jobs import CachedExport, ExportCache, ExportJob, ExportJobError, ExportJobs, ExportWriter
+from .exports import XLSX_MIMETYPE, iter_csv, write_xlsx
+from .facets import FacetError, MemberSearch, facet_page
+from .filters import apply_filters, filter_columns, filter_mask
+from .indexes import BitmapIndex, DimensionIndex, path_positions, select_rows
+from .partitioned import PartitionedStore, partitioning_enabled
+from .pdf_export import RenderedPdf, render_pivot_pdf
 from .pivot import (
     CalculationError,
     PivotError,
+    PivotResult,
     apply_post_calculations,
-    apply_pre_calculations,
     available_aggregations,
+    build_chunked_pivot,
     build_pivot,
-    pivot_result_to_dataframe,
 )
+from .predicates import FilterError, normalize_filter
 from .dashboard import (
     DashboardError,
     DashboardManager,
@@ -330,8 +360,15 @@ class DatasetRegistry:
 
     def __init__(self) -> None:
         self._datasets: Dict[str, Dict[str, Any]] = {}
-
-    def create(self, filename: str, dataframe: pd.DataFrame) -> Dict[str, Any]:
+        # Dimension combinations learned from traffic, remembered per file name so
+        # the next upload of the same base materializes them right away.
+        self._learned: Dict[str, List[Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def create(
+        self, filename: str, dataframe: pd.DataFrame, columnar: Optional[Any] = None
+    ) -> Dict[str, Any]:
+        """Register a dataset; with ``columnar`` the rows stay on disk and ``dataframe`` is its schema."""
         dataset_id = str(uuid.uuid4())
         numeric_columns = dataframe.select_dtypes(include=["number", "bool"]).columns.tolist()
         info: Dict[str, Any] = {
@@ -341,9 +378,32 @@ class DatasetRegistry:
             "columns": dataframe.columns.tolist(),
             "dimensions": dataframe.columns.tolist(),
             "measures": numeric_columns or dataframe.columns.tolist(),
-            "row_count": int(dataframe.shape[0]),
+            "row_count": int(columnar.row_count if columnar is not None else dataframe.shape[0]),
             "schema": {col: str(dtype) for col, dtype in dataframe.dtypes.items()},
+            "cube_measures": numeric_columns,
+            "cubes": [],
+            "query_counts": {},
+            "cube_rejected": set(),
+            "indexes": {},
+            "bitmaps": {},
+            "searches": {},
+            "version": 1,
+            "columnar": columnar,
         }
+        info["derived"] = DerivedColumns(dataframe, info["version"])
+        if columnar is not None:
+            # Cubes, indexes and partitions need the rows in memory.
+            info["cube_measures"] = []
+            self._datasets[dataset_id] = info
+            return info
+        combos = [
+            *((combo, "configured") for combo in configured_dimensions()),
+            *((combo, "learned") for combo in self._learned.get(filename, [])),
+        ]
+        for combo, origin in combos:
+            self._add_cube(info, combo, origin)
+        # Filter bitmaps are built per column on its first filter (``bitmap_index``),
+        # so measures and ID-like columns nobody filters on cost nothing at upload.
         self._datasets[dataset_id] = info
         return info
 
@@ -356,11 +416,119 @@ class DatasetRegistry:
         return list(self._datasets.keys())
 
     def delete(self, dataset_id: str) -> None:
-        self._datasets.pop(dataset_id, None)
+        info = self._datasets.pop(dataset_id, None)
+        if info is not None and info.get("partitions") is not None:
+            info["partitions"].close()
+
+    def partitioned_store(self, dataset_id: str) -> Optional[PartitionedStore]:
+        """Memory-mapped partitions of a large dataset for process-pool pivots, or ``None``."""
+        info = self.get(dataset_id)
+        if info["columnar"] is not None or not partitioning_enabled(info["row_count"]):
+            return None
+        if info.get("partitions") is None:
+            with self._lock:
+                if info.get("partitions") is None:
+                    info["partitions"] = PartitionedStore(
+                        info["frame"], lambda column: self.member_index(dataset_id, column)
+                    )
+        return info["partitions"]
+
+    def member_index(self, dataset_id: str, column: str) -> DimensionIndex:
+        """Member -> row positions index of ``column``, built on first use and kept."""
+        info = self.get(dataset_id)
+        indexes = info["indexes"]
+        if column not in indexes:
+            with self._lock:
+                if column not in indexes:
+                    indexes[column] = DimensionIndex.build(info["frame"][column])
+        return indexes[column]
+
+    def bitmap_index(self, dataset_id: str, column: str) -> BitmapIndex:
+        """Per-member row bitmaps of ``column``, used to evaluate filters."""
+        info = self.get(dataset_id)
+        bitmaps = info["bitmaps"]
+        if column not in bitmaps:
+            index = self.member_index(dataset_id, column)
+            with self._lock:
+                if column not in bitmaps:
+                    bitmaps[column] = BitmapIndex.build(index)
+        return bitmaps[column]
+
+    def member_search(self, dataset_id: str, column: str) -> MemberSearch:
+        """Prefix/substring search over the members of ``column``, built on first use and kept."""
+        info = self.get(dataset_id)
+        searches = info["searches"]
+        if column not in searches:
+            index = self.member_index(dataset_id, column)
+            with self._lock:
+                if column not in searches:
+                    searches[column] = MemberSearch(index.text())
+        return searches[column]
+
+    def filter_positions(
+        self, dataset_id: str, filters: Dict[str, Any]
+    ) -> Optional[np.ndarray]:
+        """Sorted positions of the dataset rows passing ``filters`` (``None`` when none applies)."""
+        frame = self.get(dataset_id)["frame"]
+        indexed = {column: values for column, values in filters.items() if column in frame.columns}
+        return select_rows(lambda column: self.bitmap_index(dataset_id, column), indexed)
+
+    def derived_frame(self, dataset_id: str, calculations: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Dataset frame with ``calculations`` applied, memoized for the dataset version."""
+        info = self.get(dataset_id)
+        cache: DerivedColumns = info["derived"]
+        if cache.version != info["version"]:
+            with self._lock:
+                if info["derived"].version != info["version"]:
+                    info["derived"] = DerivedColumns(info["frame"], info["version"])
+            cache = info["derived"]
+        return cache.apply(calculations)
+
+    def record_query(self, dataset_id: str, dimensions: List[str]) -> Optional[MaterializedCube]:
+        """Count a pivot answered from raw rows; materialize its dimensions once frequent."""
+        info = self._datasets.get(dataset_id)
+        combo = tuple(sorted(dict.fromkeys(dimensions)))
+        if info is None or not combo:
+            return None
+        with self._lock:
+            counts = info["query_counts"]
+            counts[combo] = counts.get(combo, 0) + 1
+            if counts[combo] < CUBE_LEARN_AFTER or combo in info["cube_rejected"]:
+                return None
+            if any(set(combo) <= set(cube.dimensions) for cube in info["cubes"]):
+                return None
+            cube = self._add_cube(info, combo, "learned")
+            if cube is None:
+                info["cube_rejected"].add(combo)
+                return None
+            learned = self._learned.setdefault(info["name"], [])
+            if combo not in learned:
+                learned.append(combo)
+            return cube
+
+    def _add_cube(
+        self, info: Dict[str, Any], combo: Tuple[str, ...], origin: str
+    ) -> Optional[MaterializedCube]:
+        if not info["cube_measures"] or len(info["cubes"]) >= CUBE_MAX_PER_DATASET:
+            return None
+        if any(tuple(cube.dimensions) == tuple(combo) for cube in info["cubes"]):
+            return None
+        cube = materialize(info["frame"], combo, info["cube_measures"], origin)
+        if cube is not None:
+            info["cubes"].append(cube)
+        return cube
 
 
 datasets = DatasetRegistry()
+for _store in discover_stores():
+    datasets.create(_store.name, _store.schema_frame(), columnar=_store)
+pivot_handles = HandleStore()
 dashboard_manager = DashboardManager()
+export_cache = ExportCache()
+export_jobs = ExportJobs(export_cache)
+
+EXPORT_FORMATS = ("excel", "csv", "pdf")
+DASHBOARD_EXPORT_FORMATS = ("csv", "pdf", "png")
 
 
 def _dashboard_config() -> Dict[str, Any]:
@@ -371,29 +539,15 @@ def _dashboard_config() -> Dict[str, Any]:
     }
 
 
-def _normalize_filters(raw_filters: Dict[str, Any]) -> Dict[str, List[str]]:
-    normalized: Dict[str, List[str]] = {}
+def _normalize_filters(raw_filters: Dict[str, Any]) -> Dict[str, Any]:
+    normalized: Dict[str, Any] = {}
     for column, values in (raw_filters or {}).items():
-        if not isinstance(values, list):
-            continue
-        keep = [str(value) for value in values if value is not None]
+        keep = normalize_filter(column, values)
         if keep:
             normalized[column] = keep
     return normalized
 
 
-def _apply_filters(frame: pd.DataFrame, filters: Dict[str, List[str]]) -> pd.DataFrame:
-    if not filters:
-        return frame
-    subset = frame
-    for column, values in filters.items():
-        if column not in subset.columns or not values:
-            continue
-        mask = subset[column].astype(str).isin(values)
-        subset = subset[mask]
-    return subset
-
-
 def _normalize_calculations(value: Any, field: str) -> List[Dict[str, Any]]:
     if value is None:
         return []
@@ -422,6 +576,194 @@ def _normalize_measures(value: Any) -> List[str]:
     return list(seen.keys())
 
 
+def _execute_pivot(
+    dataset_id: str,
+    dataset: Dict[str, Any],
+    payload: Dict[str, Any],
+    *,
+    rows: List[str],
+    columns: List[str],
+    measures: List[str],
+    aggregator: str,
+    filters: Dict[str, Any],
+    pre_calcs: List[Dict[str, Any]],
+    post_calcs: List[Dict[str, Any]],
+    drill_down: bool = False,
+    row_path: Optional[List[Any]] = None,
+) -> PivotResult:
+    """Run a pivot request, letting materialized cubes answer it when they cover it.
+
+    In drill-down mode only the row level below ``row_path`` is computed, over
+    the rows of that node as found through the member indexes.
+    """
+    if dataset.get("columnar") is not None:
+        return _execute_chunked_pivot(
+            dataset_id,
+            dataset,
+            payload,
+            rows=rows,
+            columns=columns,
+            measures=measures,
+            aggregator=aggregator,
+            filters=filters,
+            pre_calcs=pre_calcs,
+            post_calcs=post_calcs,
+            drill_down=drill_down,
+            row_path=row_path,
+        )
+    frame = dataset["frame"]
+    cubes: Optional[List[MaterializedCube]] = dataset.get("cubes")
+    derived: Optional[pd.DataFrame] = None
+    if pre_calcs:
+        # Calculated fields are memoized over the whole dataset; no cube can serve them.
+        frame = derived = datasets.derived_frame(dataset_id, pre_calcs)
+        cubes = None
+    all_rows = list(rows or [])
+    drill: Dict[str, Any] = {}
+    selection: Optional[np.ndarray] = None
+    if drill_down:
+        path = list(row_path or [])
+        rows = all_rows[: len(path) + 1]
+        drill = {"rows": all_rows, "path": path, "depth": len(rows), "expandable": len(rows) < len(all_rows)}
+        if path:
+            selection = path_positions(
+                lambda column: datasets.member_index(dataset_id, column), all_rows, path
+            )
+            if not len(selection):
+                raise PivotError("Nenhum dado corresponde ao caminho expandido.")
+            cubes = None
+            drill["sourceRows"] = int(len(selection))
+    # Without cubes, filters become one row selection (bitmap AND/OR) and the
+    # frame is taken once; derived frames share the dataset row order.
+    prefiltered = bool(pre_calcs) or selection is not None
+    if prefiltered:
+        filtered = datasets.filter_positions(dataset_id, filters)
+        if filtered is not None:
+            selection = (
+                filtered
+                if selection is None
+                else np.intersect1d(selection, filtered, assume_unique=True)
+            )
+        if selection is not None:
+            frame = frame.take(selection)
+        calculated = {
+            column: values for column, values in filters.items() if column not in dataset["frame"].columns
+        }
+        mask = filter_mask(frame, calculated)
+        if mask is not None:
+            frame = frame[mask]
+            selection = np.flatnonzero(mask) if selection is None else selection[mask]
+        if frame.empty:
+            raise PivotError("Nenhum dado corresponde aos filtros aplicados.")
+
+    backend = resolve_backend(payload.get("backend"))
+    if backend.name != "pandas":
+        state_source = backend.source(frame)
+    elif cubes is not None:
+        state_source = datasets.partitioned_store(dataset_id)
+    else:
+        state_source = None
+    pivot = build_pivot(
+        dataset_id=dataset_id,
+        frame=frame,
+        rows=rows,
+        columns=columns,
+        measure=measures,
+        aggregator=aggregator,
+        sort=payload.get("sort"),
+        top_n=payload.get("topN"),
+        aggregator_options=payload.get("aggregatorOptions"),
+        values=payload.get("values"),
+        filters=None if prefiltered else filters,
+        cubes=cubes,
+        state_source=state_source,
+        filter_index=lambda column: datasets.bitmap_index(dataset_id, column),
+    )
+    source = pivot.metadata.get("aggregate") or {}
+    if source.get("source") == "rows" and source.get("routable"):
+        datasets.record_query(
+            dataset_id, [*(rows or []), *(columns or []), *filter_columns(dataset["frame"], filters)]
+        )
+    if drill:
+        pivot.metadata["drillDown"] = drill
+    top_n = pivot.metadata.get("topN") or {}
+    pivot.metadata["handle"] = pivot_handles.register(
+        PivotHandle(
+            dataset_id=dataset_id,
+            rows=list(rows or []),
+            columns=list(columns or []),
+            filters={} if pre_calcs else dict(filters),
+            others_label=top_n.get("othersLabel") if top_n.get("others") else None,
+            # The shared derived frame and row positions, not a filtered copy.
+            frame=derived,
+            selection=selection if derived is not None else None,
+        )
+    )
+    pivot.calculations["pre"] = copy.deepcopy(pre_calcs)
+    return apply_post_calculations(pivot, post_calcs)
+
+
+def _execute_chunked_pivot(
+    dataset_id: str,
+    dataset: Dict[str, Any],
+    payload: Dict[str, Any],
+    *,
+    rows: List[str],
+    columns: List[str],
+    measures: List[str],
+    aggregator: str,
+    filters: Dict[str, Any],
+    pre_calcs: List[Dict[str, Any]],
+    post_calcs: List[Dict[str, Any]],
+    drill_down: bool = False,
+    row_path: Optional[List[Any]] = None,
+) -> PivotResult:
+    """Pivot over a dataset kept on disk, scanned one row group at a time.
+
+    There are no member indexes, so an expanded path becomes one filter per
+    level and no drill-through handle is registered.
+    """
+    all_rows = list(rows or [])
+    drill: Dict[str, Any] = {}
+    if drill_down:
+        path = list(row_path or [])
+        rows = all_rows[: len(path) + 1]
+        drill = {"rows": all_rows, "path": path, "depth": len(rows), "expandable": len(rows) < len(all_rows)}
+        filters = {**filters}
+        for column, member in zip(all_rows, path):
+            if member is None:
+                raise PivotError("Membros vazios não podem ser expandidos em bases lidas do disco.")
+            keep = [str(member)]
+            current = filters.get(column)
+            if current:
+                selected = current.get("in", keep) if isinstance(current, dict) else current
+                keep = [value for value in selected if value in keep]
+                if not keep:
+                    raise PivotError("Nenhum dado corresponde ao caminho expandido.")
+            filters[column] = {**current, "in": keep} if isinstance(current, dict) else keep
+    try:
+        pivot = build_chunked_pivot(
+            dataset_id=dataset_id,
+            store=dataset["columnar"],
+            rows=rows,
+            columns=columns,
+            measure=measures,
+            aggregator=aggregator,
+            sort=payload.get("sort"),
+            top_n=payload.get("topN"),
+            aggregator_options=payload.get("aggregatorOptions"),
+            values=payload.get("values"),
+            filters=filters,
+            pre_calculations=pre_calcs,
+        )
+    except (ColumnarError, OSError) as exc:
+        raise PivotError(f"Falha ao ler a base em disco: {exc}") from exc
+    if drill:
+        pivot.metadata["drillDown"] = drill
+    pivot.calculations["pre"] = copy.deepcopy(pre_calcs)
+    return apply_post_calculations(pivot, post_calcs)
+
+
 @app.get("/")
 @reports_access_required
 def index():
@@ -677,6 +1019,12 @@ def start_node_server_if_needed():
     if request.path.startswith("/dashboard") or request.path.startswith("/api/trpc"):
         _start_node_server()
 
+@app.after_request
+def compress_api_response(response):
+    if request.path.startswith("/api/"):
+        return compress_response(response, request.accept_encodings)
+    return response
+
 @app.teardown_appcontext
 def shutdown_node_server(exception=None):
     global NODE_SERVER_PROCESS
@@ -866,8 +1214,10 @@ def upload_dataset():
         "dimensions": dataset["dimensions"],
         "measures": dataset["measures"],
         "aggregations": available_aggregations(),
+        "backends": available_backends(),
         "rowCount": dataset["row_count"],
         "schema": dataset["schema"],
+        "cubes": [cube.describe() for cube in dataset["cubes"]],
     }
     return jsonify(response)
 
@@ -876,7 +1226,23 @@ def upload_dataset():
 @reports_access_required
 def pivot_endpoint():
     payload = request.get_json(silent=True) or {}
+    return _pivot_response(payload, drill_down=bool(payload.get("drillDown")))
 
+
+@app.post("/api/pivot/expand")
+@reports_access_required
+def expand_pivot_endpoint():
+    payload = request.get_json(silent=True) or {}
+    path = payload.get("path")
+    rows = payload.get("rows") or []
+    if not isinstance(path, list) or not path or len(path) >= len(rows):
+        return jsonify({"error": "Caminho de expansão inválido para as dimensões de linha."}), 400
+    return _pivot_response(payload, drill_down=True, row_path=path)
+
+
+def _pivot_response(
+    payload: Dict[str, Any], *, drill_down: bool = False, row_path: Optional[List[Any]] = None
+):
     dataset_id = payload.get("datasetId")
     rows = payload.get("rows", [])
     columns = payload.get("columns", [])
@@ -885,8 +1251,8 @@ def pivot_endpoint():
         measures_payload = payload.get("measure")
     measures = _normalize_measures(measures_payload)
     aggregator = payload.get("aggregator", "sum")
-    filters = _normalize_filters(payload.get("filters", {}))
     try:
+        filters = _normalize_filters(payload.get("filters", {}))
         pre_calcs = _normalize_calculations(payload.get("preCalculations"), "preCalculations")
         post_calcs = _normalize_calculations(payload.get("postCalculations"), "postCalculations")
     except ValueError as exc:
@@ -900,30 +1266,33 @@ def pivot_endpoint():
     except KeyError:
         return jsonify({"error": "Dataset não encontrado ou expirado."}), 404
 
-    if not measures:
+    if not measures and not payload.get("values"):
         return jsonify({"error": "É necessário escolher pelo menos uma medida numérica."}), 400
 
-    filtered_frame = _apply_filters(dataset["frame"], filters)
-    if filtered_frame.empty:
-        return jsonify({"error": "Nenhum dado corresponde aos filtros aplicados."}), 400
-
-    try:
-        filtered_frame = apply_pre_calculations(filtered_frame, pre_calcs)
-    except CalculationError as exc:
-        return jsonify({"error": str(exc)}), 400
+    etag = query_etag(
+        request.path, dataset_id, dataset["version"], payload, negotiate(request.accept_mimetypes)
+    )
+    matched = matching_etag(request.if_none_match, etag)
+    # A cached pivot is only reusable while its drill-through handle is alive.
+    if matched and (dataset.get("columnar") is not None or pivot_handles.has_tag(etag)):
+        return not_modified(matched, vary=("Accept",))
 
     try:
-        pivot = build_pivot(
-            dataset_id=dataset_id,
-            frame=filtered_frame,
+        pivot = _execute_pivot(
+            dataset_id,
+            dataset,
+            payload,
             rows=rows,
             columns=columns,
-            measure=measures,
+            measures=measures,
             aggregator=aggregator,
+            filters=filters,
+            pre_calcs=pre_calcs,
+            post_calcs=post_calcs,
+            drill_down=drill_down,
+            row_path=row_path,
         )
-        pivot.calculations["pre"] = copy.deepcopy(pre_calcs)
-        pivot = apply_post_calculations(pivot, post_calcs)
-    except (PivotError, CalculationError) as exc:
+    except (PivotError, CalculationError, FilterError) as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception:
         app.logger.exception("Erro inesperado durante a geração do pivot")
@@ -931,7 +1300,62 @@ def pivot_endpoint():
 
     response = pivot.as_dict()
     response["filters"] = filters
-    return jsonify(response)
+    handle = response["metadata"].get("handle")
+    if handle:
+        pivot_handles.tag(etag, handle)
+    return cache_hints(_encoded_pivot(response), etag)
+
+
+def _encoded_pivot(response: Dict[str, Any]):
+    """Pivot payload as JSON, or in the compact encoding the client prefers in ``Accept``."""
+    mimetype = negotiate(request.accept_mimetypes)
+    result = None
+    if mimetype != JSON_MIMETYPE:
+        try:
+            result = Response(encode_pivot(response, mimetype), mimetype=mimetype)
+        except EncodingError:
+            app.logger.warning("Pivot sem codificação %s; respondendo em JSON.", mimetype)
+    if result is None:
+        result = jsonify(response)
+    result.vary.add("Accept")
+    return result
+
+
+@app.post("/api/pivot/drillthrough")
+@reports_access_required
+def drillthrough_endpoint():
+    payload = request.get_json(silent=True) or {}
+    handle_id = payload.get("handle")
+    if not handle_id:
+        return jsonify({"error": "handle é obrigatório."}), 400
+    try:
+        handle = pivot_handles.get(str(handle_id))
+        dataset = datasets.get(handle.dataset_id)
+    except KeyError:
+        return jsonify({"error": "Resultado expirado; gere a tabela dinâmica novamente."}), 404
+
+    def index_for(column: str) -> DimensionIndex:
+        # Derived frames share the dataset row order; only calculated columns need a local index.
+        if handle.frame is not None and column not in dataset["frame"].columns:
+            return handle.local_index(column)
+        return datasets.member_index(handle.dataset_id, column)
+
+    frame = handle.frame if handle.frame is not None else dataset["frame"]
+    try:
+        positions = cell_positions(
+            handle, frame, index_for, payload.get("rowKey"), payload.get("columnKey")
+        )
+        page = page_rows(
+            frame,
+            positions,
+            payload.get("columns"),
+            payload.get("offset", 0),
+            payload.get("limit", DRILL_DEFAULT_LIMIT),
+        )
+    except (DrillThroughError, TypeError, ValueError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    page["handle"] = handle_id
+    return jsonify(page)
 
 
 @app.get("/api/filter-values")
@@ -951,10 +1375,96 @@ def filter_values_endpoint():
     frame = dataset["frame"]
     if field not in frame.columns:
         return jsonify({"error": "Campo inválido para filtros."}), 400
-
-    values = frame[field].dropna().astype(str).unique().tolist()
+    etag = query_etag(request.path, dataset_id, dataset["version"], field)
+    matched = matching_etag(request.if_none_match, etag)
+    if matched:
+        return not_modified(matched)
+
+    if dataset.get("columnar") is not None:
+        members: set = set()
+        for chunk in dataset["columnar"].iter_chunks([field]):
+            members.update(chunk[field].dropna().astype(str).unique().tolist())
+        values = list(members)
+    else:
+        values = frame[field].dropna().astype(str).unique().tolist()
     values.sort()
-    return jsonify({"values": values})
+    return cache_hints(jsonify({"values": values}), etag)
+
+
+def _facet_counts(
+    dataset_id: str, dataset: Dict[str, Any], field: str, filters: Dict[str, Any]
+) -> Tuple[MemberSearch, np.ndarray, np.ndarray]:
+    """Search index, row count per member and offerable members of ``field``.
+
+    The field's own filter is left out of the context, so its other members
+    stay visible while the remaining filters narrow the counts.
+    """
+    others = {column: values for column, values in filters.items() if column != field}
+    store = dataset.get("columnar")
+    if store is not None:
+        totals: Dict[str, int] = {}
+        columns = list(dict.fromkeys([field, *filter_columns(dataset["frame"], others)]))
+        for chunk in store.iter_chunks(columns):
+            chunk = apply_filters(chunk, others)
+            for value, count in chunk[field].dropna().astype(str).value_counts().items():
+                totals[value] = totals.get(value, 0) + int(count)
+        search = MemberSearch(list(totals))
+        counts = np.fromiter(totals.values(), dtype=np.int64, count=len(totals))
+        return search, counts, np.ones(len(totals), dtype=bool)
+    index = datasets.member_index(dataset_id, field)
+    positions = datasets.filter_positions(dataset_id, others)
+    if positions is None:
+        counts = np.diff(index.offsets)
+    else:
+        counts = np.bincount(index.codes[positions], minlength=len(index))
+    return datasets.member_search(dataset_id, field), counts, ~index.members.isna()
+
+
+@app.post("/api/filter-values/facets")
+@reports_access_required
+def filter_facets_endpoint():
+    """Members with row counts of several fields under the current filters, searchable and paged."""
+    payload = request.get_json(silent=True) or {}
+    dataset_id = payload.get("datasetId")
+    if not dataset_id:
+        return jsonify({"error": "datasetId é obrigatório."}), 400
+    try:
+        dataset = datasets.get(dataset_id)
+    except KeyError:
+        return jsonify({"error": "Dataset não encontrado ou expirado."}), 404
+
+    fields = payload.get("fields")
+    if isinstance(fields, (str, dict)):
+        fields = [fields]
+    if not isinstance(fields, list) or not fields:
+        return jsonify({"error": "Informe os campos em 'fields'."}), 400
+    try:
+        filters = _normalize_filters(payload.get("filters", {}))
+    except FilterError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    facets: Dict[str, Any] = {}
+    for entry in fields:
+        options = {**payload, **entry} if isinstance(entry, dict) else {**payload, "field": entry}
+        field = options.get("field")
+        if field not in dataset["frame"].columns:
+            return jsonify({"error": f"Campo '{field}' inválido para filtros."}), 400
+        try:
+            search, counts, valid = _facet_counts(dataset_id, dataset, field, filters)
+            facets[field] = facet_page(
+                search,
+                counts,
+                valid,
+                query=options.get("search"),
+                mode=str(options.get("searchMode") or "contains").lower(),
+                order=str(options.get("order") or "value").lower(),
+                offset=options.get("offset", 0),
+                limit=options.get("limit"),
+                include_empty=bool(options.get("includeEmpty")),
+            )
+        except (FacetError, FilterError) as exc:
+            return jsonify({"error": str(exc)}), 400
+    return jsonify({"facets": facets, "filters": filters})
 
 
 @app.post("/api/dashboard/upload")
@@ -991,11 +1501,32 @@ def dashboard_upload():
     )
 
 
+def _dashboard_etag(dataset_id: Optional[str], payload: Dict[str, Any]) -> Optional[str]:
+    """Tag of a dashboard view: dataset, query, offered datasets, settings and the day (deadlines)."""
+    try:
+        dataset = dashboard_manager.list_or_default(dataset_id)
+    except DashboardError:
+        return None
+    return query_etag(
+        request.path,
+        dataset.id,
+        dataset.created_at,
+        payload,
+        dashboard_manager.datasets(),
+        _dashboard_config(),
+        datetime.utcnow().date(),
+    )
+
+
 @app.post("/api/dashboard/query")
 @dashboard_access_required
 def dashboard_query():
     payload = request.get_json(silent=True) or {}
     dataset_id = payload.get("datasetId")
+    etag = _dashboard_etag(dataset_id, payload)
+    matched = etag and matching_etag(request.if_none_match, etag)
+    if matched:
+        return not_modified(matched)
     try:
         view = dashboard_manager.prepare_view(dataset_id, payload)
     except DashboardError as exc:
@@ -1004,13 +1535,17 @@ def dashboard_query():
         app.logger.exception("Erro inesperado ao gerar dashboard")
         return jsonify({"error": "Erro interno ao gerar o dashboard."}), 500
     view["config"] = _dashboard_config()
-    return jsonify(view)
+    return cache_hints(jsonify(view), etag) if etag else jsonify(view)
 
 
 @app.get("/api/dashboard")
 @dashboard_access_required
 def dashboard_data_endpoint():
     dataset_id = request.args.get("datasetId")
+    etag = _dashboard_etag(dataset_id, {"datasetId": dataset_id})
+    matched = etag and matching_etag(request.if_none_match, etag)
+    if matched:
+        return not_modified(matched)
     try:
         view = dashboard_manager.prepare_view(dataset_id, {"datasetId": dataset_id})
     except DashboardError as exc:
@@ -1019,7 +1554,7 @@ def dashboard_data_endpoint():
         app.logger.exception("Erro inesperado ao gerar dashboard (GET)")
         return jsonify({"error": "Erro interno ao gerar o dashboard."}), 500
     view["config"] = _dashboard_config()
-    return jsonify(view)
+    return cache_hints(jsonify(view), etag) if etag else jsonify(view)
 
 
 @app.post("/api/dashboard/export")
@@ -1031,15 +1566,38 @@ def dashboard_export():
     export_format = (payload.get("format") or "csv").lower()
 
     try:
-        buffer, filename, mimetype = dashboard_manager.export(dataset_id, payload, target, export_format)
+        dataset = dashboard_manager.list_or_default(dataset_id)
+    except DashboardError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if export_format not in DASHBOARD_EXPORT_FORMATS:
+        return jsonify({"error": "Formato de exportação inválido."}), 400
+
+    # Alerts depend on the current date (deadlines).
+    key = query_etag(
+        request.path, dataset.id, dataset.created_at, _export_spec(payload), datetime.utcnow().date()
+    )
+
+    def write(path: str) -> Tuple[str, str]:
+        buffer, filename, mimetype = dashboard_manager.export(dataset.id, payload, target, export_format)
+        with open(path, "wb") as handle:
+            handle.write(buffer.getvalue())
+        return filename, mimetype
+
+    if payload.get("background"):
+        return _queue_export(key, write, (DashboardError,))
+
+    cached = export_cache.get(key)
+    if cached is not None:
+        return _send_export(cached)
+
+    try:
+        export = export_cache.put(key, write)
     except DashboardError as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception:
         app.logger.exception("Erro inesperado ao exportar dados do dashboard")
         return jsonify({"error": "Erro interno ao exportar os dados."}), 500
-
-    buffer.seek(0)
-    return send_file(buffer, mimetype=mimetype, as_attachment=True, download_name=filename)
+    return _send_export(export)
 
 
 @app.delete("/api/dashboard/dataset/<dataset_id>")
@@ -1074,10 +1632,10 @@ def export_pivot():
         measures_payload = payload.get("measure")
     measures = _normalize_measures(measures_payload)
     aggregator = payload.get("aggregator", "sum")
-    filters = _normalize_filters(payload.get("filters", {}))
     fmt = (payload.get("format") or "excel").lower()
 
     try:
+        filters = _normalize_filters(payload.get("filters", {}))
         pre_calcs = _normalize_calculations(payload.get("preCalculations"), "preCalculations")
         post_calcs = _normalize_calculations(payload.get("postCalculations"), "postCalculations")
     except ValueError as exc:
@@ -1091,92 +1649,145 @@ def export_pivot():
     except KeyError:
         return jsonify({"error": "Dataset não encontrado ou expirado."}), 404
 
-    if not measures:
+    if not measures and not payload.get("values"):
         return jsonify({"error": "É necessário escolher pelo menos uma medida numérica."}), 400
 
-    filtered_frame = _apply_filters(dataset["frame"], filters)
-    if filtered_frame.empty:
-        return jsonify({"error": "Nenhum dado corresponde aos filtros aplicados."}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "Formato de exportação inválido."}), 400
 
-    try:
-        filtered_frame = apply_pre_calculations(filtered_frame, pre_calcs)
-    except CalculationError as exc:
-        return jsonify({"error": str(exc)}), 400
+    key = query_etag(request.path, dataset_id, dataset["version"], _export_spec(payload), fmt)
 
-    try:
-        pivot = build_pivot(
-            dataset_id=dataset_id,
-            frame=filtered_frame,
+    def execute() -> PivotResult:
+        return _execute_pivot(
+            dataset_id,
+            dataset,
+            payload,
             rows=rows,
             columns=columns,
-            measure=measures,
+            measures=measures,
             aggregator=aggregator,
+            filters=filters,
+            pre_calcs=pre_calcs,
+            post_calcs=post_calcs,
+        )
+
+    if payload.get("background"):
+        return _queue_export(
+            key,
+            lambda path: _write_pivot_export(execute(), fmt, dataset_id, path),
+            (PivotError, CalculationError, FilterError),
         )
-        pivot.calculations["pre"] = copy.deepcopy(pre_calcs)
-        pivot = apply_post_calculations(pivot, post_calcs)
-    except (PivotError, CalculationError) as exc:
+
+    cached = export_cache.get(key)
+    if cached is not None:
+        return _send_export(cached)
+
+    try:
+        pivot = execute()
+    except (PivotError, CalculationError, FilterError) as exc:
         return jsonify({"error": str(exc)}), 400
     except Exception:
         app.logger.exception("Erro inesperado durante a exportação do pivot")
         return jsonify({"error": "Erro interno ao gerar a exportação."}), 500
 
-    df = pivot_result_to_dataframe(pivot)
+    # Repeated exports of the same view are served from the cache, like background ones.
+    if fmt == "csv":
+        filename = f"pivot_{dataset_id}.csv"
+        response = Response(export_cache.tee(key, iter_csv(pivot), filename, "text/csv"), mimetype="text/csv")
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    started = time.perf_counter()
+    export = export_cache.put(key, lambda path: _write_pivot_export(pivot, fmt, dataset_id, path))
+    response = _send_export(export)
+    if fmt == "pdf":
+        response.headers["Server-Timing"] = f"render;dur={(time.perf_counter() - started) * 1000:.1f}"
+    return response
+
+
+def _render_pivot_pdf(pivot: PivotResult, dataset_id: str) -> RenderedPdf:
+    rendered = render_pivot_pdf(pivot)
+    app.logger.info(
+        "PDF do pivot %s gerado em %.2fs (%d linhas, %d colunas, %d páginas)",
+        dataset_id,
+        rendered.seconds,
+        rendered.rows,
+        rendered.columns,
+        rendered.pages,
+    )
+    return rendered
+
 
+def _write_pivot_export(pivot: PivotResult, fmt: str, dataset_id: str, path: str) -> Tuple[str, str]:
+    """Write ``pivot`` to ``path`` as ``fmt``; returns the download name and mimetype."""
     if fmt == "excel":
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Pivot")
-        buffer.seek(0)
-        filename = f"pivot_{dataset_id}.xlsx"
-        return send_file(
-            buffer,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            as_attachment=True,
-            download_name=filename,
-        )
+        write_xlsx(pivot, path)
+        return f"pivot_{dataset_id}.xlsx", XLSX_MIMETYPE
+    if fmt == "csv":
+        with open(path, "wb") as handle:
+            for chunk in iter_csv(pivot):
+                handle.write(chunk)
+        return f"pivot_{dataset_id}.csv", "text/csv"
+    with open(path, "wb") as handle:
+        handle.write(_render_pivot_pdf(pivot, dataset_id).data)
+    return f"pivot_{dataset_id}.pdf", "application/pdf"
 
-    if fmt == "pdf":
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, "Tabela Dinâmica", ln=True)
-        pdf.ln(4)
-        pdf.set_font("Arial", size=9)
-
-        def _to_latin(value):
-            if value is None:
-                return ''
-            return str(value).encode('latin-1', 'ignore').decode('latin-1')
-
-        columns = [_to_latin(col) for col in df.columns]
-        page_width = pdf.w - 2 * pdf.l_margin
-        col_width = page_width / max(len(columns), 1)
-
-        for column in columns:
-            pdf.cell(col_width, 8, column, border=1, align='C')
-        pdf.ln()
-
-        for _, row in df.iterrows():
-            for original_column in df.columns:
-                value = '' if pd.isna(row[original_column]) else _to_latin(row[original_column])
-                pdf.cell(col_width, 8, value, border=1)
-            pdf.ln()
-
-        pdf_output = pdf.output(dest='S')
-        if isinstance(pdf_output, str):
-            pdf_bytes = pdf_output.encode('latin-1', 'ignore')
-        else:
-            pdf_bytes = pdf_output
-        buffer = io.BytesIO(pdf_bytes)
-        buffer.seek(0)
-        filename = f"pivot_{dataset_id}.pdf"
-        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
 
-    return jsonify({"error": "Formato de exportação inválido."}), 400
+def _export_spec(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of an export request that defines the file (not how it is delivered)."""
+    return {key: value for key, value in payload.items() if key != "background"}
+
+
+def _send_export(export: CachedExport):
+    return send_file(export.path, mimetype=export.mimetype, as_attachment=True, download_name=export.filename)
+
+
+def _export_job_payload(job: ExportJob) -> Dict[str, Any]:
+    payload = job.as_dict()
+    payload["statusUrl"] = url_for("export_job_status", job_id=job.id)
+    payload["downloadUrl"] = url_for("export_job_download", job_id=job.id) if job.status == "done" else None
+    return payload
+
+
+def _queue_export(key: str, write: ExportWriter, errors: Tuple[type, ...]):
+    try:
+        job = export_jobs.submit(key, write, errors, owner=session.get("user_id"))
+    except ExportJobError as exc:
+        return jsonify({"error": str(exc)}), 503
+    return jsonify(_export_job_payload(job)), 202
+
+
+def _own_export_job(job_id: str) -> Optional[ExportJob]:
+    """The job ``job_id`` if it was queued by the current user."""
+    try:
+        job = export_jobs.get(job_id)
+    except KeyError:
+        return None
+    return job if job.owner == session.get("user_id") else None
+
 
+@app.get("/api/export/jobs/<job_id>")
+@login_required
+def export_job_status(job_id: str):
+    job = _own_export_job(job_id)
+    if job is None:
+        return jsonify({"error": "Exportação não encontrada ou expirada."}), 404
+    return jsonify(_export_job_payload(job))
 
 
+@app.get("/api/export/jobs/<job_id>/download")
+@login_required
+def export_job_download(job_id: str):
+    job = _own_export_job(job_id)
+    if job is None:
+        return jsonify({"error": "Exportação não encontrada ou expirada."}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error}), 409
+    if job.status != "done":
+        return jsonify({"error": "A exportação ainda está em andamento."}), 409
+    if not os.path.exists(job.export.path):
+        return jsonify({"error": "O arquivo exportado expirou. Gere a exportação novamente."}), 410
+    return _send_export(job.export)
 
 
 @app.get("/api/datasets")
@@ -1189,6 +1800,7 @@ def list_datasets():
 @reports_access_required
 def delete_dataset(dataset_id: str):
     datasets.delete(dataset_id)
+    pivot_handles.discard_dataset(dataset_id)
     return "", 204
 
 
@@ -0,0 +1,359 @@
+"""Execution backends that answer the logical part of a pivot (filter, calculate, group, reduce).
+
+A backend receives a :class:`PivotQuery` over a dataset frame and returns
+cube-shaped group keys with merged ``MeasureState`` objects, so
+``build_pivot`` lays out the table the same way whatever engine ran the
+query. ``pandas`` is the reference engine; ``duckdb`` runs the query as SQL
+over the registered frame, in process and without copying numeric columns.
+The default comes from ``SAIKU_PIVOT_BACKEND`` and a request may pick
+another one with ``"backend"``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import AggregateError, MeasureState, component_keys
+from .filters import apply_filters
+from .parallel import PIVOT_REQUEST_THREADS
+from .pivot import PivotError, apply_pre_calculations
+
+try:  # pragma: no cover - optional dependency
+    import duckdb
+except ImportError:  # pragma: no cover - optional dependency
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+PIVOT_BACKEND = (os.getenv("SAIKU_PIVOT_BACKEND") or "pandas").strip().lower()
+DUCKDB_THREADS = int(os.getenv("SAIKU_DUCKDB_THREADS", str(PIVOT_REQUEST_THREADS)))
+
+States = Tuple[pd.DataFrame, Dict[str, MeasureState]]
+
+
+@dataclass(frozen=True)
+class PivotQuery:
+    """What a pivot asks of the data, independent of the engine that runs it."""
+
+    dimensions: Tuple[str, ...]
+    filters: Dict[str, Any] = field(default_factory=dict)
+    calculations: Tuple[Dict[str, Any], ...] = ()
+    specs: Tuple[Dict[str, Any], ...] = ()
+
+    def components(self) -> Dict[str, List[Tuple[Any, ...]]]:
+        """Components needed per measure (raises ``AggregateError`` for unsupported aggregators)."""
+        wanted: Dict[str, List[Tuple[Any, ...]]] = {}
+        for spec in self.specs:
+            wanted.setdefault(spec["measure"], []).extend(
+                component_keys(spec["meta"], spec["options"])
+            )
+        return {name: list(dict.fromkeys(keys)) for name, keys in wanted.items()}
+
+
+class ExecutionBackend(ABC):
+    """Runs a :class:`PivotQuery` over a frame; ``None`` means "not supported, use pandas"."""
+
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def execute(self, frame: pd.DataFrame, query: PivotQuery) -> Optional[States]:
+        """Group keys and merged states of ``query``, or ``None`` when this engine cannot run it."""
+
+    def source(
+        self, frame: pd.DataFrame, calculations: Sequence[Dict[str, Any]] = ()
+    ) -> "BackendSource":
+        """``StateSource`` for ``build_pivot`` running this backend over ``frame``."""
+        return BackendSource(self, frame, tuple(calculations))
+
+
+class PandasBackend(ExecutionBackend):
+    """Reference implementation on pandas/numpy.
+
+    ``build_pivot`` on a frame already is this engine (plus cubes, threads and
+    partitions), so the app only goes through it explicitly for comparisons.
+    """
+
+    name = "pandas"
+
+    def execute(self, frame: pd.DataFrame, query: PivotQuery) -> Optional[States]:
+        try:
+            wanted = query.components()
+        except AggregateError:
+            return None
+        data = apply_filters(frame, query.filters)
+        if query.calculations:
+            data = apply_pre_calculations(data, list(query.calculations))
+        dimensions = list(query.dimensions)
+        if dimensions:
+            grouper = data.groupby(dimensions, dropna=False, sort=False)
+            codes = grouper.ngroup().to_numpy(dtype=np.int64)
+            keys = grouper.size().index.to_frame(index=False)
+        else:
+            codes = np.zeros(len(data), dtype=np.int64)
+            keys = pd.DataFrame(index=pd.RangeIndex(1 if len(data) else 0))
+        states = {
+            name: MeasureState.build(data[name], codes, len(keys), components)
+            for name, components in wanted.items()
+        }
+        return keys, states
+
+
+_SQL_COMPONENTS = {("sum",), ("count",), ("min",), ("max",)}
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _as_text(column: str, series: pd.Series) -> str:
+    """SQL giving the text pandas' ``astype(str)`` would, so filters match the same rows."""
+    if pd.api.types.is_bool_dtype(series):
+        return f"CASE WHEN {_quote(column)} THEN 'True' ELSE 'False' END"
+    return f"CAST({_quote(column)} AS VARCHAR)"
+
+
+def _as_number(column: str) -> str:
+    value = f"TRY_CAST({_quote(column)} AS DOUBLE)"
+    return f"CASE WHEN isnan({value}) THEN NULL ELSE {value} END"
+
+
+class DuckDBBackend(ExecutionBackend):
+    """Embedded columnar SQL engine scanning the pandas frame in place.
+
+    Only ``sum``/``count``/``min``/``max`` components are computed in SQL
+    (that covers ``avg``); distinct counts and sketches fall back to pandas.
+    Pre calculations are evaluated with pandas on the filtered rows.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, threads: int = DUCKDB_THREADS) -> None:
+        self.threads = max(int(threads), 1)
+        self._database: Any = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return duckdb is not None
+
+    def _cursor(self) -> Any:
+        # One in-memory database per process; each query gets its own cursor, whose
+        # registered views are private to it, so concurrent requests do not collide.
+        if self._database is None:
+            with self._lock:
+                if self._database is None:
+                    database = duckdb.connect(database=":memory:")
+                    database.execute(f"SET threads = {self.threads}")
+                    self._database = database
+        return self._database.cursor()
+
+    def execute(self, frame: pd.DataFrame, query: PivotQuery) -> Optional[States]:
+        if duckdb is None:
+            return None
+        try:
+            wanted = query.components()
+        except AggregateError:
+            return None
+        if any(key not in _SQL_COMPONENTS for keys in wanted.values() for key in keys):
+            return None
+        if query.calculations:
+            # Derived columns are pandas expressions: compute them once, then scan in SQL.
+            frame = apply_pre_calculations(apply_filters(frame, query.filters), list(query.calculations))
+            filters: Dict[str, Any] = {}
+        elif any(isinstance(values, dict) for values in query.filters.values()):
+            # Predicates (ranges, dates, text matching) stay with the pandas engine.
+            return None
+        else:
+            filters = query.filters
+
+        dimensions = list(query.dimensions)
+        selected = [_quote(column) for column in dimensions]
+        aggregates: List[Tuple[str, Tuple[Any, ...]]] = []
+        for name, keys in wanted.items():
+            numeric = _as_number(name)
+            for key in keys:
+                if key[0] == "count":
+                    counted = numeric if pd.api.types.is_numeric_dtype(frame[name]) else _quote(name)
+                    expression = f"COUNT({counted})"
+                else:
+                    expression = f"{key[0].upper()}({numeric})"
+                aggregates.append((name, key))
+                selected.append(f"{expression} AS a{len(aggregates) - 1}")
+
+        conditions: List[str] = []
+        parameters: List[Any] = []
+        for column, values in (filters or {}).items():
+            if column not in frame.columns or not values:
+                continue
+            placeholders = ", ".join("?" for _ in values)
+            conditions.append(f"{_as_text(column, frame[column])} IN ({placeholders})")
+            parameters.extend(str(value) for value in values)
+
+        sql = f"SELECT {', '.join(selected) or 'COUNT(*)'} FROM dataset"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if dimensions:
+            sql += " GROUP BY " + ", ".join(_quote(column) for column in dimensions)
+        else:
+            sql += " HAVING COUNT(*) > 0"
+
+        cursor = self._cursor()
+        try:
+            cursor.register("dataset", frame)
+            result = cursor.execute(sql, parameters).df()
+        finally:
+            cursor.close()
+
+        keys_frame = pd.DataFrame(index=pd.RangeIndex(len(result)))
+        for position, column in enumerate(dimensions):
+            members = result.iloc[:, position]
+            try:
+                keys_frame[column] = members.astype(frame[column].dtype).to_numpy()
+            except (TypeError, ValueError):
+                keys_frame[column] = members.astype(object).where(members.notna(), None).to_numpy()
+        components: Dict[str, Dict[Tuple[Any, ...], np.ndarray]] = {name: {} for name in wanted}
+        for position, (name, key) in enumerate(aggregates):
+            values = pd.to_numeric(result[f"a{position}"], errors="coerce").to_numpy(dtype=float)
+            if key[0] in ("min", "max"):
+                values = np.where(np.isnan(values), np.inf if key[0] == "min" else -np.inf, values)
+            elif key[0] == "sum":
+                values = np.nan_to_num(values, nan=0.0)
+            components[name][key] = values
+        states = {
+            name: MeasureState(len(result), measure_components)
+            for name, measure_components in components.items()
+        }
+        return keys_frame, states
+
+
+@dataclass
+class BackendSource:
+    """Adapts a backend to the ``StateSource`` hook of ``build_pivot``."""
+
+    backend: ExecutionBackend
+    frame: pd.DataFrame
+    calculations: Tuple[Dict[str, Any], ...] = ()
+    seconds: float = 0.0
+
+    def aggregate(
+        self,
+        dimensions: Sequence[str],
+        filters: Dict[str, Any],
+        specs: Sequence[Dict[str, Any]],
+    ) -> Optional[States]:
+        query = PivotQuery(tuple(dimensions), dict(filters or {}), self.calculations, tuple(specs))
+        started = time.perf_counter()
+        result = self.backend.execute(self.frame, query)
+        self.seconds = time.perf_counter() - started
+        return result
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "source": "backend",
+            "backend": self.backend.name,
+            "sourceRows": int(len(self.frame)),
+            "elapsedMs": round(self.seconds * 1000, 3),
+        }
+
+
+BACKENDS: Dict[str, ExecutionBackend] = {
+    backend.name: backend for backend in (PandasBackend(), DuckDBBackend())
+}
+
+
+def available_backends() -> List[str]:
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def resolve_backend(name: Optional[str] = None) -> ExecutionBackend:
+    """Backend asked by a request, or the deployment default (``SAIKU_PIVOT_BACKEND``)."""
+    if name is None or str(name).strip() == "":
+        backend = BACKENDS.get(PIVOT_BACKEND)
+        if backend is None or not backend.available():
+            logger.warning("Backend '%s' indisponível; usando pandas.", PIVOT_BACKEND)
+            return BACKENDS["pandas"]
+        return backend
+    backend = BACKENDS.get(str(name).strip().lower())
+    if backend is None:
+        raise PivotError(
+            f"Backend '{name}' não é suportado. Opções: {', '.join(sorted(BACKENDS))}."
+        )
+    if not backend.available():
+        raise PivotError(f"Backend '{backend.name}' não está instalado neste servidor.")
+    return backend
+
+
+def _benchmark(rows: int, repeat: int) -> None:  # pragma: no cover - manual benchmark
+    from .pivot import build_pivot
+
+    rng = np.random.default_rng(7)
+    frame = pd.DataFrame(
+        {
+            "UGR": rng.choice([f"UGR {i:02d}" for i in range(40)], rows),
+            "Natureza": rng.choice([f"ND {i}" for i in range(25)], rows),
+            "Ano": rng.integers(2018, 2025, rows),
+            "Empenhado": rng.gamma(2.0, 5000.0, rows).round(2),
+            "Pago": rng.gamma(2.0, 4000.0, rows).round(2),
+        }
+    )
+    cases = {
+        "sum 1 dim": dict(rows=["UGR"], columns=[], measure=["Empenhado"], aggregator="sum"),
+        "avg 2x1 dims": dict(rows=["UGR", "Natureza"], columns=["Ano"], measure=["Pago"], aggregator="avg"),
+        "values + filtro": dict(
+            rows=["Natureza"],
+            columns=["Ano"],
+            measure=[],
+            aggregator="sum",
+            values=[
+                {"measure": "Empenhado", "aggregator": "sum"},
+                {"measure": "Pago", "aggregator": "max"},
+                {"measure": "Pago", "aggregator": "count"},
+            ],
+            filters={"Ano": ["2020", "2021", "2022"]},
+        ),
+    }
+    print(f"{rows} linhas, melhor de {repeat} execuções (ms)")
+    for label, case in cases.items():
+        timings: Dict[str, float] = {}
+        reference = None
+        # "frame" is build_pivot's own path, the one the app uses by default.
+        for name in ["frame", *available_backends()]:
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = build_pivot(
+                    dataset_id="bench",
+                    frame=frame,
+                    state_source=BACKENDS[name].source(frame) if name in BACKENDS else None,
+                    **case,
+                )
+                best = min(best, time.perf_counter() - started)
+            timings[name] = best * 1000
+            if reference is None:
+                reference = result
+            elif not np.allclose(
+                np.asarray(result.values, dtype=float),
+                np.asarray(reference.values, dtype=float),
+                equal_nan=True,
+            ):
+                print(f"  aviso: '{name}' diverge de 'frame' em '{label}'")
+        print(f"  {label:<16}" + "".join(f"  {name}={ms:9.1f}" for name, ms in timings.items()))
+
+
+if __name__ == "__main__":  # pragma: no cover - manual benchmark
+    import sys
+
+    _benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+    )
@@ -0,0 +1,424 @@
+"""Stage-by-stage benchmark of the pivot engine on synthetic budget data.
+
+``python -m src.benchmarks run`` generates datasets shaped like budget
+execution sheets (dimensions with configurable cardinality and skew, a share
+of empty cells, any number of measures) and times separately each stage a
+pivot request goes through: filters (scan and bitmap indexes), pre
+calculations, ``build_pivot`` for every aggregator, post calculations,
+``as_dict`` + JSON and ``pivot_result_to_dataframe``. ``--save`` writes the
+timings as a JSON baseline; ``--compare`` (or ``python -m src.benchmarks
+compare``) reports the stages slower than a baseline by more than
+``--threshold`` and exits with status 1 when there is any.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .filters import apply_filters
+from .indexes import BitmapIndex, DimensionIndex
+from .pivot import (
+    AGGREGATIONS_META,
+    apply_post_calculations,
+    apply_pre_calculations,
+    build_pivot,
+    pivot_result_to_dataframe,
+)
+
+BASELINE_FORMAT = 1
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+# Differences below this are noise whatever the ratio.
+MIN_DELTA_MS = 1.0
+
+DEFAULT_CARDINALITY: Dict[str, int] = {
+    "UGR": 40,
+    "Natureza": 25,
+    "PI": 150,
+    "Fonte": 12,
+    "Contrato": 20_000,
+    "Ano": 7,
+    "Mês": 12,
+}
+# Numeric dimensions (the others are text, as read from a spreadsheet).
+_NUMERIC_DIMENSIONS = {"Ano": 2019, "Mês": 1}
+MEASURE_NAMES = ("Planejado", "Empenhado", "Liquidado", "Pago")
+
+PIVOT_ROWS = ["UGR", "Natureza"]
+PIVOT_COLUMNS = ["Ano"]
+
+
+@dataclass
+class BenchmarkConfig:
+    rows: int
+    measures: int = 3
+    null_ratio: float = 0.02
+    cardinality: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_CARDINALITY))
+    seed: int = 7
+
+    def measure_names(self) -> List[str]:
+        names = list(MEASURE_NAMES[: self.measures])
+        names.extend(f"Medida {position + 1}" for position in range(len(names), self.measures))
+        return names
+
+    def key(self) -> str:
+        """Identity of the dataset shape, used to pair runs with baselines."""
+        return json.dumps(
+            {key: value for key, value in asdict(self).items() if key != "seed"},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+
+
+def synthetic_frame(config: BenchmarkConfig) -> pd.DataFrame:
+    """Budget-like rows: skewed dimension members, gamma-distributed measures, ``null_ratio`` empty cells."""
+    rng = np.random.default_rng(config.seed)
+    rows = config.rows
+    data: Dict[str, Any] = {}
+    for name, cardinality in config.cardinality.items():
+        count = max(1, min(int(cardinality), rows))
+        # Zipf-like skew: a few members hold most rows, as UGRs and contracts do.
+        weights = 1.0 / np.arange(1, count + 1) ** 0.8
+        codes = rng.choice(count, rows, p=weights / weights.sum())
+        if name in _NUMERIC_DIMENSIONS:
+            data[name] = codes + _NUMERIC_DIMENSIONS[name]
+            continue
+        width = len(str(count - 1))
+        labels = np.array([f"{name} {member:0{width}d}" for member in range(count)], dtype=object)
+        column = labels[codes]
+        column[rng.random(rows) < config.null_ratio] = None
+        data[name] = column
+    for name in config.measure_names():
+        values = rng.gamma(2.0, 5000.0, rows).round(2)
+        values[rng.random(rows) < config.null_ratio] = np.nan
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def benchmark_filters(frame: pd.DataFrame, config: BenchmarkConfig) -> Dict[str, Any]:
+    """Members of the two largest dimensions, two years and a range on the first measure."""
+    filters: Dict[str, Any] = {}
+    ugr = frame["UGR"].dropna().unique() if "UGR" in frame else []
+    if len(ugr):
+        filters["UGR"] = [str(member) for member in sorted(ugr)[: max(1, len(ugr) // 4)]]
+    if "Ano" in frame:
+        years = sorted(frame["Ano"].dropna().unique())
+        filters["Ano"] = [str(year) for year in years[-2:]]
+    first = config.measure_names()[0]
+    filters[first] = {"gte": float(frame[first].median())}
+    return filters
+
+
+def benchmark_pre_calculations(config: BenchmarkConfig) -> List[Dict[str, Any]]:
+    names = config.measure_names()
+    calculations = [
+        {
+            "resultField": "Dobro",
+            "operation": "multiply",
+            "inputs": [{"type": "column", "field": names[0]}, {"type": "value", "value": 2}],
+        },
+    ]
+    if len(names) > 1:
+        calculations.append(
+            {
+                "resultField": "Saldo",
+                "operation": "expression",
+                "options": {"expression": f"coalesce({{{names[0]}}}, 0) - coalesce({{{names[1]}}}, 0)"},
+            }
+        )
+    return calculations
+
+
+def benchmark_post_calculations(column_keys: Sequence[str]) -> List[Dict[str, Any]]:
+    """A difference of the first two pivot columns and its share of the first (a dependency chain)."""
+    if len(column_keys) < 2:
+        return []
+    first, second = column_keys[0], column_keys[1]
+    return [
+        {
+            "resultKey": "bench::share",
+            "name": "Participação",
+            "operation": "divide",
+            "inputs": [{"type": "column", "columnKey": "bench::diff"}, {"type": "column", "columnKey": first}],
+        },
+        {
+            "resultKey": "bench::diff",
+            "name": "Diferença",
+            "operation": "subtract",
+            "inputs": [{"type": "column", "columnKey": first}, {"type": "column", "columnKey": second}],
+        },
+    ]
+
+
+def _rows_label(rows: int) -> str:
+    return f"{rows:,} linhas".replace(",", ".")
+
+
+class _Timer:
+    def __init__(self, repeat: int, echo: bool) -> None:
+        self.repeat = max(int(repeat), 1)
+        self.echo = echo
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def run(self, stage: str, func: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None) -> Any:
+        """Best and median of ``repeat`` runs of ``func(setup())``; ``setup`` is not timed."""
+        samples = []
+        value = None
+        for _ in range(self.repeat):
+            argument = setup()
+            started = time.perf_counter()
+            value = func(argument)
+            samples.append((time.perf_counter() - started) * 1000)
+        self.stages[stage] = {"best": round(min(samples), 3), "median": round(statistics.median(samples), 3)}
+        if self.echo:
+            print(f"    {stage:<36} {self.stages[stage]['best']:10.1f} ms")
+        return value
+
+
+def run_benchmark(
+    config: BenchmarkConfig,
+    repeat: int = DEFAULT_REPEAT,
+    aggregators: Optional[Sequence[str]] = None,
+    echo: bool = True,
+) -> Dict[str, Any]:
+    """Timings (ms) of every pivot stage on the synthetic dataset of ``config``."""
+    started = time.perf_counter()
+    frame = synthetic_frame(config)
+    if echo:
+        print(f"  {_rows_label(config.rows)} geradas em {time.perf_counter() - started:.1f}s")
+    timer = _Timer(repeat, echo)
+    measures = config.measure_names()
+    filters = benchmark_filters(frame, config)
+
+    timer.run("filters.scan", lambda _: apply_filters(frame, filters))
+    indexes: Dict[str, BitmapIndex] = {}
+
+    def build_indexes(_: Any) -> None:
+        indexes.clear()
+        for column in filters:
+            indexes[column] = BitmapIndex.build(DimensionIndex.build(frame[column]))
+
+    timer.run("filters.index_build", build_indexes)
+    timer.run("filters.indexed", lambda _: apply_filters(frame, filters, indexes.__getitem__))
+
+    pre_calculations = benchmark_pre_calculations(config)
+    prepared = timer.run("pre_calculations", lambda _: apply_pre_calculations(frame, pre_calculations))
+
+    pivot_args = dict(dataset_id="bench", frame=prepared, rows=PIVOT_ROWS, columns=PIVOT_COLUMNS)
+    pivot_args["rows"] = [name for name in PIVOT_ROWS if name in prepared]
+    pivot_args["columns"] = [name for name in PIVOT_COLUMNS if name in prepared]
+    reference = None
+    for aggregator in aggregators or list(AGGREGATIONS_META):
+        result = timer.run(
+            f"build_pivot.{aggregator}",
+            lambda _: build_pivot(measure=[measures[0]], aggregator=aggregator, **pivot_args),
+        )
+        if aggregator == "sum":
+            reference = result
+    timer.run(
+        "build_pivot.values",
+        lambda _: build_pivot(
+            measure=[],
+            aggregator="sum",
+            values=[{"measure": name, "aggregator": "sum"} for name in measures],
+            **pivot_args,
+        ),
+    )
+    if reference is None:
+        reference = build_pivot(measure=[measures[0]], aggregator="sum", **pivot_args)
+
+    post_calculations = benchmark_post_calculations(reference.column_keys)
+    result = timer.run(
+        "post_calculations",
+        lambda copied: apply_post_calculations(copied, post_calculations),
+        setup=lambda: copy.deepcopy(reference),
+    )
+    timer.run("as_dict_json", lambda _: json.dumps(result.as_dict(), ensure_ascii=False, default=str))
+    timer.run("pivot_result_to_dataframe", lambda _: pivot_result_to_dataframe(result))
+
+    return {
+        "config": asdict(config),
+        "key": config.key(),
+        "resultRows": len(result.row_headers),
+        "resultColumns": len(result.column_headers),
+        "stages": timer.stages,
+    }
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def baseline_document(runs: List[Dict[str, Any]], repeat: int) -> Dict[str, Any]:
+    return {
+        "format": BASELINE_FORMAT,
+        "createdAt": datetime.utcnow().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "repeat": repeat,
+        "runs": runs,
+    }
+
+
+def compare_baselines(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+    min_delta_ms: float = MIN_DELTA_MS,
+) -> List[Dict[str, Any]]:
+    """One entry per stage present in both documents (paired by dataset shape), best times compared."""
+    previous = {run["key"]: run for run in baseline.get("runs", [])}
+    report = []
+    for run in current.get("runs", []):
+        base = previous.get(run["key"])
+        if base is None:
+            continue
+        for stage, timing in run["stages"].items():
+            if stage not in base["stages"]:
+                continue
+            before, after = base["stages"][stage]["best"], timing["best"]
+            ratio = after / before if before > 0 else float("inf")
+            status = "ok"
+            if abs(after - before) >= min_delta_ms:
+                if ratio > 1 + threshold:
+                    status = "regression"
+                elif ratio < 1 - threshold:
+                    status = "improvement"
+            report.append(
+                {
+                    "rows": run["config"]["rows"],
+                    "stage": stage,
+                    "baselineMs": before,
+                    "currentMs": after,
+                    "change": ratio - 1,
+                    "status": status,
+                }
+            )
+    return report
+
+
+_STATUS_LABELS = {"ok": "", "regression": "REGRESSÃO", "improvement": "melhora"}
+
+
+def print_report(report: List[Dict[str, Any]], threshold: float) -> int:
+    """Print the comparison; returns the number of regressions."""
+    if not report:
+        print("Nenhuma etapa em comum com a referência (compare execuções com as mesmas bases).")
+        return 0
+    print(f"Comparação com a referência (limite {threshold:.0%}, melhor tempo em ms)")
+    rows = None
+    for entry in report:
+        if entry["rows"] != rows:
+            rows = entry["rows"]
+            print(f"  {_rows_label(rows)}")
+        print(
+            f"    {entry['stage']:<36} {entry['baselineMs']:10.1f} -> {entry['currentMs']:10.1f}"
+            f"  {entry['change']:+7.1%}  {_STATUS_LABELS[entry['status']]}".rstrip()
+        )
+    regressions = sum(1 for entry in report if entry["status"] == "regression")
+    print(f"{regressions} etapa(s) com regressão acima de {threshold:.0%}.")
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as handle:
+        document = json.load(handle)
+    if document.get("format") != BASELINE_FORMAT:
+        raise SystemExit(f"{path}: formato de referência não suportado.")
+    return document
+
+
+def _cardinality(values: Sequence[str]) -> Dict[str, int]:
+    cardinality = dict(DEFAULT_CARDINALITY)
+    for value in values:
+        name, _, count = value.partition("=")
+        if not name or not count.isdigit():
+            raise SystemExit(f"Cardinalidade inválida '{value}' (use Campo=N).")
+        if int(count) == 0:
+            cardinality.pop(name, None)
+        else:
+            cardinality[name] = int(count)
+    return cardinality
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.benchmarks", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="gera as bases sintéticas e mede cada etapa")
+    run.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="linhas de cada base")
+    run.add_argument("--measures", type=int, default=3, help="quantidade de medidas")
+    run.add_argument("--null-ratio", type=float, default=0.02, help="fração de células vazias")
+    run.add_argument(
+        "--cardinality",
+        action="append",
+        default=[],
+        metavar="CAMPO=N",
+        help="membros distintos de uma dimensão (0 remove a dimensão); pode repetir",
+    )
+    run.add_argument("--aggregators", nargs="+", choices=list(AGGREGATIONS_META), help="agregações medidas")
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="execuções por etapa (vale a melhor)")
+    run.add_argument("--seed", type=int, default=7)
+    run.add_argument("--save", metavar="ARQUIVO", help="grava os tempos como referência JSON")
+    run.add_argument("--compare", metavar="ARQUIVO", help="compara com uma referência JSON")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="tolerância (0.10 = 10%%)")
+
+    compare = commands.add_parser("compare", help="compara duas referências JSON")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="tolerância (0.10 = 10%%)")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:  # pragma: no cover - manual benchmark
+    args = _parser().parse_args(argv)
+    if args.command == "compare":
+        report = compare_baselines(_load(args.baseline), _load(args.current), args.threshold)
+        return 1 if print_report(report, args.threshold) else 0
+
+    cardinality = _cardinality(args.cardinality)
+    baseline = _load(args.compare) if args.compare else None
+    print(f"Melhor de {args.repeat} execuções por etapa")
+    runs = []
+    for rows in args.rows:
+        config = BenchmarkConfig(
+            rows=rows,
+            measures=max(args.measures, 1),
+            null_ratio=args.null_ratio,
+            cardinality=dict(cardinality),
+            seed=args.seed,
+        )
+        print(f"{_rows_label(rows)}, {config.measures} medidas")
+        runs.append(run_benchmark(config, args.repeat, args.aggregators))
+    document = baseline_document(runs, args.repeat)
+    if args.save:
+        directory = os.path.dirname(os.path.abspath(args.save))
+        os.makedirs(directory, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as handle:
+            json.dump(document, handle, ensure_ascii=False, indent=2)
+        print(f"Referência gravada em {args.save}")
+    if baseline is not None:
+        return 1 if print_report(compare_baselines(baseline, document, args.threshold), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover - manual benchmark
+    sys.exit(main())
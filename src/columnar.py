@@ -0,0 +1,277 @@
+"""On-disk columnar datasets read in row groups, for pivots over data larger than RAM.
+
+A store is a directory with a ``manifest.json`` and one ``.npy`` file per
+column and row group (``rg00000/c0.npy``...), so a scan reads only the
+columns a query uses, one row group at a time. Parquet files are read the
+same way when ``pyarrow`` is installed.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:  # pragma: no cover - optional dependency
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+COLUMNAR_DIR = os.getenv("SAIKU_COLUMNAR_DIR") or None
+COLUMNAR_ROW_GROUP = int(os.getenv("SAIKU_COLUMNAR_ROW_GROUP", "500000"))
+MANIFEST = "manifest.json"
+
+
+class ColumnarError(ValueError):
+    """Raised when a columnar store is missing, invalid or unsupported."""
+
+
+def _kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    return "text"
+
+
+class ColumnarStore:
+    """Directory of row groups, one ``.npy`` file per column."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        path = os.path.join(directory, MANIFEST)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise ColumnarError(f"Base colunar inválida em '{directory}'.") from exc
+        self.name: str = manifest.get("name") or os.path.basename(os.path.normpath(directory))
+        self.columns: List[Dict[str, str]] = manifest["columns"]
+        self.row_groups: List[int] = manifest["row_groups"]
+        self._positions = {column["name"]: position for position, column in enumerate(self.columns)}
+
+    @classmethod
+    def write(
+        cls, directory: str, chunks: Iterable[pd.DataFrame], name: Optional[str] = None
+    ) -> "ColumnarStore":
+        """Write ``chunks`` (one row group each) and return the opened store.
+
+        A column's kind is settled by the first chunk with a value in it and
+        widened to text when a later chunk disagrees (e.g. a code column that
+        turns alphanumeric); the row groups already written are re-encoded.
+        """
+        os.makedirs(directory, exist_ok=True)
+        columns: List[Dict[str, str]] = []
+        settled: List[bool] = []
+        row_groups: List[int] = []
+        for chunk in chunks:
+            if not columns:
+                columns = [
+                    {
+                        "name": str(column),
+                        "kind": _kind(chunk[column]),
+                        "dtype": str(chunk[column].dtype),
+                    }
+                    for column in chunk.columns
+                ]
+                settled = [False] * len(columns)
+            group_dir = os.path.join(directory, f"rg{len(row_groups):05d}")
+            os.makedirs(group_dir, exist_ok=True)
+            for position, column in enumerate(columns):
+                if column["name"] in chunk.columns:
+                    series = chunk[column["name"]]
+                else:
+                    series = pd.Series([None] * len(chunk), dtype=object)
+                if series.notna().any():
+                    kind = _kind(series)
+                    if not settled[position]:
+                        # Earlier row groups only held empty cells.
+                        settled[position] = True
+                        if kind != column["kind"]:
+                            _reencode(directory, len(row_groups), position, column, kind)
+                    elif kind != column["kind"] and column["kind"] != "text":
+                        _reencode(directory, len(row_groups), position, column, "text")
+                values, mask = _encode(series, column["kind"])
+                if column["kind"] == "number" and values.dtype.kind == "f":
+                    column["dtype"] = "float64"
+                _save(group_dir, position, values, mask)
+            row_groups.append(int(len(chunk)))
+        manifest = {"name": name, "columns": columns, "row_groups": row_groups}
+        with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as handle:
+            json.dump(manifest, handle, ensure_ascii=False)
+        return cls(directory)
+
+    @property
+    def row_count(self) -> int:
+        return int(sum(self.row_groups))
+
+    def schema_frame(self) -> pd.DataFrame:
+        """Zero-row frame with the store's columns and dtypes."""
+        return pd.DataFrame(
+            {column["name"]: pd.Series(dtype=_schema_dtype(column)) for column in self.columns}
+        )
+
+    def iter_chunks(self, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        """Yield one frame per row group holding only ``columns``."""
+        names = list(columns) if columns is not None else [column["name"] for column in self.columns]
+        missing = [name for name in names if name not in self._positions]
+        if missing:
+            raise ColumnarError(f"Coluna '{missing[0]}' não existe na base colunar.")
+        for group in range(len(self.row_groups)):
+            group_dir = os.path.join(self.directory, f"rg{group:05d}")
+            data = {}
+            for name in names:
+                position = self._positions[name]
+                values = np.load(os.path.join(group_dir, f"c{position}.npy"))
+                mask_path = os.path.join(group_dir, f"c{position}.mask.npy")
+                mask = np.load(mask_path) if os.path.exists(mask_path) else None
+                data[name] = _decode(values, mask, self.columns[position]["kind"])
+            yield pd.DataFrame(data, index=pd.RangeIndex(self.row_groups[group]))
+
+
+class ParquetStore:
+    """Parquet file read one row group at a time (requires ``pyarrow``)."""
+
+    def __init__(self, path: str) -> None:
+        if pq is None:
+            raise ColumnarError("Leitura de Parquet requer o pacote 'pyarrow'.")
+        self.directory = path
+        self.name = os.path.basename(path)
+        self._file = pq.ParquetFile(path)
+        schema = self._file.schema_arrow
+        self._empty = schema.empty_table().to_pandas()
+        self.columns = [
+            {
+                "name": str(column),
+                "kind": _kind(self._empty[column]),
+                "dtype": str(self._empty[column].dtype),
+            }
+            for column in self._empty.columns
+        ]
+        metadata = self._file.metadata
+        self.row_groups = [
+            metadata.row_group(group).num_rows for group in range(metadata.num_row_groups)
+        ]
+
+    @property
+    def row_count(self) -> int:
+        return int(sum(self.row_groups))
+
+    def schema_frame(self) -> pd.DataFrame:
+        return self._empty.iloc[0:0]
+
+    def iter_chunks(self, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        names = list(columns) if columns is not None else None
+        for group in range(self._file.num_row_groups):
+            yield self._file.read_row_group(group, columns=names).to_pandas()
+
+
+def _encode(series: pd.Series, kind: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    if kind == "number":
+        return pd.to_numeric(series, errors="coerce").to_numpy(), None
+    if kind == "bool":
+        return series.fillna(False).astype(bool).to_numpy(), None
+    if kind == "datetime":
+        return pd.to_datetime(series, errors="coerce").to_numpy(dtype="datetime64[ns]"), None
+    text = _text(series)
+    missing = text.isna().to_numpy()
+    values = text.astype(str).to_numpy(dtype=str)
+    return values, (missing if missing.any() else None)
+
+
+def _save(group_dir: str, position: int, values: np.ndarray, mask: Optional[np.ndarray]) -> None:
+    np.save(os.path.join(group_dir, f"c{position}.npy"), values)
+    mask_path = os.path.join(group_dir, f"c{position}.mask.npy")
+    if mask is not None:
+        np.save(mask_path, mask)
+    elif os.path.exists(mask_path):
+        os.remove(mask_path)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Cells as the text a CSV reader would have kept (``3`` rather than ``3.0``)."""
+    missing = series.isna().to_numpy()
+    text = series.astype(str).to_numpy(dtype=object)
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=np.float64)
+        integral = ~missing & (np.abs(values) < 2**53) & (values == np.floor(values))
+        text[integral] = values[integral].astype(np.int64).astype(str)
+    text[missing] = None
+    return pd.Series(text, index=series.index, dtype=object)
+
+
+def _reencode(directory: str, groups: int, position: int, column: Dict[str, str], kind: str) -> None:
+    """Rewrite ``column`` in the first ``groups`` row groups with ``kind``."""
+    for group in range(groups):
+        group_dir = os.path.join(directory, f"rg{group:05d}")
+        values = np.load(os.path.join(group_dir, f"c{position}.npy"))
+        mask_path = os.path.join(group_dir, f"c{position}.mask.npy")
+        mask = np.load(mask_path) if os.path.exists(mask_path) else None
+        values, mask = _encode(pd.Series(_decode(values, mask, column["kind"])), kind)
+        _save(group_dir, position, values, mask)
+    column["kind"] = kind
+    # Number columns with empty cells in the earlier row groups read back as float.
+    column["dtype"] = {"text": "object", "datetime": "datetime64[ns]", "bool": "bool", "number": "float64"}[kind]
+
+
+def _decode(values: np.ndarray, mask: Optional[np.ndarray], kind: str) -> Any:
+    if kind != "text":
+        return values
+    decoded = values.astype(object)
+    if mask is not None:
+        decoded[mask] = None
+    return decoded
+
+
+def _schema_dtype(column: Dict[str, str]) -> Any:
+    if column["kind"] == "text":
+        return object
+    if column["kind"] == "datetime":
+        return "datetime64[ns]"
+    return column.get("dtype") or "float64"
+
+
+def open_store(path: str) -> Any:
+    """Open a columnar directory or a Parquet file."""
+    if os.path.isdir(path):
+        return ColumnarStore(path)
+    if path.lower().endswith(".parquet"):
+        return ParquetStore(path)
+    raise ColumnarError(f"'{path}' não é uma base colunar reconhecida.")
+
+
+def discover_stores(root: Optional[str] = COLUMNAR_DIR) -> List[Any]:
+    """Stores found directly under ``root`` (``SAIKU_COLUMNAR_DIR``)."""
+    if not root or not os.path.isdir(root):
+        return []
+    stores = []
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, MANIFEST)):
+            continue
+        try:
+            stores.append(open_store(path))
+        except ColumnarError:
+            continue
+    return stores
+
+
+def convert_csv(
+    source: str, directory: str, chunk_rows: int = COLUMNAR_ROW_GROUP, **read_options: Any
+) -> ColumnarStore:
+    """Convert a (possibly larger than RAM) CSV into a columnar store, one row group per chunk."""
+    chunks = pd.read_csv(source, chunksize=chunk_rows, **read_options)
+    return ColumnarStore.write(directory, chunks, name=os.path.basename(source))
+
+
+if __name__ == "__main__":  # pragma: no cover - manual conversion helper
+    import sys
+
+    if len(sys.argv) != 3:
+        raise SystemExit("uso: python -m src.columnar <arquivo.csv> <diretório de saída>")
+    store = convert_csv(sys.argv[1], sys.argv[2])
+    print(f"{store.row_count} linhas em {len(store.row_groups)} grupos gravadas em {sys.argv[2]}")
@@ -0,0 +1,125 @@
+"""gzip/brotli compression of API responses, negotiated per request through ``Accept-Encoding``.
+
+Responses under ``COMPRESS_MIN_BYTES`` and already compressed formats (xlsx,
+pdf, png) are sent as they are. Bodies from ``COMPRESS_STREAM_BYTES`` on, and
+streamed bodies such as ``send_file`` downloads, are compressed chunk by
+chunk while they are written, so the server never holds a second full copy.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+
+try:  # pragma: no cover - optional dependency
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("SAIKU_COMPRESSION", "1").lower() not in ("0", "false", "no")
+COMPRESS_MIN_BYTES = int(os.getenv("SAIKU_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_STREAM_BYTES = int(os.getenv("SAIKU_COMPRESS_STREAM_BYTES", str(1024 * 1024)))
+COMPRESS_CHUNK_BYTES = 64 * 1024
+GZIP_LEVEL = int(os.getenv("SAIKU_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("SAIKU_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-msgpack",
+    "application/vnd.saiku.pivot+json",
+    "application/vnd.apache.arrow.stream",
+)
+
+
+def choose_encoding(accept_encodings: Any) -> Optional[str]:
+    """``br`` or ``gzip`` (whichever the client ranks higher, brotli on ties), or ``None``."""
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressor(encoding: str) -> Any:
+    if encoding == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compressed chunks of ``chunks``; closes the source when done."""
+    compressor = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.process(chunk) if encoding == "br" else compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish() if encoding == "br" else compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _slices(data: bytes) -> Iterator[bytes]:
+    for start in range(0, len(data), COMPRESS_CHUNK_BYTES):
+        yield data[start : start + COMPRESS_CHUNK_BYTES]
+
+
+def _compressible(response: Any) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if "Content-Encoding" in response.headers or "Content-Range" in response.headers:
+        return False
+    if "no-transform" in (response.headers.get("Cache-Control") or ""):
+        return False
+    mimetype = response.mimetype or ""
+    return any(mimetype.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+def compress_response(response: Any, accept_encodings: Any) -> Any:
+    """Compress a werkzeug ``response`` in place when the client and the payload allow it."""
+    if not COMPRESSION_ENABLED or not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    streamed = response.is_streamed or response.direct_passthrough
+    length = response.content_length
+    if length is not None and length < COMPRESS_MIN_BYTES:
+        return response
+    if streamed:
+        response.response = compress_stream(response.response, encoding)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        if len(data) >= COMPRESS_STREAM_BYTES:
+            response.response = compress_stream(_slices(data), encoding)
+            streamed = True
+        else:
+            response.set_data(compress_bytes(data, encoding))
+    if streamed:
+        response.headers.pop("Content-Length", None)
+        # The compressed chunks are plain bytes, written as produced.
+        response.direct_passthrough = False
+    response.headers["Content-Encoding"] = encoding
+    if response.get_etag()[0]:
+        etag, weak = response.get_etag()
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
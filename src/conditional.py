@@ -0,0 +1,60 @@
+"""Strong ETags for query responses and ``If-None-Match`` handling.
+
+A tag is a digest of everything a response depends on (dataset identity and
+version, the canonical query spec, the negotiated encoding) computed before
+any work, so a matching ``If-None-Match`` is answered with ``304`` without
+recomputing the view. Tags are salted per process: a restart or a deploy
+invalidates every tag handed out before.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Any, Optional, Sequence
+
+from flask import Response
+
+CACHE_MAX_AGE = int(os.getenv("SAIKU_CACHE_MAX_AGE", "0"))
+ETAG_SEED = uuid.uuid4().hex
+# compression.compress_response suffixes the tag of compressed variants.
+_ENCODING_SUFFIXES = ("gzip", "br")
+
+
+def query_etag(*parts: Any) -> str:
+    """Strong tag of ``parts`` (JSON-like values, dict key order ignored)."""
+    canonical = json.dumps(
+        [ETAG_SEED, *parts], sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def matching_etag(if_none_match: Any, etag: str) -> Optional[str]:
+    """The tag of ``If-None-Match`` that names a representation of ``etag``, if any."""
+    if not if_none_match:
+        return None
+    if if_none_match.star_tag:
+        return etag
+    for candidate in (etag, *(f"{etag}-{suffix}" for suffix in _ENCODING_SUFFIXES)):
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def cache_hints(response: Response, etag: str, max_age: int = CACHE_MAX_AGE) -> Response:
+    """Tag ``response`` and let private caches keep it (revalidating unless ``max_age`` > 0)."""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if max_age > 0:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag: str, vary: Sequence[str] = ()) -> Response:
+    response = cache_hints(Response(status=304), etag)
+    for header in vary:
+        response.vary.add(header)
+    return response
@@ -0,0 +1,176 @@
+"""Materialized pre-aggregates ("cubes") and the router that picks one for a pivot."""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import AggregateError, MeasureState, component_keys
+from .filters import apply_filters, filter_columns
+
+logger = logging.getLogger(__name__)
+
+CUBE_COMPONENTS: Tuple[Tuple[str, ...], ...] = (("sum",), ("count",), ("min",), ("max",))
+CUBE_LEARN_AFTER = int(os.getenv("SAIKU_CUBE_LEARN_AFTER", "3"))
+CUBE_MAX_PER_DATASET = int(os.getenv("SAIKU_CUBE_MAX", "8"))
+CUBE_MAX_RATIO = float(os.getenv("SAIKU_CUBE_MAX_RATIO", "0.5"))
+
+
+def configured_dimensions() -> List[Tuple[str, ...]]:
+    """Dimension combinations from ``SAIKU_CUBES`` (JSON list of lists of column names)."""
+    raw = os.getenv("SAIKU_CUBES", "").strip()
+    if not raw:
+        return []
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        logger.warning("SAIKU_CUBES inválido; nenhum cubo configurado será materializado.")
+        return []
+    combos = []
+    for entry in parsed if isinstance(parsed, list) else []:
+        if isinstance(entry, str):
+            entry = [entry]
+        if isinstance(entry, list) and entry:
+            combos.append(tuple(str(column) for column in entry))
+    return combos
+
+
+@dataclass
+class MaterializedCube:
+    """Mergeable states for every measure, grouped by ``dimensions``.
+
+    ``keys`` holds one row per observed combination of dimension members, in
+    the same order as the group codes of ``states``.
+    """
+
+    dimensions: Tuple[str, ...]
+    keys: pd.DataFrame
+    states: Dict[str, MeasureState]
+    source_rows: int
+    origin: str = "configured"
+    hits: int = field(default=0, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @classmethod
+    def build(
+        cls,
+        frame: pd.DataFrame,
+        dimensions: Sequence[str],
+        measures: Iterable[str],
+        origin: str = "configured",
+    ) -> "MaterializedCube":
+        dimensions = tuple(dimensions)
+        grouper = frame.groupby(list(dimensions), dropna=False, sort=True)
+        codes = grouper.ngroup().to_numpy(dtype=np.int64)
+        # Keys are taken from one source row per group rather than the group
+        # index, which turns None into NaN: filters compare members as text
+        # (``apply_filters``), so the cube must hold the same missing values.
+        _, first = np.unique(codes, return_index=True)
+        keys = frame[list(dimensions)].iloc[first].reset_index(drop=True)
+        states = {
+            measure_name: MeasureState.build(frame[measure_name], codes, len(keys), CUBE_COMPONENTS)
+            for measure_name in measures
+        }
+        return cls(dimensions, keys, states, int(len(frame)), origin)
+
+    @property
+    def name(self) -> str:
+        return " × ".join(self.dimensions)
+
+    @property
+    def size(self) -> int:
+        return int(len(self.keys))
+
+    def covers(self, dimensions: Iterable[str], specs: Iterable[Dict[str, Any]]) -> bool:
+        if not set(dimensions) <= set(self.dimensions):
+            return False
+        for spec in specs:
+            state = self.states.get(spec["measure"])
+            if state is None:
+                return False
+            try:
+                needed = component_keys(spec["meta"], spec["options"])
+            except AggregateError:
+                return False
+            if any(key not in state.components for key in needed):
+                return False
+        return True
+
+    def select(
+        self, filters: Dict[str, Any], measures: Iterable[str]
+    ) -> Tuple[pd.DataFrame, Dict[str, MeasureState]]:
+        """Filter the cube members and return them with the matching states."""
+        keys = apply_filters(self.keys, filters)
+        positions = keys.index.to_numpy()
+        states = {measure_name: self.states[measure_name].take(positions) for measure_name in measures}
+        return keys.reset_index(drop=True), states
+
+    def record_hit(self) -> None:
+        # Cubes are shared by the request threads.
+        with self._lock:
+            self.hits += 1
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "source": "cube",
+            "cube": self.name,
+            "dimensions": list(self.dimensions),
+            "origin": self.origin,
+            "groups": self.size,
+            "sourceRows": self.source_rows,
+        }
+
+
+def materialize(
+    frame: pd.DataFrame,
+    dimensions: Sequence[str],
+    measures: Sequence[str],
+    origin: str,
+) -> Optional[MaterializedCube]:
+    """Build a cube unless a dimension is missing or it would not be much smaller than the data."""
+    if not dimensions or any(column not in frame.columns for column in dimensions):
+        return None
+    try:
+        groups = int(frame.groupby(list(dimensions), dropna=False).ngroups)
+    except TypeError:
+        return None
+    if len(frame) and groups > CUBE_MAX_RATIO * len(frame):
+        return None
+    try:
+        return MaterializedCube.build(frame, dimensions, measures, origin)
+    except (AggregateError, TypeError):
+        logger.exception("Falha ao materializar o cubo %s", " × ".join(dimensions))
+        return None
+
+
+def route(
+    cubes: Sequence[MaterializedCube],
+    frame: pd.DataFrame,
+    dimensions: Sequence[str],
+    filters: Dict[str, Any],
+    specs: Sequence[Dict[str, Any]],
+) -> Optional[MaterializedCube]:
+    """Pick the smallest cube covering the pivot dimensions, filters and aggregators."""
+    needed = list(dict.fromkeys([*dimensions, *filter_columns(frame, filters)]))
+    candidates = [cube for cube in cubes if cube.covers(needed, specs)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda cube: cube.size)
+
+
+def routable(specs: Sequence[Dict[str, Any]]) -> bool:
+    """Whether a cube could ever serve these aggregators."""
+    for spec in specs:
+        try:
+            keys = component_keys(spec["meta"], spec["options"])
+        except AggregateError:
+            return False
+        if any(key not in CUBE_COMPONENTS for key in keys):
+            return False
+    return True
@@ -15,7 +15,9 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
-from fpdf import FPDF
+
+from .indexes import BitmapIndex, DimensionIndex, select_rows
+from .pdf_export import render_table_pdf
 
 # Thresholds (configurable via environment variables if needed)
 LIMITE_DIAS_VENCIMENTO = int(os.getenv("LIMITE_DIAS_VENCIMENTO", "60"))
@@ -231,6 +233,7 @@ class DashboardDataset:
     warnings: List[str]
     column_map: Dict[str, str]
     created_at: datetime = field(default_factory=datetime.utcnow)
+    bitmaps: Dict[str, BitmapIndex] = field(default_factory=dict, repr=False)
 
 
 def _detect_month_columns(frame: pd.DataFrame) -> Tuple[List[str], List[MonthInfo], List[str]]:
@@ -329,14 +332,30 @@ def _months_elapsed(month_info: List[MonthInfo]) -> int:
     return len(elapsed) if elapsed else len(month_info)
 
 
-def _apply_filters(frame: pd.DataFrame, filters: Dict[str, List[str]]) -> pd.DataFrame:
-    df = frame.copy()
-    for key in ("ugr", "pi", "descricao", "status", "cnpj"):
-        selected = filters.get(key) or []
-        if selected:
-            normalized_selection = {str(value).lower() for value in selected}
-            df = df[df[key].astype(str).str.lower().isin(normalized_selection)]
-    return df
+FILTER_KEYS = ("ugr", "pi", "descricao", "status", "cnpj")
+
+
+def _build_bitmaps(frame: pd.DataFrame) -> Dict[str, BitmapIndex]:
+    return {
+        key: BitmapIndex.build(DimensionIndex.build(frame[key]))
+        for key in FILTER_KEYS
+        if key in frame.columns
+    }
+
+
+def _apply_filters(
+    frame: pd.DataFrame,
+    filters: Dict[str, List[str]],
+    bitmaps: Optional[Dict[str, BitmapIndex]] = None,
+) -> pd.DataFrame:
+    """Rows matching every filter (case-insensitive), taken from ``frame`` in one step."""
+    selected = {key: filters.get(key) for key in FILTER_KEYS if filters.get(key)}
+    if bitmaps is None:
+        bitmaps = _build_bitmaps(frame[list(selected)])
+    positions = select_rows(bitmaps.__getitem__, selected, case_insensitive=True)
+    if positions is None:
+        return frame
+    return frame.take(positions)
 
 
 def _apply_month_filter(month_info: List[MonthInfo], selected_months: Sequence[str]) -> List[MonthInfo]:
@@ -785,6 +804,7 @@ class DashboardManager:
             filters=filters,
             warnings=warnings,
             column_map=column_map,
+            bitmaps=_build_bitmaps(mapped),
         )
         self._datasets[dataset.id] = dataset
         return dataset
@@ -883,7 +903,7 @@ class DashboardManager:
         chart_mode = _normalize_chart_mode(payload.get("chartMode"))
         scenario = payload.get("scenario") or {}
 
-        filtered_df = _apply_filters(dataset.frame, filters)
+        filtered_df = _apply_filters(dataset.frame, filters, dataset.bitmaps)
         scenario_df, scenario_summary = _apply_scenario(filtered_df, dataset.month_columns, scenario)
 
         month_filters = filters.get("month") or []
@@ -955,7 +975,7 @@ class DashboardManager:
         filters = _parse_filters(payload)
         scenario = payload.get("scenario") or {}
 
-        filtered_df = _apply_filters(dataset.frame, filters)
+        filtered_df = _apply_filters(dataset.frame, filters, dataset.bitmaps)
         scenario_df, _ = _apply_scenario(filtered_df, dataset.month_columns, scenario)
 
         if target == "alerts":
@@ -963,7 +983,7 @@ class DashboardManager:
             df_export = pd.DataFrame(alerts)
             filename_base = "alertas"
         else:
-            rows = _build_table(scenario_df)["rows"]
+            rows = _build_table(scenario_df, dataset.column_map)["rows"]
             df_export = pd.DataFrame(rows)
             filename_base = "tabela_detalhada"
 
@@ -986,27 +1006,12 @@ class DashboardManager:
     def _export_pdf(self, df: pd.DataFrame, title: str, filename: str) -> Tuple[io.BytesIO, str, str]:
         if df.empty:
             df = pd.DataFrame([{"Mensagem": "Nenhum dado disponível."}])
-        pdf = FPDF(orientation="L", unit="mm", format="A4")
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, title.replace("_", " ").title(), ln=True)
-        pdf.ln(4)
-
-        pdf.set_font("Arial", size=10)
-        col_width = (pdf.w - 20) / max(len(df.columns), 1)
-        for column in df.columns:
-            pdf.cell(col_width, 8, str(column), border=1, align="C")
-        pdf.ln()
-
-        pdf.set_font("Arial", size=9)
-        for _, row in df.iterrows():
-            for column in df.columns:
-                text = str(row[column])
-                pdf.cell(col_width, 7, text[:40], border=1)
-            pdf.ln()
-
-        buffer = io.BytesIO(pdf.output(dest="S").encode("latin-1"))
-        return buffer, filename, "application/pdf"
+        rendered = render_table_pdf(
+            [str(column) for column in df.columns],
+            df.itertuples(index=False, name=None),
+            title.replace("_", " ").title(),
+        )
+        return io.BytesIO(rendered.data), filename, "application/pdf"
 
     def _export_png(self, df: pd.DataFrame, title: str, filename: str) -> Tuple[io.BytesIO, str, str]:
         if df.empty:
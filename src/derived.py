@@ -0,0 +1,92 @@
+"""Memoized pre-calculated (derived) columns of a dataset."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+from .pivot import apply_pre_calculations
+
+DERIVED_CACHE_SIZE = int(os.getenv("SAIKU_DERIVED_CACHE", "16"))
+
+CalculationKey = Tuple[str, ...]
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def calculation_key(calculation: Dict[str, Any]) -> str:
+    """Canonical text of one calculation: key order and ``None`` entries do not matter."""
+    canonical = _canonical(calculation)
+    canonical["stage"] = str(canonical.get("stage") or "pre").lower()
+    canonical["operation"] = str(canonical.get("operation") or "add").lower()
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class DerivedColumns:
+    """Frames with pre calculations applied, cached per ordered list of calculations.
+
+    Calculations are row-wise, so they are computed once over the whole
+    dataset and then filtered like any other column. A request whose
+    calculations extend a cached list only computes the new ones. The cache
+    belongs to one dataset version and is dropped with it.
+    """
+
+    def __init__(self, frame: pd.DataFrame, version: int, capacity: int = DERIVED_CACHE_SIZE) -> None:
+        self.frame = frame
+        self.version = version
+        self._capacity = max(int(capacity), 1)
+        self._frames: "OrderedDict[CalculationKey, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def apply(self, calculations: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+        calculations = pre_stage(calc for calc in calculations or [] if isinstance(calc, dict))
+        keys: CalculationKey = tuple(calculation_key(calc) for calc in calculations)
+        if not keys:
+            return self.frame
+        with self._lock:
+            cached = self._frames.get(keys)
+            if cached is not None:
+                self._frames.move_to_end(keys)
+                self.hits += 1
+                return cached
+            start, base = 0, self.frame
+            for size in range(len(keys) - 1, 0, -1):
+                prefix = self._frames.get(keys[:size])
+                if prefix is not None:
+                    start, base = size, prefix
+                    break
+        derived = apply_pre_calculations(base, calculations[start:])
+        with self._lock:
+            self.misses += 1
+            self._frames[keys] = derived
+            self._frames.move_to_end(keys)
+            while len(self._frames) > self._capacity:
+                self._frames.popitem(last=False)
+        return derived
+
+    def describe(self) -> Dict[str, Any]:
+        return {"version": self.version, "cached": len(self), "hits": self.hits, "misses": self.misses}
+
+
+def pre_stage(calculations: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Calculations that run before the pivot (stage ``pre`` or ``both``)."""
+    return [
+        calc
+        for calc in calculations or []
+        if (calc.get("stage") or "pre").lower() in {"pre", "both"}
+    ]
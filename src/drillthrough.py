@@ -0,0 +1,178 @@
+"""Pivot result handles and drill-through from a cell to its source rows."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .indexes import DimensionIndex, path_positions
+
+HANDLE_CACHE_SIZE = int(os.getenv("SAIKU_RESULT_HANDLES", "64"))
+DRILL_DEFAULT_LIMIT = 100
+DRILL_MAX_LIMIT = int(os.getenv("SAIKU_DRILL_MAX_LIMIT", "1000"))
+
+
+class DrillThroughError(ValueError):
+    """Raised when a cell cannot be resolved to source rows."""
+
+
+@dataclass
+class PivotHandle:
+    """What a pivot was computed from, enough to find the rows behind any cell.
+
+    ``frame`` is only set when the pivot ran on derived data (calculated
+    fields): it is the memoized derived frame shared by every query with the
+    same calculations, and ``selection`` holds the positions of the rows that
+    passed the filters. Otherwise cells resolve against the dataset through
+    the registry's member indexes.
+    """
+
+    dataset_id: str
+    rows: List[str]
+    columns: List[str]
+    filters: Dict[str, Any]
+    others_label: Optional[str] = None
+    frame: Optional[pd.DataFrame] = None
+    selection: Optional[np.ndarray] = None
+    created_at: float = field(default_factory=time.time)
+    _indexes: Dict[str, DimensionIndex] = field(default_factory=dict, repr=False)
+
+    def local_index(self, column: str) -> DimensionIndex:
+        if column not in self._indexes:
+            self._indexes[column] = DimensionIndex.build(self.frame[column])
+        return self._indexes[column]
+
+
+class HandleStore:
+    """Bounded LRU of pivot handles."""
+
+    def __init__(self, capacity: int = HANDLE_CACHE_SIZE) -> None:
+        self._capacity = max(int(capacity), 1)
+        self._handles: "OrderedDict[str, PivotHandle]" = OrderedDict()
+        self._tags: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, handle: PivotHandle) -> str:
+        handle_id = uuid.uuid4().hex
+        with self._lock:
+            self._handles[handle_id] = handle
+            while len(self._handles) > self._capacity:
+                evicted, _ = self._handles.popitem(last=False)
+                self._forget(evicted)
+        return handle_id
+
+    def tag(self, etag: str, handle_id: str) -> None:
+        """Remember that the response tagged ``etag`` refers to ``handle_id``."""
+        with self._lock:
+            if handle_id in self._handles:
+                self._tags[etag] = handle_id
+
+    def has_tag(self, etag: str) -> bool:
+        """Whether the handle of a tagged response is still alive (a client may reuse it)."""
+        with self._lock:
+            handle_id = self._tags.get(etag)
+            if handle_id is None or handle_id not in self._handles:
+                self._tags.pop(etag, None)
+                return False
+            self._handles.move_to_end(handle_id)
+            return True
+
+    def _forget(self, handle_id: str) -> None:
+        for etag in [etag for etag, tagged in self._tags.items() if tagged == handle_id]:
+            del self._tags[etag]
+
+    def get(self, handle_id: str) -> PivotHandle:
+        with self._lock:
+            handle = self._handles[handle_id]
+            self._handles.move_to_end(handle_id)
+            return handle
+
+    def discard_dataset(self, dataset_id: str) -> None:
+        with self._lock:
+            for handle_id in [key for key, handle in self._handles.items() if handle.dataset_id == dataset_id]:
+                del self._handles[handle_id]
+                self._forget(handle_id)
+
+
+def _column_members(column_key: Any, columns: Sequence[str]) -> List[Any]:
+    if isinstance(column_key, str):
+        try:
+            column_key = json.loads(column_key)
+        except ValueError:
+            column_key = [column_key]
+    if column_key is None:
+        column_key = []
+    if not isinstance(column_key, list):
+        column_key = [column_key]
+    if not columns:
+        return []
+    if len(column_key) < len(columns):
+        raise DrillThroughError("Chave de coluna inválida para a tabela dinâmica.")
+    # Multi-measure layouts prefix the key with the measure label.
+    return column_key[len(column_key) - len(columns) :]
+
+
+def cell_positions(
+    handle: PivotHandle,
+    frame: pd.DataFrame,
+    index_for: Callable[[str], DimensionIndex],
+    row_key: Any,
+    column_key: Any,
+) -> np.ndarray:
+    """Sorted positions of the rows of ``frame`` aggregated into one pivot cell."""
+    row_members = list(row_key or []) if isinstance(row_key, (list, tuple)) else [row_key]
+    if not handle.rows:
+        row_members = []
+    if len(row_members) > len(handle.rows):
+        raise DrillThroughError("Chave de linha inválida para a tabela dinâmica.")
+    column_members = _column_members(column_key, handle.columns)
+    dimensions = [*handle.rows[: len(row_members)], *handle.columns]
+    members = [*row_members, *column_members]
+    if handle.others_label is not None and handle.others_label in members:
+        raise DrillThroughError(f"Detalhamento indisponível para o agrupamento '{handle.others_label}'.")
+
+    if dimensions:
+        positions = path_positions(index_for, dimensions, members)
+    else:
+        positions = np.arange(len(frame))
+    if handle.selection is not None:
+        positions = np.intersect1d(positions, handle.selection, assume_unique=True)
+    for column, values in handle.filters.items():
+        if values and column in frame.columns and len(positions):
+            positions = index_for(column).restrict(positions, values)
+    return positions
+
+
+def page_rows(
+    frame: pd.DataFrame,
+    positions: np.ndarray,
+    columns: Optional[Sequence[str]],
+    offset: int,
+    limit: int,
+) -> Dict[str, Any]:
+    """One page of source rows, projected on ``columns`` and ready for JSON."""
+    if columns:
+        missing = [column for column in columns if column not in frame.columns]
+        if missing:
+            raise DrillThroughError(f"Colunas não encontradas: {', '.join(missing)}.")
+        projection = list(dict.fromkeys(columns))
+    else:
+        projection = frame.columns.tolist()
+    offset = max(int(offset), 0)
+    limit = min(max(int(limit), 1), DRILL_MAX_LIMIT)
+    page = frame.iloc[positions[offset : offset + limit]][projection]
+    return {
+        "columns": projection,
+        "rows": json.loads(page.to_json(orient="values", date_format="iso")),
+        "total": int(len(positions)),
+        "offset": offset,
+        "limit": limit,
+    }
@@ -0,0 +1,218 @@
+"""Compact encodings of pivot responses, negotiated through the ``Accept`` header.
+
+JSON (the usual ``as_dict`` shape) stays the default. The alternatives carry
+the same fields, but header members are dictionary-encoded (one list of
+distinct members plus integer codes per row) and values and totals travel as
+flat little-endian ``float64`` arrays (``NaN`` for empty cells):
+
+* ``application/vnd.saiku.pivot+json``: JSON with base64 arrays;
+* ``application/x-msgpack``: MessagePack with raw ``bin`` arrays (``msgpack``);
+* ``application/vnd.apache.arrow.stream``: one Arrow IPC record batch with a
+  dictionary column per row level and a ``float64`` column per pivot column;
+  the other fields go in the schema metadata as JSON (``pyarrow``).
+"""
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:  # pragma: no cover - optional dependency
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:  # pragma: no cover - optional dependency
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+JSON_MIMETYPE = "application/json"
+COMPACT_MIMETYPE = "application/vnd.saiku.pivot+json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+FORMAT_VERSION = 1
+
+_TYPED_FIELDS = ("rowHeaders", "columnHeaders", "values", "rowTotals", "columnTotals")
+
+
+class EncodingError(ValueError):
+    """Raised when a pivot cannot be written in the requested encoding."""
+
+
+def pivot_mimetypes() -> List[str]:
+    """Encodings this server can produce, JSON first."""
+    mimetypes = [JSON_MIMETYPE, COMPACT_MIMETYPE]
+    if msgpack is not None:
+        mimetypes.extend([MSGPACK_MIMETYPE, "application/msgpack"])
+    if pa is not None:
+        mimetypes.append(ARROW_MIMETYPE)
+    return mimetypes
+
+
+def negotiate(accept: Any) -> str:
+    """Best pivot encoding for a werkzeug ``MIMEAccept`` (JSON unless another is preferred)."""
+    if not accept or not accept.provided:
+        return JSON_MIMETYPE
+    json_quality = accept.quality(JSON_MIMETYPE)
+    best = accept.best_match(pivot_mimetypes(), default=JSON_MIMETYPE)
+    if best != JSON_MIMETYPE and accept.quality(best) <= json_quality:
+        # "*/*" or an equal preference keeps the compatible default.
+        return JSON_MIMETYPE
+    return "application/x-msgpack" if best == "application/msgpack" else best
+
+
+def _float_array(values: Any, shape: Tuple[int, ...]) -> np.ndarray:
+    try:
+        array = np.array(values if values is not None else [], dtype="<f8")
+    except (TypeError, ValueError) as exc:
+        raise EncodingError("Valores não numéricos não podem ser codificados em formato binário.") from exc
+    if array.size != int(np.prod(shape)):
+        raise EncodingError("Valores da tabela dinâmica com formato irregular.")
+    return array.reshape(-1)
+
+
+def dictionary_encode(headers: Sequence[Sequence[Any]]) -> Tuple[List[Any], np.ndarray, int]:
+    """Distinct members, ``int32`` codes (rows x levels, -1 where a row is shorter) and level count."""
+    levels = max((len(header) for header in headers), default=0)
+    codes = np.full((len(headers), levels), -1, dtype="<i4")
+    dictionary: List[Any] = []
+    lookup: Dict[Tuple[str, Any], int] = {}
+    for row, header in enumerate(headers):
+        for level, member in enumerate(header):
+            key = (type(member).__name__, member)
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(dictionary)
+                dictionary.append(member)
+            codes[row, level] = code
+    return dictionary, codes.reshape(-1), levels
+
+
+def columnar_pivot(response: Dict[str, Any]) -> Dict[str, Any]:
+    """``response`` (``PivotResult.as_dict`` shape) with headers and values as typed arrays."""
+    row_headers = response.get("rowHeaders") or []
+    column_headers = response.get("columnHeaders") or []
+    shape = (len(row_headers), len(column_headers))
+    encoded = {key: value for key, value in response.items() if key not in _TYPED_FIELDS}
+    encoded["format"] = {"name": "saiku-pivot-columnar", "version": FORMAT_VERSION}
+    encoded["shape"] = list(shape)
+    for name, headers in (("rowHeaders", row_headers), ("columnHeaders", column_headers)):
+        dictionary, codes, levels = dictionary_encode(headers)
+        encoded[name] = {"dictionary": dictionary, "levels": levels, "codes": codes}
+    encoded["values"] = _float_array(response.get("values"), shape)
+    for name in ("rowTotals", "columnTotals"):
+        totals = response.get(name) or []
+        encoded[name] = _float_array(totals, (len(totals),))
+    return encoded
+
+
+def _pack_arrays(document: Any, pack: Any) -> Any:
+    if isinstance(document, np.ndarray):
+        return {"dtype": document.dtype.str, "data": pack(document.tobytes())}
+    if isinstance(document, dict):
+        return {key: _pack_arrays(value, pack) for key, value in document.items()}
+    return document
+
+
+def _arrow_stream(response: Dict[str, Any]) -> bytes:
+    encoded = columnar_pivot(response)
+    rows, columns = encoded["shape"]
+    row_headers = encoded.pop("rowHeaders")
+    names = list(response.get("rows") or [])
+    arrays, fields = [], []
+    dictionary = pa.array(
+        [None if member is None else str(member) for member in row_headers["dictionary"]], pa.string()
+    )
+    codes = row_headers["codes"].reshape(rows, row_headers["levels"])
+    for level in range(row_headers["levels"]):
+        indices = codes[:, level]
+        arrays.append(
+            pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32(), mask=indices < 0), dictionary)
+        )
+        fields.append(names[level] if level < len(names) else f"level{level}")
+    values = encoded.pop("values").reshape(rows, columns)
+    for position in range(columns):
+        arrays.append(pa.array(values[:, position], pa.float64()))
+        fields.append(f"c{position}")
+    row_totals = encoded.pop("rowTotals")
+    if len(row_totals) == rows and rows:
+        arrays.append(pa.array(row_totals, pa.float64()))
+        fields.append("rowTotal")
+    encoded["columnTotals"] = encoded["columnTotals"].tolist()
+    encoded["columnHeaders"]["codes"] = encoded["columnHeaders"]["codes"].tolist()
+    metadata = {"saiku.pivot": json.dumps(_jsonable(encoded), ensure_ascii=False, default=str)}
+    table = pa.Table.from_arrays(arrays, names=_unique(fields)).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _jsonable(document: Any) -> Any:
+    if isinstance(document, float) and not np.isfinite(document):
+        return None
+    if isinstance(document, dict):
+        return {key: _jsonable(value) for key, value in document.items()}
+    if isinstance(document, list):
+        return [_jsonable(value) for value in document]
+    return document
+
+
+def _unique(names: Sequence[str]) -> List[str]:
+    seen: Dict[str, int] = {}
+    unique = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        unique.append(name if not count else f"{name}.{count}")
+    return unique
+
+
+def encode_pivot(response: Dict[str, Any], mimetype: str) -> bytes:
+    """Body of a pivot response in ``mimetype`` (one of ``pivot_mimetypes()`` other than JSON)."""
+    if mimetype == COMPACT_MIMETYPE:
+        document = _pack_arrays(columnar_pivot(response), lambda raw: base64.b64encode(raw).decode("ascii"))
+        return json.dumps(
+            _jsonable(document), ensure_ascii=False, separators=(",", ":"), default=str
+        ).encode("utf-8")
+    if mimetype == MSGPACK_MIMETYPE and msgpack is not None:
+        document = _pack_arrays(columnar_pivot(response), bytes)
+        return msgpack.packb(document, default=str, use_bin_type=True)
+    if mimetype == ARROW_MIMETYPE and pa is not None:
+        return _arrow_stream(response)
+    raise EncodingError(f"Formato de resposta '{mimetype}' indisponível.")
+
+
+def decode_pivot(body: bytes, mimetype: str) -> Dict[str, Any]:
+    """Compact JSON or MessagePack body back in the ``as_dict`` shape (for clients and tests)."""
+    if mimetype == COMPACT_MIMETYPE:
+        document = json.loads(body)
+    elif mimetype == MSGPACK_MIMETYPE and msgpack is not None:
+        document = msgpack.unpackb(body, raw=False)
+    else:
+        raise EncodingError(f"Formato de resposta '{mimetype}' indisponível.")
+    rows, columns = document.pop("shape")
+    document.pop("format", None)
+
+    def array(packed: Dict[str, Any]) -> np.ndarray:
+        raw = packed["data"]
+        return np.frombuffer(base64.b64decode(raw) if isinstance(raw, str) else raw, dtype=packed["dtype"])
+
+    def headers(encoded: Dict[str, Any], count: int) -> List[List[Any]]:
+        codes = array(encoded["codes"]).reshape(count, encoded["levels"])
+        dictionary = encoded["dictionary"]
+        return [[dictionary[code] for code in row if code >= 0] for row in codes.tolist()]
+
+    def floats(packed: Dict[str, Any]) -> List[Optional[float]]:
+        return [None if value != value else value for value in array(packed).tolist()]
+
+    document["rowHeaders"] = headers(document["rowHeaders"], rows)
+    document["columnHeaders"] = headers(document["columnHeaders"], columns)
+    values = floats(document["values"])
+    document["values"] = [values[row * columns : (row + 1) * columns] for row in range(rows)]
+    document["rowTotals"] = floats(document["rowTotals"])
+    document["columnTotals"] = floats(document["columnTotals"])
+    return document
@@ -0,0 +1,253 @@
+"""Background export jobs and the on-disk cache of finished exports.
+
+Exports that may outlive a proxy timeout are queued on a small thread pool
+(``SAIKU_EXPORT_WORKERS`` threads, at most ``SAIKU_EXPORT_QUEUE`` jobs waiting
+or running); the client polls the job and downloads the file once it is done.
+Finished files, synchronous exports included, are kept in
+``SAIKU_EXPORT_CACHE_DIR`` under the key of the query that produced them, so
+exporting the same view again is answered from disk without computing it.
+Jobs belong to the user who queued them.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv("SAIKU_EXPORT_WORKERS", "2"))
+EXPORT_QUEUE_LIMIT = int(os.getenv("SAIKU_EXPORT_QUEUE", "16"))
+EXPORT_CACHE_DIR = os.getenv("SAIKU_EXPORT_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "saiku-export-cache"
+)
+EXPORT_CACHE_ENTRIES = int(os.getenv("SAIKU_EXPORT_CACHE_ENTRIES", "64"))
+EXPORT_JOB_TTL = int(os.getenv("SAIKU_EXPORT_JOB_TTL", "3600"))
+
+# Writes the export to the given path and returns its download name and mimetype.
+ExportWriter = Callable[[str], Tuple[str, str]]
+
+
+class ExportJobError(RuntimeError):
+    """Raised when an export cannot be queued."""
+
+
+@dataclass
+class CachedExport:
+    path: str
+    filename: str
+    mimetype: str
+    size: int
+
+
+class ExportCache:
+    """Finished export files keyed by query, evicted least recently used first."""
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, capacity: int = EXPORT_CACHE_ENTRIES) -> None:
+        self.directory = directory
+        self._capacity = max(int(capacity), 1)
+        self._lock = threading.Lock()
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedExport]:
+        meta_path = self._meta_path(key)
+        try:
+            with open(meta_path, encoding="utf-8") as handle:
+                meta = json.load(handle)
+            path = os.path.join(self.directory, meta["file"])
+            size = os.path.getsize(path)
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return CachedExport(path=path, filename=meta["filename"], mimetype=meta["mimetype"], size=size)
+
+    def put(self, key: str, write: ExportWriter) -> CachedExport:
+        """Run ``write`` into a temporary file and publish it under ``key``."""
+        partial = self._partial()
+        try:
+            filename, mimetype = write(partial)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return self._publish(key, partial, filename, mimetype)
+
+    def tee(self, key: str, chunks: Iterable[bytes], filename: str, mimetype: str) -> Iterator[bytes]:
+        """Yield ``chunks`` while copying them to the cache; published only once all were sent."""
+        partial = self._partial()
+        try:
+            with open(partial, "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                    yield chunk
+        except BaseException:
+            # Includes the client closing the download (GeneratorExit).
+            os.remove(partial)
+            raise
+        self._publish(key, partial, filename, mimetype)
+
+    def _partial(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        handle, partial = tempfile.mkstemp(prefix=".partial-", dir=self.directory)
+        os.close(handle)
+        return partial
+
+    def _publish(self, key: str, partial: str, filename: str, mimetype: str) -> CachedExport:
+        name = key + os.path.splitext(filename)[1]
+        path = os.path.join(self.directory, name)
+        try:
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        meta = {"file": name, "filename": filename, "mimetype": mimetype}
+        with self._lock:
+            # The metadata is written last: an entry is visible only once complete.
+            with open(self._meta_path(key) + ".partial", "w", encoding="utf-8") as handle:
+                json.dump(meta, handle, ensure_ascii=False)
+            os.replace(self._meta_path(key) + ".partial", self._meta_path(key))
+            self._evict()
+        return CachedExport(path=path, filename=filename, mimetype=mimetype, size=os.path.getsize(path))
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                meta_path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(meta_path), meta_path))
+                except OSError:
+                    continue
+        entries.sort()
+        for _, meta_path in entries[: max(len(entries) - self._capacity, 0)]:
+            try:
+                with open(meta_path, encoding="utf-8") as handle:
+                    name = json.load(handle).get("file")
+                os.remove(meta_path)
+                if name:
+                    os.remove(os.path.join(self.directory, name))
+            except (OSError, ValueError):
+                continue
+
+
+@dataclass
+class ExportJob:
+    id: str
+    key: str
+    owner: Optional[int] = None
+    status: str = "queued"  # queued, running, done, failed
+    error: Optional[str] = None
+    export: Optional[CachedExport] = None
+    cached: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def as_dict(self) -> Dict[str, Any]:
+        seconds = None
+        if self.started_at is not None and self.finished_at is not None:
+            seconds = round(self.finished_at - self.started_at, 3)
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "error": self.error,
+            "cached": self.cached,
+            "filename": self.export.filename if self.export else None,
+            "size": self.export.size if self.export else None,
+            "seconds": seconds,
+        }
+
+
+class ExportJobs:
+    """Bounded queue of export jobs run on a dedicated thread pool."""
+
+    def __init__(
+        self,
+        cache: ExportCache,
+        workers: int = EXPORT_WORKERS,
+        limit: int = EXPORT_QUEUE_LIMIT,
+        ttl: int = EXPORT_JOB_TTL,
+    ) -> None:
+        self.cache = cache
+        self._workers = max(int(workers), 1)
+        self._limit = max(int(limit), 1)
+        self._ttl = ttl
+        self._jobs: Dict[str, ExportJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="saiku-export")
+        return self._executor
+
+    def submit(
+        self,
+        key: str,
+        write: ExportWriter,
+        errors: Tuple[Type[BaseException], ...] = (),
+        owner: Optional[int] = None,
+    ) -> ExportJob:
+        """Queue ``write`` for ``key``, reusing a cached file or an identical job of ``owner`` in flight.
+
+        Messages of ``errors`` raised by ``write`` are reported to the client;
+        anything else is logged and reported as an internal error.
+        """
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.key == key and job.owner == owner and job.active:
+                    return job
+            cached = self.cache.get(key)
+            job = ExportJob(id=uuid.uuid4().hex, key=key, owner=owner)
+            if cached is not None:
+                job.status, job.export, job.cached = "done", cached, True
+                job.started_at = job.finished_at = job.created_at
+                self._jobs[job.id] = job
+                return job
+            if sum(1 for job in self._jobs.values() if job.active) >= self._limit:
+                raise ExportJobError("Muitas exportações em andamento. Tente novamente em instantes.")
+            self._jobs[job.id] = job
+            self._pool().submit(self._run, job, write, errors)
+        return job
+
+    def _run(self, job: ExportJob, write: ExportWriter, errors: Tuple[Type[BaseException], ...]) -> None:
+        job.started_at = time.time()
+        job.status = "running"
+        try:
+            job.export = self.cache.put(job.key, write)
+            job.status = "done"
+        except errors as exc:
+            job.error, job.status = str(exc), "failed"
+        except Exception:
+            logger.exception("Erro inesperado na exportação em segundo plano %s", job.id)
+            job.error, job.status = "Erro interno ao gerar a exportação.", "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> ExportJob:
+        with self._lock:
+            return self._jobs[job_id]
+
+    def _prune(self) -> None:
+        limit = time.time() - self._ttl
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if not job.active and (job.finished_at or job.created_at) < limit
+        ]:
+            del self._jobs[job_id]
@@ -0,0 +1,439 @@
+"""Safe, compiled evaluation of calculated-field expressions.
+
+Expressions reference columns as ``{coluna}`` placeholders. The text is
+parsed once into a Python AST, checked against an allow-list of nodes and a
+static cost budget, and compiled into a tree of numpy closures. Parsing is
+cached by text, compiled plans by (text, column binding).
+
+Besides arithmetic and comparisons, expressions may call the whole-column
+kernels in ``FUNCTIONS`` (``if``, ``coalesce``, ``abs``, ``round``,
+``min``/``max``, ``clip``, date parts and ``contains``/``startswith``).
+"""
+from __future__ import annotations
+
+import ast
+import math
+import os
+import re
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache, reduce
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+EXPRESSION_MAX_LENGTH = int(os.getenv("SAIKU_EXPRESSION_MAX_LENGTH", "2000"))
+EXPRESSION_MAX_NODES = int(os.getenv("SAIKU_EXPRESSION_MAX_NODES", "256"))
+EXPRESSION_MAX_DEPTH = int(os.getenv("SAIKU_EXPRESSION_MAX_DEPTH", "32"))
+EXPRESSION_MAX_EXPONENT = float(os.getenv("SAIKU_EXPRESSION_MAX_EXPONENT", "64"))
+# Upper bound for (vectorized operations x rows) per evaluation.
+EXPRESSION_MAX_COST = float(os.getenv("SAIKU_EXPRESSION_MAX_COST", "2e9"))
+
+PLACEHOLDER = re.compile(r"\{([^{}]+)\}")
+_VARIABLE = re.compile(r"^__v(\d+)$")
+_STRING_LITERAL = re.compile(r"('[^']*'|\"[^\"]*\")")
+_KEYWORD_CALL = re.compile(r"\bif(\s*\()")
+_FUNCTION_ALIASES = {"__if": "if"}
+_DAY_FIRST = re.compile(r"^\d{1,2}/\d{1,2}/\d{2,4}")
+
+Plan = Callable[[Sequence[np.ndarray]], Any]
+
+
+class ExpressionError(ValueError):
+    """Raised when an expression is invalid or exceeds the cost limits."""
+
+
+_BINARY: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power,
+}
+_UNARY: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+    ast.Not: np.logical_not,
+}
+_COMPARE: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+_BOOL: Dict[type, Callable[[Any, Any], Any]] = {ast.And: np.logical_and, ast.Or: np.logical_or}
+
+_STRUCTURAL = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.BoolOp,
+    ast.Compare,
+    ast.IfExp,
+    ast.Call,
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    *_BINARY,
+    *_UNARY,
+    *_COMPARE,
+    *_BOOL,
+)
+
+
+@dataclass(frozen=True)
+class ParsedExpression:
+    text: str
+    tokens: Tuple[str, ...]
+    tree: ast.Expression
+    nodes: int
+
+
+@dataclass(frozen=True)
+class CompiledExpression:
+    """Vectorized plan over the distinct inputs of a binding.
+
+    ``columns`` lists the distinct ``(column, kind)`` inputs in the order
+    ``evaluate`` expects their arrays (see ``column_values``); ``constant`` is
+    set when the whole expression folds.
+    """
+
+    text: str
+    columns: Tuple[Tuple[Hashable, str], ...]
+    plan: Plan
+    constant: Optional[Any]
+    operations: int
+
+    def evaluate(self, arrays: Sequence[np.ndarray]) -> Any:
+        if self.constant is not None:
+            return self.constant
+        rows = max((len(array) for array in arrays), default=1)
+        if self.operations * rows > EXPRESSION_MAX_COST:
+            raise ExpressionError("Expressão excede o limite de custo para o volume de dados.")
+        with np.errstate(all="ignore"):
+            return self.plan(arrays)
+
+
+def _rename_keyword_calls(source: str) -> str:
+    """``if`` is a Python keyword; rename ``if(...)`` calls outside string literals."""
+    parts = _STRING_LITERAL.split(source)
+    return "".join(
+        part if position % 2 else _KEYWORD_CALL.sub(r"__if\1", part)
+        for position, part in enumerate(parts)
+    )
+
+
+def _depth(node: ast.AST) -> int:
+    children = list(ast.iter_child_nodes(node))
+    return 1 + max((_depth(child) for child in children), default=0)
+
+
+@lru_cache(maxsize=512)
+def parse_expression(text: str) -> ParsedExpression:
+    """Replace placeholders, parse and validate ``text`` (cached)."""
+    expr = (text or "").strip()
+    if not expr:
+        raise ExpressionError("Expressão personalizada não foi informada.")
+    if len(expr) > EXPRESSION_MAX_LENGTH:
+        raise ExpressionError("Expressão personalizada muito longa.")
+
+    tokens: List[str] = []
+
+    def replace(match: re.Match[str]) -> str:
+        token = match.group(1).strip()
+        if not token:
+            raise ExpressionError("A expressão contém identificadores vazios.")
+        if token not in tokens:
+            tokens.append(token)
+        return f"__v{tokens.index(token)}"
+
+    source = _rename_keyword_calls(PLACEHOLDER.sub(replace, expr))
+    try:
+        tree = ast.parse(source, mode="eval")
+    except (SyntaxError, RecursionError, MemoryError) as exc:
+        raise ExpressionError("Expressão personalizada inválida.") from exc
+
+    nodes = 0
+    function_names = set()
+    for node in ast.walk(tree):
+        nodes += 1
+        if not isinstance(node, _STRUCTURAL):
+            raise ExpressionError(
+                f"Construção não permitida na expressão: {type(node).__name__}."
+            )
+        if isinstance(node, ast.Call):
+            name = node.func.id if isinstance(node.func, ast.Name) else None
+            if _FUNCTION_ALIASES.get(name, name) not in FUNCTIONS or node.keywords:
+                raise ExpressionError(f"Função '{name or '?'}' não é suportada.")
+            if any(isinstance(arg, ast.Starred) for arg in node.args):
+                raise ExpressionError("Argumentos variáveis não são permitidos.")
+            function_names.add(id(node.func))
+        if isinstance(node, ast.Name) and id(node) not in function_names and not _VARIABLE.match(node.id):
+            raise ExpressionError(
+                f"Identificador '{node.id}' não permitido; use {{coluna}} para referenciar campos."
+            )
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool, str)):
+            raise ExpressionError("Somente constantes numéricas ou texto são permitidos na expressão.")
+    if nodes > EXPRESSION_MAX_NODES:
+        raise ExpressionError("Expressão personalizada excede o número máximo de operações.")
+    if _depth(tree) > EXPRESSION_MAX_DEPTH:
+        raise ExpressionError("Expressão personalizada excede a profundidade máxima.")
+    return ParsedExpression(expr, tuple(tokens), tree, nodes)
+
+
+def _truthy(values: Any) -> Any:
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), False, values != 0)
+    if values.dtype.kind == "b":
+        return values
+    return pd.notna(values) & values.astype(bool)
+
+
+def _isnull(values: Any) -> Any:
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+    if values.dtype.kind == "M":
+        return np.isnat(values)
+    return pd.isna(values)
+
+
+def _if(condition: Any, when_true: Any, when_false: Any) -> Any:
+    return np.where(_truthy(condition), when_true, when_false)
+
+
+def _coalesce(*values: Any) -> Any:
+    result = values[0]
+    for value in values[1:]:
+        result = np.where(_isnull(result), value, result)
+    return result
+
+
+def _round(values: Any, digits: Any = 0) -> Any:
+    return np.round(values, int(digits))
+
+
+def _date_part(attribute: str) -> Callable[[Any], Any]:
+    def kernel(values: Any) -> Any:
+        index = pd.DatetimeIndex(np.asarray(values, dtype="datetime64[ns]"))
+        return np.asarray(getattr(index, attribute), dtype=float)
+
+    return kernel
+
+
+def _text_predicate(method: str) -> Callable[[Any, Any], Any]:
+    def kernel(values: Any, pattern: Any) -> Any:
+        accessor = pd.Series(np.asarray(values, dtype=object)).str
+        if method == "contains":
+            return accessor.contains(str(pattern), regex=False, na=False).to_numpy(dtype=bool)
+        return getattr(accessor, method)(str(pattern), na=False).to_numpy(dtype=bool)
+
+    return kernel
+
+
+@dataclass(frozen=True)
+class ExpressionFunction:
+    """A whole-column kernel and the kind expected for each argument.
+
+    Kinds: ``number``/``text``/``date`` (columns are converted accordingly),
+    ``any`` (numbers unless a sibling argument is a text constant),
+    ``integer`` and ``pattern`` (constant number / text). The last kind
+    repeats for variadic functions (``max_args=None``).
+    """
+
+    kernel: Callable[..., Any]
+    arg_kinds: Tuple[str, ...]
+    min_args: int
+    max_args: Optional[int]
+
+
+FUNCTIONS: Dict[str, ExpressionFunction] = {
+    "if": ExpressionFunction(_if, ("number", "any", "any"), 3, 3),
+    "coalesce": ExpressionFunction(_coalesce, ("any",), 1, None),
+    "abs": ExpressionFunction(np.abs, ("number",), 1, 1),
+    "round": ExpressionFunction(_round, ("number", "integer"), 1, 2),
+    "min": ExpressionFunction(lambda *values: reduce(np.fmin, values), ("number",), 1, None),
+    "max": ExpressionFunction(lambda *values: reduce(np.fmax, values), ("number",), 1, None),
+    "clip": ExpressionFunction(np.clip, ("number", "number", "number"), 3, 3),
+    "year": ExpressionFunction(_date_part("year"), ("date",), 1, 1),
+    "quarter": ExpressionFunction(_date_part("quarter"), ("date",), 1, 1),
+    "month": ExpressionFunction(_date_part("month"), ("date",), 1, 1),
+    "day": ExpressionFunction(_date_part("day"), ("date",), 1, 1),
+    "weekday": ExpressionFunction(_date_part("dayofweek"), ("date",), 1, 1),
+    "contains": ExpressionFunction(_text_predicate("contains"), ("text", "pattern"), 2, 2),
+    "startswith": ExpressionFunction(_text_predicate("startswith"), ("text", "pattern"), 2, 2),
+}
+
+Compiled = Tuple[Optional[Plan], Any]
+
+
+def _is_text(node: ast.AST) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+
+class _Compiler:
+    """Turn a validated AST into ``(plan, constant)`` pairs, folding constants.
+
+    Columns are requested with the kind their context needs, so the same
+    placeholder can feed a number and a text input at once.
+    """
+
+    def __init__(self, binding: Sequence[Hashable]) -> None:
+        self.binding = binding
+        self.inputs: List[Tuple[Hashable, str]] = []
+        self.operations = 0
+
+    def compile(self, node: ast.AST, kind: str = "number") -> Compiled:
+        if isinstance(node, ast.Name):
+            return self._name(node, kind)
+        method = getattr(self, f"_{type(node).__name__}")
+        return method(node)
+
+    def _name(self, node: ast.Name, kind: str) -> Compiled:
+        column = self.binding[int(_VARIABLE.match(node.id).group(1))]
+        key = (column, "number" if kind == "any" else kind)
+        if key not in self.inputs:
+            self.inputs.append(key)
+        slot = self.inputs.index(key)
+        return (lambda arrays: arrays[slot]), None
+
+    def _Expression(self, node: ast.Expression) -> Compiled:
+        return self.compile(node.body)
+
+    def _Constant(self, node: ast.Constant) -> Compiled:
+        if isinstance(node.value, bool):
+            return None, np.bool_(node.value)
+        if isinstance(node.value, str):
+            return None, node.value
+        try:
+            return None, np.float64(node.value)
+        except OverflowError as exc:
+            raise ExpressionError("Constante numérica fora do limite permitido.") from exc
+
+    def _apply(self, func: Callable[..., Any], operands: List[Compiled]) -> Compiled:
+        if all(plan is None for plan, _ in operands):
+            with np.errstate(all="ignore"):
+                return None, func(*[constant for _, constant in operands])
+        self.operations += 1
+        getters = [
+            plan if plan is not None else (lambda arrays, value=constant: value)
+            for plan, constant in operands
+        ]
+        if len(getters) == 1:
+            (only,) = getters
+            return (lambda arrays: func(only(arrays))), None
+        if len(getters) == 2:
+            left, right = getters
+            return (lambda arrays: func(left(arrays), right(arrays))), None
+        return (lambda arrays: func(*[getter(arrays) for getter in getters])), None
+
+    def _BinOp(self, node: ast.BinOp) -> Compiled:
+        if _is_text(node.left) or _is_text(node.right):
+            raise ExpressionError("Operações aritméticas não são permitidas com texto.")
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        if isinstance(node.op, ast.Pow):
+            exponent = right[1]
+            if right[0] is None and (
+                not np.isfinite(exponent) or abs(float(exponent)) > EXPRESSION_MAX_EXPONENT
+            ):
+                raise ExpressionError("Expoente fora do limite permitido na expressão.")
+        return self._apply(_BINARY[type(node.op)], [left, right])
+
+    def _UnaryOp(self, node: ast.UnaryOp) -> Compiled:
+        if _is_text(node.operand):
+            raise ExpressionError("Operações aritméticas não são permitidas com texto.")
+        return self._apply(_UNARY[type(node.op)], [self.compile(node.operand)])
+
+    def _BoolOp(self, node: ast.BoolOp) -> Compiled:
+        func = _BOOL[type(node.op)]
+        result = self.compile(node.values[0])
+        for value in node.values[1:]:
+            result = self._apply(func, [result, self.compile(value)])
+        return result
+
+    def _Compare(self, node: ast.Compare) -> Compiled:
+        items = [node.left, *node.comparators]
+        text = any(_is_text(item) for item in items)
+        if text and any(not isinstance(op, (ast.Eq, ast.NotEq)) for op in node.ops):
+            raise ExpressionError("Comparações com texto aceitam apenas == e !=.")
+        operands = [self.compile(item, "text" if text else "number") for item in items]
+        result = None
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            step = self._apply(_COMPARE[type(op)], [left, right])
+            result = step if result is None else self._apply(np.logical_and, [result, step])
+        return result
+
+    def _IfExp(self, node: ast.IfExp) -> Compiled:
+        kind = "text" if _is_text(node.body) or _is_text(node.orelse) else "number"
+        return self._apply(
+            _if,
+            [self.compile(node.test), self.compile(node.body, kind), self.compile(node.orelse, kind)],
+        )
+
+    def _Call(self, node: ast.Call) -> Compiled:
+        name = _FUNCTION_ALIASES.get(node.func.id, node.func.id)
+        function = FUNCTIONS[name]
+        count = len(node.args)
+        if count < function.min_args or (function.max_args is not None and count > function.max_args):
+            raise ExpressionError(f"Número de argumentos inválido para a função '{name}'.")
+        kinds = [
+            function.arg_kinds[min(position, len(function.arg_kinds) - 1)] for position in range(count)
+        ]
+        any_text = any(_is_text(arg) for arg, kind in zip(node.args, kinds) if kind == "any")
+        operands: List[Compiled] = []
+        for arg, kind in zip(node.args, kinds):
+            if kind == "pattern":
+                if not _is_text(arg):
+                    raise ExpressionError(f"A função '{name}' espera um texto constante.")
+                operands.append((None, arg.value))
+                continue
+            if _is_text(arg) and kind not in ("any", "text"):
+                raise ExpressionError(f"Argumento de texto inválido para a função '{name}'.")
+            compiled = self.compile(arg, "text" if kind == "any" and any_text else kind)
+            if kind == "integer" and compiled[0] is not None:
+                raise ExpressionError(f"A função '{name}' espera um número constante.")
+            operands.append(compiled)
+        return self._apply(function.kernel, operands)
+
+
+@lru_cache(maxsize=512)
+def compile_expression(text: str, binding: Tuple[Hashable, ...]) -> CompiledExpression:
+    """Compile ``text`` with its placeholders bound to ``binding`` (one entry per token).
+
+    ``CompiledExpression.columns`` lists ``(column, kind)`` inputs; a column
+    used twice in the same role shares one input array.
+    """
+    parsed = parse_expression(text)
+    if len(binding) != len(parsed.tokens):
+        raise ExpressionError("Vínculo de colunas incompatível com a expressão.")
+    compiler = _Compiler(binding)
+    plan, constant = compiler.compile(parsed.tree)
+    if plan is None and constant is not None and isinstance(constant, np.floating):
+        if math.isinf(float(constant)):
+            constant = np.float64(np.nan)
+    return CompiledExpression(parsed.text, tuple(compiler.inputs), plan, constant, compiler.operations)
+
+
+def column_values(series: pd.Series, kind: str) -> np.ndarray:
+    """Convert a column into the array kind an expression input expects."""
+    if kind == "text":
+        values = series.astype(str).to_numpy(dtype=object)
+        values[series.isna().to_numpy()] = None
+        return values
+    if kind == "date":
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series.to_numpy(dtype="datetime64[ns]")
+        sample = series.dropna().astype(str).head(1)
+        dayfirst = bool(len(sample) and _DAY_FIRST.match(sample.iloc[0]))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed = pd.to_datetime(series, errors="coerce", dayfirst=dayfirst)
+        return parsed.to_numpy(dtype="datetime64[ns]")
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
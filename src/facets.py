@@ -0,0 +1,136 @@
+"""Faceted filter values: members with row counts under the current filters, searchable and paged."""
+from __future__ import annotations
+
+import os
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+FACET_PAGE_SIZE = int(os.getenv("SAIKU_FACET_PAGE_SIZE", "100"))
+FACET_MAX_PAGE = int(os.getenv("SAIKU_FACET_MAX_PAGE", "1000"))
+SEARCH_MODES = ("contains", "prefix")
+FACET_ORDERS = ("value", "count")
+
+
+class FacetError(ValueError):
+    """Raised when a facet request is invalid."""
+
+
+def fold(text: str) -> str:
+    """Lower-case text without accents, so "Vigência" is found by "vigencia"."""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+class MemberSearch:
+    """Search index over the member texts of one column.
+
+    Sorted folded texts answer prefix queries with two binary searches and a
+    trigram -> members posting list narrows substring queries to a few
+    candidates, so a search never scans every member. ``rank`` orders the
+    members by their text for display.
+    """
+
+    def __init__(self, texts: Sequence[str]) -> None:
+        self.texts = np.asarray(texts, dtype=object)
+        self.folded = np.array([fold(text) for text in self.texts], dtype=object)
+        self._order = np.argsort(self.folded, kind="stable")
+        self._sorted = self.folded[self._order]
+        self.rank = np.empty(len(self.texts), dtype=np.int64)
+        self.rank[np.argsort(self.texts, kind="stable")] = np.arange(len(self.texts))
+        self._trigrams: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def prefix(self, query: str) -> np.ndarray:
+        query = fold(query)
+        start = np.searchsorted(self._sorted, query, side="left")
+        stop = np.searchsorted(self._sorted, query + "\U0010ffff", side="left")
+        return np.sort(self._order[start:stop])
+
+    def contains(self, query: str) -> np.ndarray:
+        query = fold(query)
+        if len(query) < 3:
+            candidates = np.arange(len(self.texts))
+        else:
+            postings = self._trigram_index()
+            grams = {query[start : start + 3] for start in range(len(query) - 2)}
+            lists = sorted((postings.get(gram, np.empty(0, np.int64)) for gram in grams), key=len)
+            candidates = lists[0]
+            for codes in lists[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, codes, assume_unique=True)
+        matches = [code for code in candidates if query in self.folded[code]]
+        return np.asarray(matches, dtype=np.int64)
+
+    def search(self, query: Optional[str], mode: str = "contains") -> Optional[np.ndarray]:
+        """Codes of the members matching ``query`` (``None`` when there is nothing to search)."""
+        if not query:
+            return None
+        if mode not in SEARCH_MODES:
+            raise FacetError(f"Modo de busca '{mode}' inválido. Opções: {', '.join(SEARCH_MODES)}.")
+        return self.prefix(query) if mode == "prefix" else self.contains(query)
+
+    def _trigram_index(self) -> Dict[str, np.ndarray]:
+        if self._trigrams is None:
+            postings: Dict[str, List[int]] = {}
+            for code, text in enumerate(self.folded):
+                for gram in {text[start : start + 3] for start in range(len(text) - 2)}:
+                    postings.setdefault(gram, []).append(code)
+            self._trigrams = {gram: np.asarray(codes, dtype=np.int64) for gram, codes in postings.items()}
+        return self._trigrams
+
+
+def _page_bounds(offset: Any, limit: Any) -> tuple:
+    try:
+        offset = max(int(offset or 0), 0)
+        limit = int(limit) if limit is not None else FACET_PAGE_SIZE
+    except (TypeError, ValueError) as exc:
+        raise FacetError("offset e limit devem ser números inteiros.") from exc
+    return offset, min(max(limit, 1), FACET_MAX_PAGE)
+
+
+def facet_page(
+    search: MemberSearch,
+    counts: np.ndarray,
+    valid: Optional[np.ndarray] = None,
+    query: Optional[str] = None,
+    mode: str = "contains",
+    order: str = "value",
+    offset: Any = 0,
+    limit: Any = None,
+    include_empty: bool = False,
+) -> Dict[str, Any]:
+    """One page of members (text and row count) of a column.
+
+    ``counts[code]`` is the number of rows of each member under the filter
+    context; ``valid`` masks members that can be offered (e.g. not missing).
+    """
+    if order not in FACET_ORDERS:
+        raise FacetError(f"Ordenação '{order}' inválida. Opções: {', '.join(FACET_ORDERS)}.")
+    offset, limit = _page_bounds(offset, limit)
+    keep = np.ones(len(search), dtype=bool) if valid is None else valid.copy()
+    if not include_empty:
+        keep &= counts > 0
+    matched = search.search(query, mode)
+    if matched is None:
+        codes = np.flatnonzero(keep)
+    else:
+        codes = matched[keep[matched]]
+    if order == "count":
+        codes = codes[np.lexsort((search.rank[codes], -counts[codes]))]
+    else:
+        codes = codes[np.argsort(search.rank[codes], kind="stable")]
+    page = codes[offset : offset + limit]
+    return {
+        "values": [
+            {"value": str(search.texts[code]), "count": int(counts[code])} for code in page
+        ],
+        "total": int(len(codes)),
+        "offset": offset,
+        "limit": limit,
+        "hasMore": offset + len(page) < len(codes),
+    }
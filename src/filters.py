@@ -0,0 +1,57 @@
+"""Row filters shared by the pivot endpoints."""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .indexes import select_rows
+from .predicates import predicate_mask
+
+
+def apply_filters(
+    frame: pd.DataFrame,
+    filters: Dict[str, Any],
+    index_for: Optional[Callable[[str], Any]] = None,
+) -> pd.DataFrame:
+    """Keep rows passing every filter.
+
+    A list keeps rows whose value (compared as text) is in it; an object is a
+    predicate (see ``predicates``). With ``index_for`` (column ->
+    ``BitmapIndex`` built over ``frame``) the filters are evaluated on member
+    bitmaps and sorted indexes and the frame is taken once.
+    """
+    active = {
+        column: values
+        for column, values in (filters or {}).items()
+        if values and column in frame.columns
+    }
+    if not active:
+        return frame
+    if index_for is not None:
+        return frame.take(select_rows(index_for, active))
+    return frame[filter_mask(frame, active)]
+
+
+def filter_mask(frame: pd.DataFrame, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+    """Boolean mask of the rows of ``frame`` passing every filter (``None`` when none applies)."""
+    active = {
+        column: values
+        for column, values in (filters or {}).items()
+        if values and column in frame.columns
+    }
+    if not active:
+        return None
+    mask = np.ones(len(frame), dtype=bool)
+    for column, values in active.items():
+        if isinstance(values, dict):
+            mask &= predicate_mask(frame[column], values)
+        else:
+            mask &= frame[column].astype(str).isin(values).to_numpy()
+    return mask
+
+
+def filter_columns(frame: pd.DataFrame, filters: Dict[str, Any]) -> List[str]:
+    """Columns of ``frame`` that ``filters`` actually restricts."""
+    return [column for column, values in (filters or {}).items() if values and column in frame.columns]
@@ -0,0 +1,344 @@
+"""Per-column member indexes (member -> row positions) for fast row selection."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .predicates import RANGE_OPERATORS, parse_bound, predicate_mask, range_bounds
+
+
+@dataclass
+class DimensionIndex:
+    """Row positions of every member of one column, stored CSR-style.
+
+    ``codes`` maps each row to its member; ``order`` lists row positions
+    grouped by member and ``offsets[code]:offsets[code + 1]`` slices the rows of
+    one member, so selecting a member costs O(rows of that member).
+    """
+
+    column: str
+    members: pd.Index
+    codes: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+    _text: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def build(cls, series: pd.Series) -> "DimensionIndex":
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        codes = codes.astype(np.int32 if len(uniques) < 2**31 else np.int64)
+        counts = np.bincount(codes, minlength=len(uniques))
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        order = np.argsort(codes, kind="stable")
+        return cls(str(series.name), pd.Index(uniques), codes, order, offsets)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def size(self, code: int) -> int:
+        return int(self.offsets[code + 1] - self.offsets[code])
+
+    def positions(self, code: int) -> np.ndarray:
+        return self.order[self.offsets[code] : self.offsets[code + 1]]
+
+    def lookup(self, value: Any) -> int:
+        """Code of the member equal to ``value`` as sent back by a client, or -1."""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            missing = np.flatnonzero(self.members.isna())
+            return int(missing[0]) if len(missing) else -1
+        candidates = [value]
+        if isinstance(self.members, pd.DatetimeIndex) and isinstance(value, str):
+            try:
+                stamp = pd.Timestamp(value)
+            except (TypeError, ValueError):
+                stamp = None
+            if stamp is not None and stamp.tzinfo is not None and self.members.tz is None:
+                stamp = stamp.tz_convert(None)
+            if stamp is not None:
+                candidates.insert(0, stamp)
+        for candidate in candidates:
+            try:
+                code = int(self.members.get_indexer([candidate])[0])
+            except (TypeError, ValueError):
+                code = -1
+            if code >= 0:
+                return code
+        matches = np.flatnonzero(self.text() == str(value))
+        return int(matches[0]) if len(matches) else -1
+
+    def text(self) -> np.ndarray:
+        """Members rendered as text, the way row filters compare them."""
+        if self._text is None:
+            self._text = self.members.astype(str).to_numpy()
+        return self._text
+
+    def matches(self, values: Any) -> np.ndarray:
+        """Mask of the members passing a filter (member list or predicate)."""
+        if not isinstance(values, dict):
+            return np.isin(self.text(), list(values))
+        members = pd.Series(self.members, name=self.column)
+        if self.members.dtype == object:
+            # factorize folds None into NaN; keep the "None" text rows render as.
+            members = members.astype(object).where(members.notna(), None)
+        return predicate_mask(members, values)
+
+    def restrict(self, positions: np.ndarray, values: Any) -> np.ndarray:
+        """Keep the ``positions`` whose member passes the filter ``values``."""
+        allowed = self.matches(values)
+        return positions[allowed[self.codes[positions]]]
+
+
+@dataclass
+class SortedIndex:
+    """Rows of a numeric or date column in value order, for range filters.
+
+    ``values`` holds the distinct non-missing members sorted and
+    ``order[offsets[i]:offsets[i + 1]]`` the rows of ``values[i]``, so a range
+    is two binary searches and one slice of ``order``.
+    """
+
+    kind: str
+    values: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def build(cls, index: DimensionIndex) -> Optional["SortedIndex"]:
+        members = index.members
+        if pd.api.types.is_datetime64_any_dtype(members.dtype):
+            kind = "date"
+            values = members.to_numpy(dtype="datetime64[ns]")
+            valid = ~np.isnat(values)
+        elif pd.api.types.is_numeric_dtype(members.dtype) and not pd.api.types.is_bool_dtype(members.dtype):
+            kind = "number"
+            values = members.to_numpy(dtype=float)
+            valid = ~np.isnan(values)
+        else:
+            return None
+        codes = np.flatnonzero(valid)
+        codes = codes[np.argsort(values[codes], kind="stable")]
+        rank = np.full(len(members), len(codes), dtype=np.int64)
+        rank[codes] = np.arange(len(codes))
+        row_rank = rank[index.codes]
+        order = np.argsort(row_rank, kind="stable")
+        sizes = np.diff(index.offsets)[codes]
+        offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        return cls(kind, values[codes], order[: offsets[-1]], offsets)
+
+    def range(self, predicate: Mapping[str, Any], column: str = "") -> np.ndarray:
+        """Unsorted positions of the rows within the range operators of ``predicate``."""
+        low, high = 0, len(self.values)
+        for operator, bound in range_bounds(dict(predicate)):
+            bound = parse_bound(self.kind, bound, column)
+            if operator in ("gt", "gte"):
+                side = "right" if operator == "gt" else "left"
+                low = max(low, int(np.searchsorted(self.values, bound, side=side)))
+            else:
+                side = "left" if operator == "lt" else "right"
+                high = min(high, int(np.searchsorted(self.values, bound, side=side)))
+        return self.order[self.offsets[low] : self.offsets[max(low, high)]]
+
+
+# A member covering at least 1/32 of the rows is cheaper as one bit per row
+# than as 4-byte row positions.
+_DENSE_RATIO = 32
+# Past this many matching members, one pass over the row codes beats
+# merging their row sets.
+_UNION_MEMBERS = 64
+
+
+@dataclass
+class RowSet:
+    """Selected rows of a frame, as sorted positions (sparse) or a packed bitmap (dense)."""
+
+    rows: int
+    positions: Optional[np.ndarray] = None
+    bits: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_positions(cls, rows: int, positions: np.ndarray) -> "RowSet":
+        """Set of arbitrary (unsorted) positions, packed when dense."""
+        if len(positions) * _DENSE_RATIO < rows:
+            return cls(rows, positions=np.sort(positions))
+        mask = np.zeros(rows, dtype=bool)
+        mask[positions] = True
+        return cls(rows, bits=np.packbits(mask))
+
+    @classmethod
+    def union(cls, rows: int, parts: Iterable["RowSet"]) -> "RowSet":
+        """OR of disjoint sets (the members of one column)."""
+        parts = list(parts)
+        if len(parts) == 1:
+            return parts[0]
+        sparse = [part.positions for part in parts if part.bits is None]
+        dense = [part.bits for part in parts if part.bits is not None]
+        if not dense and sum(len(positions) for positions in sparse) * _DENSE_RATIO < rows:
+            merged = np.concatenate(sparse) if sparse else np.empty(0, dtype=np.int64)
+            return cls(rows, positions=np.sort(merged))
+        bits = np.bitwise_or.reduce(dense) if dense else np.zeros((rows + 7) // 8, dtype=np.uint8)
+        if sparse:
+            positions = np.concatenate(sparse)
+            np.bitwise_or.at(bits, positions >> 3, (128 >> (positions & 7)).astype(np.uint8))
+        return cls(rows, bits=bits)
+
+    def __and__(self, other: "RowSet") -> "RowSet":
+        if self.bits is not None and other.bits is not None:
+            return RowSet(self.rows, bits=self.bits & other.bits)
+        if self.bits is None and other.bits is None:
+            return RowSet(
+                self.rows, positions=np.intersect1d(self.positions, other.positions, assume_unique=True)
+            )
+        positions, bits = (self.positions, other.bits) if self.bits is None else (other.positions, self.bits)
+        keep = (bits[positions >> 3] >> (7 - (positions & 7)).astype(np.uint8)) & 1
+        return RowSet(self.rows, positions=positions[keep.astype(bool)])
+
+    def to_positions(self) -> np.ndarray:
+        if self.bits is None:
+            return self.positions
+        return np.flatnonzero(np.unpackbits(self.bits, count=self.rows))
+
+
+@dataclass
+class BitmapIndex:
+    """One compressed bitset of rows per member of a column, for filter evaluation.
+
+    Frequent members keep a packed bitmap; rare ones reuse their slice of the
+    ``DimensionIndex`` positions, which is smaller. Filter values are matched
+    to members through their text once per distinct value, never per row.
+    """
+
+    index: DimensionIndex
+    bitmaps: Dict[int, np.ndarray]
+    _codes_by_text: Dict[bool, Dict[str, List[int]]] = field(default_factory=dict, repr=False)
+    _sorted: Any = field(default=None, repr=False)
+
+    @classmethod
+    def build(cls, index: DimensionIndex) -> "BitmapIndex":
+        rows = len(index.codes)
+        threshold = max(rows // _DENSE_RATIO, 1)
+        bitmaps: Dict[int, np.ndarray] = {}
+        for code in np.flatnonzero(np.diff(index.offsets) >= threshold):
+            mask = np.zeros(rows, dtype=bool)
+            mask[index.positions(int(code))] = True
+            bitmaps[int(code)] = np.packbits(mask)
+        return cls(index, bitmaps)
+
+    @property
+    def rows(self) -> int:
+        return len(self.index.codes)
+
+    def member_rows(self, code: int) -> RowSet:
+        if code in self.bitmaps:
+            return RowSet(self.rows, bits=self.bitmaps[code])
+        return RowSet(self.rows, positions=self.index.positions(code))
+
+    def codes_for(self, values: Iterable[Any], case_insensitive: bool = False) -> List[int]:
+        """Members whose text (as ``astype(str)`` renders it) is one of ``values``."""
+        lookup = self._codes_by_text.get(case_insensitive)
+        if lookup is None:
+            texts = self.index.text()
+            if case_insensitive:
+                texts = pd.Index(texts).str.lower().to_numpy()
+            lookup = {}
+            for code, text in enumerate(texts):
+                lookup.setdefault(text, []).append(code)
+            if self.index.members.dtype == object:
+                # factorize folds None into NaN, which ``astype(str)`` renders as "None".
+                for code in np.flatnonzero(self.index.members.isna()):
+                    lookup.setdefault("none" if case_insensitive else "None", []).append(int(code))
+            self._codes_by_text[case_insensitive] = lookup
+        codes: List[int] = []
+        for value in dict.fromkeys(str(value).lower() if case_insensitive else str(value) for value in values):
+            codes.extend(lookup.get(value, []))
+        return codes
+
+    def select(self, values: Iterable[Any], case_insensitive: bool = False) -> RowSet:
+        """Rows whose member is any of ``values`` (OR of the member bitsets)."""
+        codes = self.codes_for(values, case_insensitive)
+        return RowSet.union(self.rows, (self.member_rows(code) for code in codes))
+
+    def sorted_index(self) -> Optional[SortedIndex]:
+        """Value-ordered rows of the column, built on the first range filter."""
+        if self._sorted is None:
+            self._sorted = SortedIndex.build(self.index) or False
+        return self._sorted or None
+
+    def select_predicate(self, predicate: Mapping[str, Any]) -> RowSet:
+        """Rows whose member satisfies ``predicate``.
+
+        Pure ranges on a numeric or date column are one slice of the sorted
+        index; anything else is decided once per member, then the rows of the
+        matching members are gathered.
+        """
+        if all(operator in RANGE_OPERATORS for operator in predicate):
+            sorted_index = self.sorted_index()
+            if sorted_index is not None:
+                return RowSet.from_positions(self.rows, sorted_index.range(predicate, self.index.column))
+        allowed = self.index.matches(predicate)
+        codes = np.flatnonzero(allowed)
+        if len(codes) <= _UNION_MEMBERS:
+            return RowSet.union(self.rows, (self.member_rows(int(code)) for code in codes))
+        return RowSet.from_positions(self.rows, np.flatnonzero(allowed[self.index.codes]))
+
+    def estimate(self, values: Any, case_insensitive: bool = False) -> int:
+        if isinstance(values, dict):
+            return self.rows
+        return sum(self.index.size(code) for code in self.codes_for(values, case_insensitive))
+
+
+def select_rows(
+    index_for: Callable[[str], BitmapIndex],
+    filters: Mapping[str, Any],
+    case_insensitive: bool = False,
+) -> Optional[np.ndarray]:
+    """Sorted positions of the rows passing every filter, or ``None`` when nothing filters.
+
+    Values of one column are ORed and columns are ANDed, starting from the
+    most selective member list; predicates run last.
+    """
+    selections = [
+        (index_for(column), values) for column, values in filters.items() if values
+    ]
+    if not selections:
+        return None
+    selections.sort(key=lambda item: item[0].estimate(item[1], case_insensitive))
+    selected: Optional[RowSet] = None
+    for bitmap, values in selections:
+        if isinstance(values, dict):
+            rows = bitmap.select_predicate(values)
+        else:
+            rows = bitmap.select(values, case_insensitive)
+        selected = rows if selected is None else selected & rows
+        if selected.bits is None and not len(selected.positions):
+            break
+    return selected.to_positions().astype(np.int64, copy=False)
+
+
+def path_positions(
+    index_for: Callable[[str], DimensionIndex],
+    dimensions: Sequence[str],
+    path: Sequence[Any],
+) -> np.ndarray:
+    """Sorted row positions matching every ``dimension == member`` pair of ``path``.
+
+    Starts from the most selective member and checks the remaining levels on
+    those rows only, so the cost follows the size of the selected node.
+    """
+    levels = []
+    for column, member in zip(dimensions, path):
+        index = index_for(column)
+        code = index.lookup(member)
+        if code < 0:
+            return np.empty(0, dtype=np.int64)
+        levels.append((index.size(code), index, code))
+    if not levels:
+        return np.empty(0, dtype=np.int64)
+    levels.sort(key=lambda level: level[0])
+    _, first, first_code = levels[0]
+    selected = first.positions(first_code)
+    for _, index, code in levels[1:]:
+        selected = selected[index.codes[selected] == code]
+    return np.sort(selected)
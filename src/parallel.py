@@ -0,0 +1,76 @@
+"""Shared thread pool used to split one pivot across measures and row partitions.
+
+numpy reductions release the GIL for most of their work, so a heavy request
+can use several cores. The pool is shared by every request and each request
+is capped at ``PIVOT_REQUEST_THREADS`` workers so one user cannot take it all.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+_CPUS = os.cpu_count() or 1
+
+PIVOT_THREADS = int(os.getenv("SAIKU_PIVOT_THREADS", str(_CPUS)))
+PIVOT_REQUEST_THREADS = int(os.getenv("SAIKU_PIVOT_REQUEST_THREADS", str(max(1, _CPUS // 2))))
+PARALLEL_MIN_ROWS = int(os.getenv("SAIKU_PARALLEL_MIN_ROWS", "500000"))
+PARTITION_MIN_ROWS = int(os.getenv("SAIKU_PARTITION_MIN_ROWS", "250000"))
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(PIVOT_THREADS, 1), thread_name_prefix="saiku-pivot"
+                )
+    return _executor
+
+
+def request_workers(rows: int) -> int:
+    """Threads one request may use for ``rows`` input rows (1 means run inline)."""
+    if PIVOT_THREADS <= 1 or rows < PARALLEL_MIN_ROWS:
+        return 1
+    return max(1, min(PIVOT_THREADS, PIVOT_REQUEST_THREADS))
+
+
+def row_partitions(rows: int, workers: int) -> List[slice]:
+    """Contiguous row ranges, at most one per worker and not smaller than ``PARTITION_MIN_ROWS``."""
+    count = max(1, min(workers, rows // max(PARTITION_MIN_ROWS, 1)))
+    bounds = [rows * part // count for part in range(count + 1)]
+    return [slice(start, stop) for start, stop in zip(bounds, bounds[1:])]
+
+
+def run_tasks(tasks: Sequence[Callable[[], T]], workers: int) -> List[T]:
+    """Run ``tasks`` on at most ``workers`` pool threads and return results in order.
+
+    Each worker drains a shared queue, so a request never holds more than
+    ``workers`` pool threads however many tasks it has.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+    results: List[Optional[T]] = [None] * len(tasks)
+    pending = iter(enumerate(tasks))
+    lock = threading.Lock()
+
+    def drain() -> None:
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            position, task = item
+            results[position] = task()
+
+    futures = [_pool().submit(drain) for _ in range(min(workers, len(tasks)))]
+    for future in futures:
+        future.result()
+    return results  # type: ignore[return-value]
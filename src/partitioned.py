@@ -0,0 +1,204 @@
+"""Map-reduce pivot aggregation over memory-mapped row partitions in worker processes.
+
+Columns are written once as ``.npy`` files (dimension member codes and
+numeric measures). Each worker process memory-maps only the columns and row
+range of its partition, reduces them into mergeable ``MeasureState`` objects
+and the coordinator merges the partials into one state per group, shaped
+like a materialized cube so the usual pivot code can finish the job.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregates import AggregateError, MeasureState, component_keys
+from .indexes import DimensionIndex
+
+logger = logging.getLogger(__name__)
+
+PIVOT_PROCESSES = int(os.getenv("SAIKU_PIVOT_PROCESSES", "0"))
+PARTITIONED_MIN_ROWS = int(os.getenv("SAIKU_PARTITIONED_MIN_ROWS", "2000000"))
+PROCESS_PARTITION_ROWS = int(os.getenv("SAIKU_PROCESS_PARTITION_ROWS", "1000000"))
+PARTITION_DIR = os.getenv("SAIKU_PARTITION_DIR") or None
+
+_MAX_KEY_SPACE = 2**62
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # "spawn" keeps workers independent of the threads of the web server.
+                _executor = ProcessPoolExecutor(
+                    max_workers=max(PIVOT_PROCESSES, 1), mp_context=get_context("spawn")
+                )
+                atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+
+def partitioning_enabled(rows: int) -> bool:
+    return PIVOT_PROCESSES > 0 and rows >= PARTITIONED_MIN_ROWS
+
+
+def _partition_states(
+    directory: str,
+    start: int,
+    stop: int,
+    dimensions: Sequence[Tuple[str, int]],
+    allowed: Sequence[Tuple[str, np.ndarray]],
+    measures: Sequence[Tuple[str, str, List[Any]]],
+) -> Tuple[np.ndarray, Dict[str, MeasureState]]:
+    """Worker side: group keys present in ``[start, stop)`` and their partial states."""
+
+    def column(file_name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, file_name), mmap_mode="r")[start:stop]
+
+    keep = np.ones(stop - start, dtype=bool)
+    for file_name, members in allowed:
+        keep &= members[column(file_name)]
+    combined = np.zeros(int(keep.sum()), dtype=np.int64)
+    for file_name, stride in dimensions:
+        combined += column(file_name)[keep].astype(np.int64) * stride
+    keys, local = np.unique(combined, return_inverse=True)
+    states = {
+        measure_name: MeasureState.build(
+            pd.Series(np.asarray(column(file_name)[keep])), local.astype(np.int64), len(keys), wanted
+        )
+        for measure_name, file_name, wanted in measures
+    }
+    return keys, states
+
+
+@dataclass
+class PartitionedStore:
+    """Memory-mapped columns of one dataset, split in row partitions for the process pool."""
+
+    frame: pd.DataFrame
+    index_for: Callable[[str], DimensionIndex]
+    directory: str = field(
+        default_factory=lambda: tempfile.mkdtemp(prefix="saiku-partitions-", dir=PARTITION_DIR)
+    )
+    partition_rows: int = PROCESS_PARTITION_ROWS
+    _files: Dict[Tuple[str, str], str] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def partitions(self) -> List[Tuple[int, int]]:
+        rows = len(self.frame)
+        size = max(int(self.partition_rows), 1)
+        return [(start, min(start + size, rows)) for start in range(0, rows, size)]
+
+    def _file(self, column: str, kind: str) -> str:
+        key = (column, kind)
+        if key not in self._files:
+            with self._lock:
+                if key not in self._files:
+                    name = f"{kind}{len(self._files)}.npy"
+                    if kind == "codes":
+                        values = self.index_for(column).codes
+                    else:
+                        values = pd.to_numeric(self.frame[column], errors="coerce").to_numpy(
+                            dtype=float
+                        )
+                    np.save(os.path.join(self.directory, name), values)
+                    self._files[key] = name
+        return self._files[key]
+
+    def aggregate(
+        self,
+        dimensions: Sequence[str],
+        filters: Dict[str, Any],
+        specs: Sequence[Dict[str, Any]],
+    ) -> Optional[Tuple[pd.DataFrame, Dict[str, MeasureState]]]:
+        """Group keys (one row per combination of ``dimensions``) and merged states per measure.
+
+        Returns ``None`` when the request cannot run partitioned (non-numeric
+        measure, unsupported aggregator or too many key combinations).
+        """
+        wanted: Dict[str, List[Any]] = {}
+        try:
+            for spec in specs:
+                wanted.setdefault(spec["measure"], []).extend(
+                    component_keys(spec["meta"], spec["options"])
+                )
+        except AggregateError:
+            return None
+        if any(not pd.api.types.is_numeric_dtype(self.frame[name]) for name in wanted):
+            return None
+        indexes = [self.index_for(column) for column in dimensions]
+        sizes = [max(len(index), 1) for index in indexes]
+        if math.prod(sizes) >= _MAX_KEY_SPACE:
+            return None
+        strides = [math.prod(sizes[position + 1 :]) for position in range(len(sizes))]
+
+        allowed = []
+        for column, values in (filters or {}).items():
+            if values and column in self.frame.columns:
+                members = self.index_for(column).matches(values)
+                allowed.append((self._file(column, "codes"), members))
+        dimension_files = [
+            (self._file(column, "codes"), stride) for column, stride in zip(dimensions, strides)
+        ]
+        measures = [(name, self._file(name, "values"), keys) for name, keys in wanted.items()]
+
+        if not self.partitions:
+            return None
+        try:
+            futures = [
+                _pool().submit(
+                    _partition_states, self.directory, start, stop, dimension_files, allowed, measures
+                )
+                for start, stop in self.partitions
+            ]
+            parts = [future.result() for future in futures]
+        except (OSError, RuntimeError, BrokenProcessPool):
+            logger.exception("Falha na agregação particionada; usando o processamento em memória.")
+            return None
+
+        all_keys = np.concatenate([keys for keys, _ in parts])
+        merged_keys, inverse = np.unique(all_keys, return_inverse=True)
+        ngroups = len(merged_keys)
+        regrouped: Dict[str, List[MeasureState]] = {name: [] for name in wanted}
+        offset = 0
+        for keys, states in parts:
+            mapping = inverse[offset : offset + len(keys)].astype(np.int64)
+            offset += len(keys)
+            for name, state in states.items():
+                regrouped[name].append(state.regroup(mapping, ngroups))
+        merged = {name: MeasureState.merge(states) for name, states in regrouped.items()}
+
+        keys_frame = pd.DataFrame(
+            {
+                column: index.members.take((merged_keys // stride) % size)
+                for column, index, stride, size in zip(dimensions, indexes, strides, sizes)
+            }
+        )
+        return keys_frame, merged
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "source": "partitions",
+            "partitions": len(self.partitions),
+            "processes": PIVOT_PROCESSES,
+            "sourceRows": int(len(self.frame)),
+        }
+
+    def close(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,296 @@
+"""Paginated PDF rendering of pivot (and other flat) tables.
+
+Cell strings are formatted a column at a time (pt-BR numbers, as shown in the
+browser) and measured against the font's metric table in one numpy pass, so
+column widths are settled before drawing and each cell is written as plain
+text on a ruled grid. Tables wider than the page are split into column slices
+that repeat the row labels and the header on every page.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from fpdf import FPDF
+
+from .pivot import PivotResult, iter_pivot_rows, pivot_export_columns
+
+TITLE = "Tabela Dinâmica"
+FONT = "Helvetica"
+FONT_SIZE = 8
+TITLE_SIZE = 12
+MARGIN = 10.0
+TITLE_HEIGHT = 10.0
+FOOTER_HEIGHT = 6.0
+ROW_HEIGHT = 5.0
+CELL_PADDING = 1.2
+MIN_COLUMN_WIDTH = 12.0
+MAX_COLUMN_WIDTH = 60.0
+# Share of the page width the repeated row labels may take.
+MAX_LABEL_SHARE = 0.5
+
+_ELLIPSIS = "..."
+# Longer cells are cut before measuring; no column is wide enough to show them.
+_MAX_CHARS = 200
+_DECIMAL_PT_BR = str.maketrans({",": ".", ".": ","})
+_HEADER_FILL = 230
+_TOTAL_FILL = 245
+_RULE_COLOR = 160
+
+
+@dataclass
+class RenderedPdf:
+    data: bytes
+    rows: int
+    columns: int
+    pages: int
+    seconds: float
+
+
+@dataclass
+class _Column:
+    header: str
+    header_width: float
+    texts: List[str]
+    codes: np.ndarray
+    widths: np.ndarray
+    numeric: bool
+    width: float = 0.0
+
+
+class _Metrics:
+    """String widths (in mm) for one core font style, from its 256-entry metric table."""
+
+    def __init__(self, pdf: FPDF, style: str) -> None:
+        pdf.set_font(FONT, style, FONT_SIZE)
+        widths = pdf.current_font.cw
+        self.table = np.array([widths.get(chr(code), 0) for code in range(256)], dtype=np.float64)
+        self.table[0] = 0.0
+        self.scale = pdf.font_size / 1000.0
+        self.ellipsis = sum(widths[char] for char in _ELLIPSIS) * self.scale
+
+    def measure(self, strings: Sequence[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Latin-1 safe text, character codes (rows x chars) and width of every string."""
+        width = min(max(map(len, strings), default=0), _MAX_CHARS) or 1
+        text = np.array(strings, dtype=f"U{width}")
+        codes = text.view(np.uint32).reshape(len(text), width)
+        # Core fonts only cover latin-1: drop what they cannot show (updates ``codes`` too).
+        for position in np.flatnonzero((codes > 255).any(axis=1)):
+            text[position] = str(text[position]).encode("latin-1", "ignore").decode("latin-1")
+        widths = self.table[codes].sum(axis=1) * self.scale
+        return text.tolist(), codes, widths
+
+    def truncate(self, texts: List[str], codes: np.ndarray, widths: np.ndarray, available: float) -> None:
+        """Cut (in place) the strings wider than ``available`` and end them with an ellipsis."""
+        for position in np.flatnonzero(widths > available):
+            cumulative = np.cumsum(self.table[codes[position]]) * self.scale
+            keep = int(np.searchsorted(cumulative, available - self.ellipsis, side="right"))
+            texts[position] = texts[position][:keep] + _ELLIPSIS
+            widths[position] = (cumulative[keep - 1] if keep else 0.0) + self.ellipsis
+
+
+def _format_numbers(values: np.ndarray, currency: bool) -> np.ndarray:
+    """pt-BR strings for ``values`` (two decimals, or up to two unless ``currency``); blank when not finite."""
+    formatted = np.full(len(values), "", dtype=object)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return formatted
+    rounded = np.round(values[finite], 2)
+    text = pd.Series(np.abs(rounded)).map("{:,.2f}".format)
+    if not currency:
+        text = text.str.rstrip("0").str.rstrip(".")
+    text = text.str.translate(_DECIMAL_PT_BR)
+    if currency:
+        text = "R$ " + text
+    sign = pd.Series(np.where(rounded < 0, "-", ""))
+    formatted[finite] = (sign + text).to_numpy(dtype=object)
+    return formatted
+
+
+def _cell_strings(series: pd.Series, label: bool, currency: bool) -> Tuple[np.ndarray, bool]:
+    """Display strings of a column and whether it holds numbers (drawn right-aligned)."""
+    if not label:
+        inferred = series.infer_objects()
+        if pd.api.types.is_numeric_dtype(inferred) and not pd.api.types.is_bool_dtype(inferred):
+            return _format_numbers(inferred.to_numpy(dtype=np.float64, na_value=np.nan), currency), True
+    return series.where(series.notna(), "").astype(str).to_numpy(dtype=object), False
+
+
+def _columns(
+    header: Sequence[Any], rows: List[Sequence[Any]], label_count: int, currency: bool, metrics: _Metrics, bold: _Metrics
+) -> List[_Column]:
+    frame = pd.DataFrame(rows, columns=range(len(header)), dtype=object)
+    header_texts, _, header_widths = bold.measure([str(title) for title in header])
+    columns = []
+    for position, title in enumerate(header_texts):
+        strings, numeric = _cell_strings(frame[position], position < label_count, currency)
+        texts, codes, widths = metrics.measure(strings)
+        column = _Column(title, float(header_widths[position]), texts, codes, widths, numeric)
+        natural = max(column.header_width, widths.max(initial=0.0)) + 2 * CELL_PADDING
+        column.width = float(np.clip(natural, MIN_COLUMN_WIDTH, MAX_COLUMN_WIDTH))
+        columns.append(column)
+    return columns
+
+
+def _fit_labels(labels: List[_Column], page_width: float) -> None:
+    total = sum(column.width for column in labels)
+    limit = page_width * MAX_LABEL_SHARE
+    if total > limit:
+        for column in labels:
+            column.width = max(MIN_COLUMN_WIDTH, column.width * limit / total)
+
+
+def _slices(values: List[_Column], available: float) -> List[List[_Column]]:
+    """Consecutive groups of value columns that fit beside the row labels."""
+    slices: List[List[_Column]] = [[]]
+    used = 0.0
+    for column in values:
+        column.width = min(column.width, available)
+        if slices[-1] and used + column.width > available:
+            slices.append([])
+            used = 0.0
+        slices[-1].append(column)
+        used += column.width
+    return slices
+
+
+class _Renderer:
+    def __init__(self, pdf: FPDF, orientation: str, page_width: float, page_height: float) -> None:
+        self.pdf = pdf
+        self.orientation = orientation
+        self.page_width = page_width
+        self.rows_per_page = max(
+            1, int((page_height - 2 * MARGIN - TITLE_HEIGHT - FOOTER_HEIGHT) // ROW_HEIGHT) - 1
+        )
+        # Same vertical placement as ``FPDF.cell``.
+        self.baseline = 0.5 * ROW_HEIGHT + 0.3 * FONT_SIZE / pdf.k
+
+    def page(self, title: str, columns: List[_Column], start: int, stop: int, total_row: int) -> None:
+        pdf = self.pdf
+        pdf.add_page(orientation=self.orientation)
+        pdf.set_font(FONT, "B", TITLE_SIZE)
+        pdf.text(MARGIN, MARGIN + TITLE_SIZE / pdf.k, title)
+
+        top = MARGIN + TITLE_HEIGHT
+        table_width = sum(column.width for column in columns)
+        body_rows = stop - start
+        bottom = top + ROW_HEIGHT * (body_rows + 1)
+        baseline = self.baseline
+
+        pdf.set_fill_color(_HEADER_FILL)
+        pdf.rect(MARGIN, top, table_width, ROW_HEIGHT, style="F")
+        if start <= total_row < stop:
+            pdf.set_fill_color(_TOTAL_FILL)
+            pdf.rect(MARGIN, top + ROW_HEIGHT * (total_row - start + 1), table_width, ROW_HEIGHT, style="F")
+
+        pdf.set_font(FONT, "B", FONT_SIZE)
+        x = MARGIN
+        for column in columns:
+            pdf.text(x + max(CELL_PADDING, (column.width - column.header_width) / 2), top + baseline, column.header)
+            x += column.width
+
+        pdf.set_font(FONT, "", FONT_SIZE)
+        x = MARGIN
+        for column in columns:
+            texts, widths = column.texts, column.widths
+            y = top + ROW_HEIGHT + baseline
+            right = x + column.width - CELL_PADDING
+            for row in range(start, stop):
+                text = texts[row]
+                if text:
+                    pdf.text(right - widths[row] if column.numeric else x + CELL_PADDING, y, text)
+                y += ROW_HEIGHT
+            x += column.width
+
+        pdf.set_draw_color(_RULE_COLOR)
+        pdf.set_line_width(0.1)
+        for line in range(body_rows + 2):
+            y = top + ROW_HEIGHT * line
+            pdf.line(MARGIN, y, MARGIN + table_width, y)
+        x = MARGIN
+        pdf.line(x, top, x, bottom)
+        for column in columns:
+            x += column.width
+            pdf.line(x, top, x, bottom)
+
+        pdf.set_font(FONT, "", FONT_SIZE)
+        footer = f"Página {pdf.page_no()}"
+        pdf.text(MARGIN + self.page_width - pdf.get_string_width(footer), pdf.h - MARGIN, footer)
+
+
+def render_table_pdf(
+    header: Sequence[Any],
+    rows: Iterable[Sequence[Any]],
+    title: str = TITLE,
+    *,
+    label_count: int = 0,
+    currency: bool = False,
+    total_row: bool = False,
+) -> RenderedPdf:
+    """PDF of a flat table, split across pages down and, for wide tables, across.
+
+    The first ``label_count`` columns are row labels, repeated on every page
+    of a wide table; ``total_row`` shades the last row.
+    """
+    started = time.perf_counter()
+    pdf = FPDF(unit="mm", format="A4")
+    pdf.set_auto_page_break(False)
+    pdf.set_title(title)
+    metrics, bold = _Metrics(pdf, ""), _Metrics(pdf, "B")
+    rows = list(rows)
+    row_count = len(rows)
+    columns = _columns(header, rows, label_count, currency, metrics, bold)
+
+    # Portrait when the whole table fits, landscape (and column slices if needed) otherwise.
+    width, height = pdf.w, pdf.h
+    orientation = "P"
+    if sum(column.width for column in columns) > width - 2 * MARGIN:
+        orientation, width, height = "L", height, width
+    page_width = width - 2 * MARGIN
+
+    labels, values = columns[:label_count], columns[label_count:]
+    _fit_labels(labels, page_width)
+    slices = _slices(values, page_width - sum(column.width for column in labels)) if values else [[]]
+    for column in columns:
+        metrics.truncate(column.texts, column.codes, column.widths, column.width - 2 * CELL_PADDING)
+        if column.header_width > column.width - 2 * CELL_PADDING:
+            header_text, codes, widths = bold.measure([column.header])
+            bold.truncate(header_text, codes, widths, column.width - 2 * CELL_PADDING)
+            column.header, column.header_width = header_text[0], float(widths[0])
+
+    renderer = _Renderer(pdf, orientation, page_width, height)
+    last_row = row_count - 1 if total_row else -1
+    position = 0
+    for group in slices:
+        heading = title
+        if len(slices) > 1:
+            first = position + 1
+            position += len(group)
+            heading = f"{title} (colunas {first}-{position} de {len(values)})"
+        for start in range(0, row_count, renderer.rows_per_page):
+            stop = min(start + renderer.rows_per_page, row_count)
+            renderer.page(heading, labels + group, start, stop, last_row)
+
+    data = bytes(pdf.output())
+    return RenderedPdf(
+        data=data,
+        rows=row_count,
+        columns=len(columns),
+        pages=pdf.page_no(),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def render_pivot_pdf(result: PivotResult, title: str = TITLE) -> RenderedPdf:
+    """PDF of the flat pivot table (``iter_pivot_rows``), totals row shaded."""
+    return render_table_pdf(
+        pivot_export_columns(result),
+        iter_pivot_rows(result),
+        title,
+        label_count=max(len(result.rows), 1) if result.table is not None else 0,
+        currency=result.value_format == "currency",
+        total_row=result.table is not None,
+    )
@@ -1,16 +1,36 @@
-
 """Pivot table helpers."""
 from __future__ import annotations
 
 import copy
 import json
-import re
 from dataclasses import dataclass, field
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Set, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
+from .aggregates import AggregateError, MeasureState, component_keys, target_quantile
+from .cubes import MaterializedCube, routable, route
+from .expressions import ExpressionError, column_values, compile_expression, parse_expression
+from .filters import apply_filters, filter_columns
+from .parallel import request_workers, row_partitions, run_tasks
+
+
+class StateSource(Protocol):
+    """Computes merged states outside of ``frame`` (partitions, on-disk chunks)."""
+
+    def aggregate(
+        self,
+        dimensions: Sequence[str],
+        filters: Dict[str, Any],
+        specs: Sequence[Dict[str, Any]],
+    ) -> Optional[Tuple[pd.DataFrame, Dict[str, MeasureState]]]:
+        ...
+
+    def describe(self) -> Dict[str, Any]:
+        ...
+
 
 @dataclass
 class PivotResult:
@@ -31,6 +51,7 @@ class PivotResult:
     calculations: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
     value_format: str = "number"
     summary_values: Dict[str, Any] = field(default_factory=dict)
+    metadata: Dict[str, Any] = field(default_factory=dict)
 
     def as_dict(self) -> Dict[str, Any]:
         return {
@@ -51,6 +72,7 @@ class PivotResult:
             "summaryValues": self.summary_values,
             "calculations": self.calculations,
             "valueFormat": self.value_format,
+            "metadata": self.metadata,
         }
 
 
@@ -63,18 +85,56 @@ class CalculationError(PivotError):
 
 
 AGGREGATIONS_META: Dict[str, Dict[str, Any]] = {
-    "sum": {"func": "sum", "label": "Somar", "format": "number"},
-    "avg": {"func": "mean", "label": "Média", "format": "number"},
-    "count": {"func": "count", "label": "Contagem", "format": "number"},
-    "distinct_count": {"func": "nunique", "label": "Contagem distinta", "format": "number"},
-    "min": {"func": "min", "label": "Mínimo", "format": "number"},
-    "max": {"func": "max", "label": "Máximo", "format": "number"},
-    "money_sum": {"func": "sum", "label": "Somar (R$)", "format": "currency"},
+    "sum": {"func": "sum", "label": "Somar", "format": "number", "state": "sum"},
+    "avg": {"func": "mean", "label": "Média", "format": "number", "state": "mean"},
+    "count": {"func": "count", "label": "Contagem", "format": "number", "state": "count"},
+    "distinct_count": {
+        "func": "nunique",
+        "label": "Contagem distinta",
+        "format": "number",
+        "state": "nunique",
+    },
+    "approx_distinct_count": {
+        "func": "nunique",
+        "label": "Contagem distinta (aprox.)",
+        "format": "number",
+        "state": "hll",
+        "sketch": "hll",
+    },
+    "median": {
+        "func": "median",
+        "label": "Mediana",
+        "format": "number",
+        "state": "quantile",
+        "sketch": "quantile",
+        "quantile": 0.5,
+    },
+    "percentile": {
+        "func": "median",
+        "label": "Percentil",
+        "format": "number",
+        "state": "quantile",
+        "sketch": "quantile",
+    },
+    "min": {"func": "min", "label": "Mínimo", "format": "number", "state": "min"},
+    "max": {"func": "max", "label": "Máximo", "format": "number", "state": "max"},
+    "money_sum": {"func": "sum", "label": "Somar (R$)", "format": "currency", "state": "sum"},
 }
 
 
 def available_aggregations() -> List[Dict[str, str]]:
-    order = ["sum", "money_sum", "avg", "count", "distinct_count", "min", "max"]
+    order = [
+        "sum",
+        "money_sum",
+        "avg",
+        "count",
+        "distinct_count",
+        "approx_distinct_count",
+        "median",
+        "percentile",
+        "min",
+        "max",
+    ]
     aggregations = []
     for key in order:
         meta = AGGREGATIONS_META.get(key)
@@ -111,6 +171,17 @@ def _to_native(value: Any) -> Any:
     return value
 
 
+def _native_matrix(matrix: np.ndarray) -> List[List[Any]]:
+    """Rows of ``matrix`` as Python values, with missing cells as ``None``."""
+    if matrix.dtype.kind == "f":
+        cells = matrix.astype(object)
+        cells[np.isnan(matrix)] = None
+        return cells.tolist()
+    if matrix.dtype.kind in "iub":
+        return matrix.tolist()
+    return [[_to_native(value) for value in row] for row in matrix.tolist()]
+
+
 def _column_to_key(column: Any) -> str:
     if isinstance(column, tuple):
         flattened = [_to_native(part) for part in column]
@@ -290,29 +361,35 @@ def _create_pivot_result_from_grouped(
     value_format: str,
     grouped: pd.DataFrame,
     summary_values: Optional[Dict[str, Any]] = None,
+    merged_totals: Optional[Dict[str, Any]] = None,
 ) -> PivotResult:
     grouped = grouped.copy()
     numeric = grouped.apply(lambda col: pd.to_numeric(col, errors="coerce"))
 
-    values_matrix = [
-        [_to_native(val) for val in numeric.iloc[row_idx].tolist()]
-        for row_idx in range(numeric.shape[0])
-    ]
+    values_matrix = _native_matrix(numeric.to_numpy())
 
     row_headers = _to_series_list(grouped.index)
     column_headers = _to_series_list(grouped.columns)
     column_keys = [_column_to_key(col) for col in grouped.columns]
 
-    row_totals = [
-        _to_native(numeric.iloc[row_idx].sum(skipna=True))
-        for row_idx in range(numeric.shape[0])
-    ]
+    row_totals = [_to_native(value) for value in numeric.sum(axis=1, skipna=True).to_numpy()]
     column_totals = [
         _to_native(numeric.iloc[:, col_idx].sum(skipna=True))
         for col_idx in range(numeric.shape[1])
     ]
     grand_total = _to_native(np.nansum(numeric.to_numpy()))
 
+    if merged_totals is not None:
+        # Non-additive aggregators merge their states instead of summing cells.
+        merged_rows = merged_totals["rows"].reindex(grouped.index)
+        merged_columns = merged_totals["columns"].reindex(grouped.columns)
+        row_totals = [_to_native(value) for value in merged_rows.tolist()]
+        column_totals = [
+            _to_native(merged) if not pd.isna(merged) else summed
+            for merged, summed in zip(merged_columns.tolist(), column_totals)
+        ]
+        grand_total = _to_native(merged_totals["grand"])
+
     return PivotResult(
         dataset_id=dataset_id,
         rows=rows,
@@ -345,7 +422,8 @@ def apply_pre_calculations(
     if not relevant:
         return frame
 
-    df = frame.copy()
+    # Only whole columns are assigned below, so the source frame is never touched.
+    df = frame.copy(deep=False)
     for calc in relevant:
         result_field = calc.get("resultField")
         if not result_field:
@@ -373,6 +451,598 @@ def apply_pre_calculations(
     return df
 
 
+OTHERS_LABEL = "Outros"
+
+
+def _normalize_axis(value: Any) -> str:
+    axis = str(value or "rows").lower()
+    if axis in {"row", "rows", "linhas"}:
+        return "rows"
+    if axis in {"column", "columns", "colunas"}:
+        return "columns"
+    raise PivotError(f"Eixo '{value}' não é suportado para ordenação.")
+
+
+def _resolve_level(dims: List[str], level: Any, default: int) -> int:
+    if level is None or level == "":
+        return default
+    if isinstance(level, str) and level in dims:
+        return dims.index(level)
+    try:
+        position = int(level)
+    except (TypeError, ValueError):
+        raise PivotError(f"Nível '{level}' não pertence às dimensões do eixo.")
+    if position < 0 or position >= len(dims):
+        raise PivotError(f"Nível '{level}' não pertence às dimensões do eixo.")
+    return position
+
+
+def _normalize_sort(sort: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not sort:
+        return None
+    if not isinstance(sort, dict):
+        raise PivotError("Configuração de ordenação inválida.")
+    direction = str(sort.get("direction") or "desc").lower()
+    if direction not in {"asc", "desc"}:
+        raise PivotError(f"Direção de ordenação '{direction}' não é suportada.")
+    return {
+        "axis": _normalize_axis(sort.get("axis")),
+        "by": sort.get("by") or "total",
+        "direction": direction,
+        "level": sort.get("level"),
+    }
+
+
+def _normalize_top_n(top_n: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not top_n:
+        return None
+    if not isinstance(top_n, dict):
+        raise PivotError("Configuração de Top-N inválida.")
+    try:
+        limit = int(top_n.get("n"))
+    except (TypeError, ValueError):
+        raise PivotError("Valor de 'n' inválido para Top-N.")
+    if limit <= 0:
+        raise PivotError("Valor de 'n' deve ser maior que zero para Top-N.")
+    direction = str(top_n.get("direction") or "top").lower()
+    if direction not in {"top", "bottom"}:
+        raise PivotError(f"Direção de Top-N '{direction}' não é suportada.")
+    return {
+        "axis": _normalize_axis(top_n.get("axis")),
+        "level": top_n.get("level"),
+        "n": limit,
+        "direction": direction,
+        "measure": top_n.get("measure"),
+        "othersLabel": str(top_n.get("othersLabel") or OTHERS_LABEL),
+        "showOthers": bool(top_n.get("showOthers", True)),
+    }
+
+
+def _partial_select(
+    scores: np.ndarray, parents: np.ndarray, limit: int, largest: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick the best ``limit`` members of each parent without sorting all of them."""
+    keep = np.zeros(len(scores), dtype=bool)
+    ranks = np.full(len(scores), limit, dtype=np.int64)
+    fill = -np.inf if largest else np.inf
+    ordered = np.where(np.isnan(scores), fill, scores)
+    if largest:
+        ordered = -ordered
+
+    order = np.argsort(parents, kind="stable")
+    bounds = np.flatnonzero(np.diff(parents[order])) + 1
+    for group in np.split(order, bounds):
+        if len(group) > limit:
+            group = group[np.argpartition(ordered[group], limit - 1)[:limit]]
+        group = group[np.argsort(ordered[group], kind="stable")]
+        keep[group] = True
+        ranks[group] = np.arange(len(group))
+    return keep, ranks
+
+
+def _apply_top_n(
+    frame: pd.DataFrame,
+    dims: List[str],
+    spec: Dict[str, Any],
+    measures: List[str],
+    aggfunc: Any,
+    needed: List[str],
+) -> Tuple[pd.DataFrame, Dict[str, int], Dict[str, Any]]:
+    level = _resolve_level(dims, spec["level"], 0)
+    measure = spec.get("measure") or measures[0]
+    _ensure_measure(frame, measure)
+    keys = dims[: level + 1]
+
+    grouper = frame.groupby(keys, dropna=False, sort=False)
+    ranking = grouper[measure].agg(aggfunc)
+    scores = pd.to_numeric(ranking, errors="coerce").to_numpy(dtype=float)
+    if level:
+        parents = ranking.index.droplevel(-1).factorize(use_na_sentinel=False)[0]
+    else:
+        parents = np.zeros(len(scores), dtype=np.intp)
+
+    keep, ranks = _partial_select(scores, parents, spec["n"], spec["direction"] == "top")
+    row_mask = keep[grouper.ngroup().to_numpy()]
+
+    rank_map = {
+        _column_to_key(label): int(rank)
+        for label, rank, kept in zip(ranking.index, ranks, keep)
+        if kept
+    }
+    subset = frame[needed]
+    has_others = not bool(row_mask.all())
+    if has_others and spec["showOthers"]:
+        label = spec["othersLabel"]
+        subset = subset.copy()
+        subset[dims[level]] = subset[dims[level]].astype(object).where(row_mask, label)
+        for deeper in dims[level + 1 :]:
+            subset[deeper] = subset[deeper].astype(object).where(row_mask, None)
+    elif has_others:
+        subset = subset[row_mask]
+
+    applied = {
+        **spec,
+        "level": level,
+        "measure": measure,
+        "members": int(keep.sum()),
+        "others": has_others and spec["showOthers"],
+    }
+    return subset, rank_map, applied
+
+
+def _sort_index_safe(grouped: pd.DataFrame, axis: int) -> pd.DataFrame:
+    try:
+        return grouped.sort_index(axis=axis)
+    except TypeError:
+        # Top-N buckets mix the "Outros" label with numeric members.
+        return grouped.sort_index(
+            axis=axis,
+            key=lambda index: index.map(lambda value: "" if pd.isna(value) else str(value)),
+        )
+
+
+def _axis_labels(grouped: pd.DataFrame, axis: str) -> List[Tuple[Any, ...]]:
+    index = grouped.index if axis == "rows" else grouped.columns
+    return [label if isinstance(label, tuple) else (label,) for label in index]
+
+
+def _hierarchical_order(
+    labels: List[Tuple[Any, ...]],
+    depth: int,
+    scores: np.ndarray,
+    pinned: np.ndarray,
+) -> np.ndarray:
+    """Order labels by member score inside their parent, keeping parents in place."""
+    parent_codes = pd.Index([_column_to_key(label[:depth]) for label in labels]).factorize()[0]
+    member_codes = pd.Index([_column_to_key(label[: depth + 1]) for label in labels]).factorize()[0]
+    scores = np.where(np.isnan(scores), np.inf, scores)
+    positions = np.arange(len(labels))
+    return np.lexsort((positions, member_codes, scores, pinned, parent_codes))
+
+
+def _take_axis(grouped: pd.DataFrame, axis: str, order: np.ndarray) -> pd.DataFrame:
+    if axis == "rows":
+        return grouped.iloc[order]
+    return grouped.iloc[:, order]
+
+
+def _sort_values_vector(grouped: pd.DataFrame, axis: str, by: Any) -> np.ndarray:
+    numeric = grouped.apply(lambda col: pd.to_numeric(col, errors="coerce"))
+    if by == "total":
+        total_axis = 1 if axis == "rows" else 0
+        return numeric.sum(axis=total_axis, min_count=1).to_numpy(dtype=float)
+
+    other = grouped.columns if axis == "rows" else grouped.index
+    lookup = {_column_to_key(label): position for position, label in enumerate(other)}
+    if by not in lookup:
+        raise PivotError(f"Membro '{by}' não foi encontrado para ordenar o pivot.")
+    if axis == "rows":
+        return numeric.iloc[:, lookup[by]].to_numpy(dtype=float)
+    return numeric.iloc[lookup[by]].to_numpy(dtype=float)
+
+
+def _order_pivot_axes(
+    grouped: pd.DataFrame,
+    dims_by_axis: Dict[str, List[str]],
+    sort: Optional[Dict[str, Any]],
+    top_n: Optional[Dict[str, Any]],
+    rank_map: Dict[str, int],
+) -> pd.DataFrame:
+    def pinned_mask(axis: str, labels: List[Tuple[Any, ...]], depth: int) -> np.ndarray:
+        # Keep the remainder bucket last among its siblings, unless ordering an upper level.
+        pinned = np.zeros(len(labels), dtype=bool)
+        if top_n is None or top_n["axis"] != axis or not top_n["others"]:
+            return pinned
+        others_depth = len(labels[0]) - len(dims_by_axis[axis]) + top_n["level"]
+        if depth < others_depth:
+            return pinned
+        return np.array([label[others_depth] == top_n["othersLabel"] for label in labels], dtype=bool)
+
+    if top_n is not None:
+        axis = top_n["axis"]
+        labels = _axis_labels(grouped, axis)
+        if labels:
+            offset = len(labels[0]) - len(dims_by_axis[axis])
+            depth = offset + top_n["level"]
+            scores = np.array(
+                [rank_map.get(_column_to_key(label[offset : depth + 1]), np.nan) for label in labels],
+                dtype=float,
+            )
+            order = _hierarchical_order(labels, depth, scores, pinned_mask(axis, labels, depth))
+            grouped = _take_axis(grouped, axis, order)
+
+    if sort is not None:
+        axis = sort["axis"]
+        dims = dims_by_axis[axis]
+        labels = _axis_labels(grouped, axis)
+        if not dims or not labels:
+            return grouped
+        level = _resolve_level(dims, sort["level"], len(dims) - 1)
+        depth = len(labels[0]) - len(dims) + level
+        values = _sort_values_vector(grouped, axis, sort["by"])
+        member_keys = [_column_to_key(label[: depth + 1]) for label in labels]
+        totals = pd.Series(values).groupby(member_keys, sort=False).transform(
+            lambda group: group.sum(min_count=1)
+        )
+        scores = totals.to_numpy(dtype=float)
+        if sort["direction"] == "desc":
+            scores = -scores
+        order = _hierarchical_order(labels, depth, scores, pinned_mask(axis, labels, depth))
+        grouped = _take_axis(grouped, axis, order)
+
+    return grouped
+
+
+def _pivot_codes(frame: pd.DataFrame, dims: List[str]) -> Tuple[np.ndarray, Optional[pd.Index]]:
+    if not dims:
+        return np.zeros(len(frame), dtype=np.int64), None
+    grouper = frame.groupby(dims, dropna=False, sort=True)
+    return grouper.ngroup().to_numpy(dtype=np.int64), grouper.size().index
+
+
+def _grid_to_frame(
+    cells: Dict[str, np.ndarray],
+    row_keys: Optional[pd.Index],
+    col_keys: Optional[pd.Index],
+    measures: List[str],
+) -> pd.DataFrame:
+    """Lay out per-measure (rows x columns) matrices the way pandas pivots do."""
+    if row_keys is not None and col_keys is not None:
+        if len(measures) == 1:
+            return pd.DataFrame(cells[measures[0]], index=row_keys, columns=col_keys)
+        labels = [
+            (measure_name, *(key if isinstance(key, tuple) else (key,)))
+            for measure_name in measures
+            for key in col_keys
+        ]
+        header = pd.MultiIndex.from_tuples(labels, names=[None, *col_keys.names])
+        matrix = np.hstack([cells[measure_name] for measure_name in measures])
+        return pd.DataFrame(matrix, index=row_keys, columns=header)
+    if row_keys is not None:
+        return pd.DataFrame(
+            {measure_name: cells[measure_name][:, 0] for measure_name in measures},
+            index=row_keys,
+        )
+    return pd.DataFrame(
+        [cells[measure_name][0] for measure_name in measures],
+        index=measures,
+        columns=col_keys,
+    )
+
+
+def _ranking_func(agg_meta: Dict[str, Any], options: Dict[str, Any]) -> Any:
+    if agg_meta.get("sketch") == "quantile":
+        try:
+            quantile = target_quantile(agg_meta, options)
+        except AggregateError as exc:
+            raise PivotError(str(exc)) from exc
+        return lambda values: values.quantile(quantile)
+    return agg_meta["func"]
+
+
+def _cross_levels(grouped: pd.DataFrame) -> pd.DataFrame:
+    """Expand both axes to every combination of their levels, like pivot_table(dropna=False)."""
+    for axis in (0, 1):
+        index = grouped.index if axis == 0 else grouped.columns
+        if isinstance(index, pd.MultiIndex):
+            # Missing members have code -1 and are not part of ``levels``; keep them last.
+            levels = [
+                level.append(pd.Index([np.nan])) if (codes == -1).any() else level
+                for level, codes in zip(index.levels, index.codes)
+            ]
+            full = pd.MultiIndex.from_product(levels, names=index.names)
+            grouped = grouped.reindex(full, axis=axis)
+    return grouped
+
+
+def _value_spec(
+    measure_name: str, aggregator: str, options: Dict[str, Any], label: Optional[str] = None
+) -> Dict[str, Any]:
+    return {
+        "measure": measure_name,
+        "aggregator": aggregator,
+        "meta": _resolve_agg(aggregator),
+        "options": options,
+        "label": label,
+    }
+
+
+def _default_value_label(spec: Dict[str, Any]) -> str:
+    meta = spec["meta"]
+    label = meta["label"]
+    if meta.get("state") == "quantile" and meta.get("quantile") is None:
+        try:
+            quantile = target_quantile(meta, spec["options"])
+        except AggregateError as exc:
+            raise PivotError(str(exc)) from exc
+        label = f"{label} {quantile * 100:g}"
+    return f"{spec['measure']} ({label})"
+
+
+def _normalize_values(
+    values: Any, frame: pd.DataFrame, default_options: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Parse ``[{"measure": ..., "aggregator": ...}, ...]`` (or pairs) into value specs."""
+    if not isinstance(values, (list, tuple)) or not values:
+        raise PivotError("Informe ao menos um par de medida e agregação em 'values'.")
+    specs: List[Dict[str, Any]] = []
+    for entry in values:
+        if isinstance(entry, dict):
+            measure_name = entry.get("measure")
+            aggregator = entry.get("aggregator") or "sum"
+            options = entry.get("options") or default_options
+            label = entry.get("label")
+        elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+            measure_name, aggregator = entry
+            options, label = default_options, None
+        else:
+            raise PivotError("Cada valor deve informar uma medida e uma agregação.")
+        if not measure_name:
+            raise PivotError("Cada valor deve informar uma medida.")
+        _ensure_measure(frame, str(measure_name))
+        specs.append(
+            _value_spec(str(measure_name), str(aggregator), options, str(label) if label else None)
+        )
+
+    shared_aggregator = len({spec["aggregator"] for spec in specs}) == 1
+    for spec in specs:
+        if spec["label"] is None:
+            spec["label"] = spec["measure"] if shared_aggregator else _default_value_label(spec)
+    labels = [spec["label"] for spec in specs]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise PivotError(f"Valores duplicados na tabela dinâmica: {', '.join(duplicates)}.")
+    return specs
+
+
+def _measure_states(
+    frame: pd.DataFrame,
+    specs: List[Dict[str, Any]],
+    codes: np.ndarray,
+    ngroups: int,
+    base_states: Optional[Dict[str, MeasureState]] = None,
+    workers: int = 1,
+) -> Dict[str, MeasureState]:
+    """Build one state per measure holding the components every spec on it needs.
+
+    With ``base_states`` (one group per row of ``frame``, e.g. a materialized
+    cube) the existing states are regrouped instead of scanning raw values.
+    With ``workers > 1`` each measure is reduced per row partition on the
+    shared thread pool and the partial states are merged.
+    """
+    if base_states is not None:
+        return {
+            spec["measure"]: base_states[spec["measure"]].regroup(codes, ngroups) for spec in specs
+        }
+    keys_by_measure: Dict[str, List[Any]] = {}
+    for spec in specs:
+        keys_by_measure.setdefault(spec["measure"], []).extend(
+            component_keys(spec["meta"], spec["options"])
+        )
+    partitions = row_partitions(len(frame), workers)
+    tasks = []
+    owners = []
+    for measure_name, keys in keys_by_measure.items():
+        series = frame[measure_name]
+        for part in partitions:
+            tasks.append(partial(MeasureState.build, series.iloc[part], codes[part], ngroups, keys))
+            owners.append(measure_name)
+    partials: Dict[str, List[MeasureState]] = {}
+    for measure_name, state in zip(owners, run_tasks(tasks, workers)):
+        partials.setdefault(measure_name, []).append(state)
+    return {
+        measure_name: states[0] if len(states) == 1 else MeasureState.merge(states)
+        for measure_name, states in partials.items()
+    }
+
+
+def _integral_values(frame: pd.DataFrame, name: str, state: Optional[str]) -> bool:
+    """Whether pandas would give integer cells for ``state`` over the ``name`` column."""
+    if state in ("count", "nunique"):
+        return True
+    if state not in ("sum", "min", "max") or name not in frame.columns:
+        return False
+    return pd.api.types.is_integer_dtype(frame[name]) or pd.api.types.is_bool_dtype(frame[name])
+
+
+def _cast_integer_columns(
+    grouped: pd.DataFrame, integral: Set[str], labels: List[str], measures_on_columns: bool
+) -> pd.DataFrame:
+    if not integral:
+        return grouped
+    if len(integral) == len(labels):
+        targets = list(grouped.columns)
+    elif measures_on_columns:
+        targets = [
+            column
+            for column in grouped.columns
+            if (column[0] if isinstance(column, tuple) else column) in integral
+        ]
+    else:
+        return grouped
+    grouped = grouped.copy()
+    for column in targets:
+        if not grouped[column].isna().any():
+            grouped[column] = grouped[column].astype(np.int64)
+    return grouped
+
+
+def _restore_integer_columns(
+    grouped: pd.DataFrame,
+    frame: pd.DataFrame,
+    measures: List[str],
+    agg_meta: Dict[str, Any],
+    measures_on_columns: bool,
+) -> pd.DataFrame:
+    """Give state-computed cells the integer dtype pandas would have produced."""
+    state = agg_meta.get("state")
+    integral = {name for name in measures if _integral_values(frame, name, state)}
+    return _cast_integer_columns(grouped, integral, measures, measures_on_columns)
+
+
+def _integral_specs(frame: pd.DataFrame, specs: List[Dict[str, Any]]) -> Set[str]:
+    return {
+        spec["label"]
+        for spec in specs
+        if _integral_values(frame, spec["measure"], spec["meta"].get("state"))
+    }
+
+
+def _as_integer(value: Any) -> Any:
+    if isinstance(value, (float, np.floating)) and np.isfinite(value) and float(value).is_integer():
+        return int(value)
+    return value
+
+
+def _restore_integer_values(
+    grouped: pd.DataFrame,
+    totals: Dict[str, Any],
+    frame: pd.DataFrame,
+    specs: List[Dict[str, Any]],
+    measures_on_columns: bool,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Per value spec counterpart of ``_restore_integer_columns``, merged totals included."""
+    integral = _integral_specs(frame, specs)
+    if not integral:
+        return grouped, totals
+    labels = [spec["label"] for spec in specs]
+    every = len(integral) == len(labels)
+
+    def restore(series: pd.Series, by_label: bool) -> pd.Series:
+        restored = series.astype(object)
+        for position, key in enumerate(series.index):
+            label = key[0] if isinstance(key, tuple) else key
+            if every or (by_label and label in integral):
+                restored.iloc[position] = _as_integer(series.iloc[position])
+        return restored
+
+    # Totals across the measures are integral only when every measure is.
+    totals = {
+        "rows": restore(totals["rows"], not measures_on_columns),
+        "columns": restore(totals["columns"], measures_on_columns),
+        "grand": _as_integer(totals["grand"]) if every else totals["grand"],
+    }
+    return _cast_integer_columns(grouped, integral, labels, measures_on_columns), totals
+
+
+def _restore_integer_summary(
+    summary_values: Dict[str, Any], frame: pd.DataFrame, specs: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    integral = _integral_specs(frame, specs)
+    return {
+        label: _as_integer(value) if label in integral else value
+        for label, value in summary_values.items()
+    }
+
+
+def _state_summary(
+    frame: pd.DataFrame,
+    specs: List[Dict[str, Any]],
+    base_states: Optional[Dict[str, MeasureState]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    codes = np.zeros(len(frame), dtype=np.int64)
+    summary_values: Dict[str, Any] = {}
+    descriptions: Dict[str, Dict[str, Any]] = {}
+    try:
+        states = _measure_states(frame, specs, codes, 1, base_states)
+        for spec in specs:
+            state = states[spec["measure"]]
+            summary_values[spec["label"]] = _to_native(state.finalize(spec["meta"], spec["options"])[0])
+            descriptions[spec["label"]] = state.describe(spec["meta"], spec["options"])
+    except AggregateError as exc:
+        raise PivotError(str(exc)) from exc
+    return summary_values, descriptions
+
+
+def _state_pivot(
+    frame: pd.DataFrame,
+    rows: List[str],
+    columns: List[str],
+    specs: List[Dict[str, Any]],
+    base_states: Optional[Dict[str, MeasureState]] = None,
+    workers: int = 1,
+) -> Tuple[pd.DataFrame, Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Aggregate every value spec from one grouping of the data.
+
+    Each measure is reduced once into mergeable components shared by all of
+    its aggregators (e.g. ``avg`` reuses the ``sum`` and ``count`` of
+    ``sum``/``count``). Row, column and grand totals regroup those components
+    instead of adding cell values, so they stay correct for non-additive
+    aggregators.
+    """
+    row_codes, row_keys = _pivot_codes(frame, rows)
+    col_codes, col_keys = _pivot_codes(frame, columns)
+    n_rows = len(row_keys) if row_keys is not None else 1
+    n_cols = len(col_keys) if col_keys is not None else 1
+    n_cells = n_rows * n_cols
+    cell_codes = row_codes * n_cols + col_codes
+    observed = np.bincount(cell_codes, minlength=n_cells) > 0
+
+    cell_ids = np.arange(n_cells)
+    cells: Dict[str, np.ndarray] = {}
+    by_row: Dict[str, np.ndarray] = {}
+    by_col: Dict[str, np.ndarray] = {}
+    grand: Dict[str, float] = {}
+    descriptions: Dict[str, Dict[str, Any]] = {}
+    try:
+        states = _measure_states(frame, specs, cell_codes, n_cells, base_states, workers)
+        row_states = {name: state.regroup(cell_ids // n_cols, n_rows) for name, state in states.items()}
+        col_states = {name: state.regroup(cell_ids % n_cols, n_cols) for name, state in states.items()}
+        grand_states = {
+            name: state.regroup(np.zeros_like(cell_ids), 1) for name, state in states.items()
+        }
+        for spec in specs:
+            label, name = spec["label"], spec["measure"]
+            meta, options = spec["meta"], spec["options"]
+            estimates = np.where(observed, states[name].finalize(meta, options), np.nan)
+            cells[label] = estimates.reshape(n_rows, n_cols)
+            by_row[label] = row_states[name].finalize(meta, options)
+            by_col[label] = col_states[name].finalize(meta, options)
+            grand[label] = float(grand_states[name].finalize(meta, options)[0])
+            descriptions[label] = states[name].describe(meta, options, grand_states[name])
+    except AggregateError as exc:
+        raise PivotError(str(exc)) from exc
+
+    labels = [spec["label"] for spec in specs]
+    grouped = _grid_to_frame(cells, row_keys, col_keys, labels)
+    if row_keys is not None and col_keys is not None:
+        row_totals = sum(by_row[label] for label in labels)
+        column_totals = np.concatenate([by_col[label] for label in labels])
+    elif row_keys is not None:
+        row_totals = sum(by_row[label] for label in labels)
+        column_totals = np.array([grand[label] for label in labels])
+    else:
+        row_totals = np.array([grand[label] for label in labels])
+        column_totals = sum(cells[label][0] for label in labels)
+
+    merged_totals = {
+        "rows": pd.Series(row_totals, index=grouped.index),
+        "columns": pd.Series(column_totals, index=grouped.columns),
+        "grand": sum(grand.values()),
+    }
+    return grouped, merged_totals, descriptions
+
+
 def build_pivot(
     dataset_id: str,
     frame: pd.DataFrame,
@@ -380,8 +1050,21 @@ def build_pivot(
     columns: Optional[List[str]],
     measure: Union[str, Sequence[str]],
     aggregator: str,
+    sort: Optional[Dict[str, Any]] = None,
+    top_n: Optional[Dict[str, Any]] = None,
+    aggregator_options: Optional[Dict[str, Any]] = None,
+    values: Optional[Sequence[Any]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    cubes: Optional[Sequence[MaterializedCube]] = None,
+    state_source: Optional["StateSource"] = None,
+    filter_index: Optional[Callable[[str], Any]] = None,
 ) -> PivotResult:
-    if isinstance(measure, (list, tuple, set)):
+    agg_options = aggregator_options or {}
+    value_specs: Optional[List[Dict[str, Any]]] = None
+    if values is not None:
+        value_specs = _normalize_values(values, frame, agg_options)
+        measures = list(dict.fromkeys(spec["measure"] for spec in value_specs))
+    elif isinstance(measure, (list, tuple, set)):
         measures = [str(m) for m in measure if m]
     else:
         measures = [measure] if measure else []
@@ -392,24 +1075,120 @@ def build_pivot(
     for selected in measures:
         _ensure_measure(frame, selected)
 
-    agg_meta = _resolve_agg(aggregator)
+    if value_specs is not None:
+        aggregators = list(dict.fromkeys(spec["aggregator"] for spec in value_specs))
+        formats = {spec["meta"].get("format", "number") for spec in value_specs}
+        aggregator = aggregators[0] if len(aggregators) == 1 else "multiple"
+        value_format = formats.pop() if len(formats) == 1 else "number"
+        ranking_spec = next(
+            (
+                spec
+                for spec in value_specs
+                if top_n and isinstance(top_n, dict) and spec["measure"] == top_n.get("measure")
+            ),
+            value_specs[0],
+        )
+        agg_meta, ranking_options = ranking_spec["meta"], ranking_spec["options"]
+    else:
+        agg_meta = _resolve_agg(aggregator)
+        value_format = agg_meta.get("format", "number")
+        ranking_options = agg_options
+        if agg_meta.get("sketch"):
+            value_specs = [
+                _value_spec(measure_name, aggregator, agg_options, measure_name)
+                for measure_name in measures
+            ]
     aggfunc = agg_meta["func"]
-    value_format = agg_meta.get("format", "number")
+    labels = [spec["label"] for spec in value_specs] if value_specs is not None else measures
 
     rows = rows or []
     columns = columns or []
+    sort_spec = _normalize_sort(sort)
+    top_n_spec = _normalize_top_n(top_n)
+
+    def _describe(descriptions: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        described: Dict[str, Any] = {}
+        if values is not None:
+            described["values"] = [
+                {
+                    "measure": spec["measure"],
+                    "aggregator": spec["aggregator"],
+                    "label": spec["label"],
+                    "format": spec["meta"].get("format", "number"),
+                    **(
+                        {"approximation": descriptions[spec["label"]]}
+                        if descriptions.get(spec["label"])
+                        else {}
+                    ),
+                }
+                for spec in value_specs
+            ]
+        elif descriptions:
+            described["approximation"] = next(iter(descriptions.values()))
+        return described
+
+    # Route to the smallest materialized cube covering dimensions, filters and
+    # aggregators; otherwise filter and aggregate the raw rows.
+    route_specs = value_specs or [
+        _value_spec(measure_name, aggregator, agg_options, measure_name) for measure_name in measures
+    ]
+    cube_keys: Optional[pd.DataFrame] = None
+    cube_states: Optional[Dict[str, MeasureState]] = None
+    aggregate_source: Dict[str, Any] = {}
+    if cubes is not None:
+        cube = None
+        if top_n_spec is None:
+            cube = route(cubes, frame, [*rows, *columns], filters or {}, route_specs)
+        if cube is not None:
+            cube_keys, cube_states = cube.select(filters or {}, measures)
+            cube.record_hit()
+            aggregate_source = cube.describe()
+        else:
+            aggregate_source = {
+                "source": "rows",
+                "routable": top_n_spec is None and routable(route_specs),
+            }
+    if state_source is not None and cube_keys is None and top_n_spec is None:
+        # Partitioned or chunked scans return cube-shaped keys and merged states.
+        dimensions = list(dict.fromkeys([*rows, *columns, *filter_columns(frame, filters or {})]))
+        aggregated = state_source.aggregate(dimensions, filters or {}, route_specs)
+        if aggregated is not None:
+            cube_keys, cube_states = aggregated
+            aggregate_source = state_source.describe()
+    if cube_keys is None and filters:
+        frame = apply_filters(frame, filters, filter_index)
+    if filters is not None and (frame.empty if cube_keys is None else len(cube_keys) == 0):
+        raise PivotError("Nenhum dado corresponde aos filtros aplicados.")
 
     if not rows and not columns:
-        summary_values = {
-            measure_name: _to_native(frame[measure_name].agg(aggfunc))
-            for measure_name in measures
-        }
+        summary_metadata: Dict[str, Any] = {}
+        if cube_keys is not None:
+            summary_values, descriptions = _state_summary(cube_keys, route_specs, cube_states)
+            summary_metadata = _describe(descriptions)
+            if value_specs is None:
+                integral = _restore_integer_columns(
+                    pd.DataFrame([summary_values]), frame, measures, agg_meta, True
+                )
+                summary_values = {
+                    name: _to_native(value) for name, value in integral.iloc[0].items()
+                }
+            else:
+                summary_values = _restore_integer_summary(summary_values, frame, value_specs)
+        elif value_specs is not None:
+            summary_values, descriptions = _state_summary(frame, value_specs)
+            summary_values = _restore_integer_summary(summary_values, frame, value_specs)
+            summary_metadata = _describe(descriptions)
+        else:
+            summary_values = {
+                measure_name: _to_native(frame[measure_name].agg(aggfunc))
+                for measure_name in measures
+            }
         first_value = next(iter(summary_values.values())) if summary_values else None
         return PivotResult(
             dataset_id=dataset_id,
             rows=[],
             columns=[],
-            measures=measures,
+            measures=labels,
             aggregator=aggregator,
             row_headers=[],
             column_headers=[],
@@ -423,7 +1202,27 @@ def build_pivot(
             calculations={"pre": [], "post": []},
             value_format=value_format,
             summary_values=summary_values,
+            metadata={**summary_metadata, **({"aggregate": aggregate_source} if aggregate_source else {})},
+        )
+
+    dims_by_axis = {"rows": rows, "columns": columns}
+    rank_map: Dict[str, int] = {}
+    metadata: Dict[str, Any] = {}
+    if top_n_spec is not None and dims_by_axis[top_n_spec["axis"]]:
+        needed = list(dict.fromkeys([*rows, *columns, *measures]))
+        frame, rank_map, top_n_spec = _apply_top_n(
+            frame,
+            dims_by_axis[top_n_spec["axis"]],
+            top_n_spec,
+            measures,
+            _ranking_func(agg_meta, ranking_options),
+            needed,
         )
+        metadata["topN"] = top_n_spec
+    else:
+        top_n_spec = None
+    if sort_spec is not None:
+        metadata["sort"] = sort_spec
 
     pivot_values: Union[str, List[str]]
     if len(measures) == 1:
@@ -431,7 +1230,44 @@ def build_pivot(
     else:
         pivot_values = measures
 
-    if rows and columns:
+    merged_totals: Optional[Dict[str, Any]] = None
+    if aggregate_source:
+        metadata["aggregate"] = aggregate_source
+    workers = request_workers(len(frame)) if cube_keys is None else 1
+    if workers > 1:
+        metadata["parallel"] = {
+            "threads": workers,
+            "partitions": len(row_partitions(len(frame), workers)),
+        }
+    if cube_keys is not None or (
+        workers > 1 and value_specs is None and routable(route_specs)
+    ):
+        # Cubes and parallel runs reduce mergeable states; without ``values``
+        # the result is shaped like the pivot_table one (summed totals).
+        source, states = (cube_keys, cube_states) if cube_keys is not None else (frame, None)
+        grouped, state_totals, descriptions = _state_pivot(
+            source, rows, columns, route_specs, states, workers
+        )
+        if value_specs is not None:
+            grouped, merged_totals = _restore_integer_values(
+                grouped, state_totals, frame, value_specs, bool(rows)
+            )
+            metadata.update(_describe(descriptions))
+            metadata["totals"] = "merged"
+        else:
+            if rows and columns:
+                grouped = _cross_levels(grouped)
+            grouped = _restore_integer_columns(grouped, frame, measures, agg_meta, bool(rows))
+    elif value_specs is not None:
+        grouped, merged_totals, descriptions = _state_pivot(
+            frame, rows, columns, value_specs, workers=workers
+        )
+        grouped, merged_totals = _restore_integer_values(
+            grouped, merged_totals, frame, value_specs, bool(rows)
+        )
+        metadata.update(_describe(descriptions))
+        metadata["totals"] = "merged"
+    elif rows and columns:
         grouped = pd.pivot_table(
             frame,
             values=pivot_values,
@@ -449,17 +1285,184 @@ def build_pivot(
     if isinstance(grouped, pd.Series):
         grouped = grouped.to_frame(name=measures[0])
 
-    grouped = grouped.sort_index(axis=0)
-    grouped = grouped.sort_index(axis=1)
-
-    return _create_pivot_result_from_grouped(
+    grouped = _sort_index_safe(grouped, axis=0)
+    grouped = _sort_index_safe(grouped, axis=1)
+    if values is not None and len(labels) > 1:
+        # Value groups keep the order in which they were requested.
+        if rows and columns:
+            grouped = grouped.reindex(columns=labels, level=0)
+        elif rows:
+            grouped = grouped[labels]
+        else:
+            grouped = grouped.loc[labels]
+    if top_n_spec is not None:
+        # pivot_table(dropna=False) crosses every level; keep only the selected members.
+        grouped = grouped.dropna(axis=0 if top_n_spec["axis"] == "rows" else 1, how="all")
+    if top_n_spec is not None or sort_spec is not None:
+        grouped = _order_pivot_axes(grouped, dims_by_axis, sort_spec, top_n_spec, rank_map)
+
+    result = _create_pivot_result_from_grouped(
         dataset_id=dataset_id,
         rows=rows,
         columns=columns,
-        measures=measures,
+        measures=labels,
         aggregator=aggregator,
         value_format=value_format,
         grouped=grouped,
+        merged_totals=merged_totals,
+    )
+    result.metadata = metadata
+    return result
+
+
+def _calculation_columns(calculations: Sequence[Dict[str, Any]]) -> List[str]:
+    """Source columns read by pre calculations (excluding fields they create)."""
+    produced: List[str] = []
+    needed: List[str] = []
+    for calc in calculations:
+        if (calc.get("operation") or "add").lower() == "expression":
+            try:
+                tokens = parse_expression((calc.get("options") or {}).get("expression") or "").tokens
+            except ExpressionError as exc:
+                raise CalculationError(str(exc)) from exc
+        else:
+            tokens = tuple(
+                operand.get("field")
+                for operand in calc.get("inputs") or []
+                if (operand or {}).get("type", "column") == "column"
+            )
+        needed.extend(token for token in tokens if token and token not in produced)
+        if calc.get("resultField"):
+            produced.append(calc["resultField"])
+    return list(dict.fromkeys(needed))
+
+
+class ChunkedScan:
+    """Folds an on-disk columnar store, one row group at a time, into merged states.
+
+    Each chunk holds only the columns the query reads; filters and pre
+    calculations run per chunk and group keys are mapped to ids shared by all
+    chunks, so memory follows the chunk size and the number of groups.
+    """
+
+    def __init__(self, store: Any, calculations: Optional[Sequence[Dict[str, Any]]] = None) -> None:
+        self.store = store
+        self.calculations = [
+            calc
+            for calc in calculations or []
+            if (calc.get("stage") or "pre").lower() in {"pre", "both"}
+        ]
+        self.schema = apply_pre_calculations(store.schema_frame(), self.calculations)
+        self.chunks = 0
+
+    def aggregate(
+        self,
+        dimensions: Sequence[str],
+        filters: Dict[str, Any],
+        specs: Sequence[Dict[str, Any]],
+    ) -> Optional[Tuple[pd.DataFrame, Dict[str, MeasureState]]]:
+        wanted: Dict[str, List[Any]] = {}
+        for spec in specs:
+            wanted.setdefault(spec["measure"], []).extend(
+                component_keys(spec["meta"], spec["options"])
+            )
+        produced = {calc.get("resultField") for calc in self.calculations}
+        columns = [
+            column
+            for column in dict.fromkeys(
+                [*dimensions, *filters, *wanted, *_calculation_columns(self.calculations)]
+            )
+            if column in self.schema.columns and column not in produced
+        ]
+
+        group_ids: Dict[Tuple[Any, ...], int] = {}
+        states: Dict[str, MeasureState] = {}
+        self.chunks = 0
+        for chunk in self.store.iter_chunks(columns):
+            self.chunks += 1
+            chunk = apply_filters(chunk, filters)
+            if chunk.empty:
+                continue
+            chunk = apply_pre_calculations(chunk, self.calculations)
+            if dimensions:
+                grouper = chunk.groupby(list(dimensions), dropna=False, sort=False)
+                codes = grouper.ngroup().to_numpy(dtype=np.int64)
+                chunk_keys = [
+                    tuple(None if pd.isna(part) else part for part in key)
+                    for key in (
+                        grouper.size().index
+                        if len(dimensions) > 1
+                        else ((key,) for key in grouper.size().index)
+                    )
+                ]
+            else:
+                codes = np.zeros(len(chunk), dtype=np.int64)
+                chunk_keys = [()]
+            previous = len(group_ids)
+            mapping = np.array(
+                [group_ids.setdefault(key, len(group_ids)) for key in chunk_keys], dtype=np.int64
+            )
+            ngroups = len(group_ids)
+            for name, keys in wanted.items():
+                partial_state = MeasureState.build(
+                    chunk[name], codes, len(chunk_keys), keys
+                ).regroup(mapping, ngroups)
+                if name in states:
+                    running = states[name]
+                    if ngroups != previous:
+                        running = running.regroup(np.arange(previous, dtype=np.int64), ngroups)
+                    partial_state = MeasureState.merge([running, partial_state])
+                states[name] = partial_state
+
+        ordered = list(group_ids)
+        keys_frame = pd.DataFrame(index=pd.RangeIndex(len(ordered)))
+        for position, column in enumerate(dimensions):
+            members = [key[position] for key in ordered]
+            try:
+                keys_frame[column] = pd.Series(members, dtype=self.schema[column].dtype)
+            except (TypeError, ValueError):
+                keys_frame[column] = pd.Series(members, dtype=object)
+        return keys_frame, states
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "source": "disk",
+            "store": getattr(self.store, "name", None),
+            "rowGroups": len(self.store.row_groups),
+            "sourceRows": self.store.row_count,
+        }
+
+
+def build_chunked_pivot(
+    dataset_id: str,
+    store: Any,
+    rows: Optional[List[str]],
+    columns: Optional[List[str]],
+    measure: Union[str, Sequence[str]],
+    aggregator: str,
+    sort: Optional[Dict[str, Any]] = None,
+    top_n: Optional[Dict[str, Any]] = None,
+    aggregator_options: Optional[Dict[str, Any]] = None,
+    values: Optional[Sequence[Any]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    pre_calculations: Optional[Sequence[Dict[str, Any]]] = None,
+) -> PivotResult:
+    """``build_pivot`` over a columnar store scanned in row groups instead of an in-memory frame."""
+    if _normalize_top_n(top_n) is not None:
+        raise PivotError("Top-N não está disponível para bases lidas do disco.")
+    scan = ChunkedScan(store, pre_calculations)
+    return build_pivot(
+        dataset_id=dataset_id,
+        frame=scan.schema,
+        rows=rows,
+        columns=columns,
+        measure=measure,
+        aggregator=aggregator,
+        sort=sort,
+        aggregator_options=aggregator_options,
+        values=values,
+        filters=filters or {},
+        state_source=scan,
     )
 
 
@@ -480,23 +1483,49 @@ def apply_post_calculations(
             "Não é possível adicionar colunas calculadas sem dimensões de coluna na tabela dinâmica."
         )
 
-    table = result.table.copy()
-    if isinstance(table.columns, pd.MultiIndex):
-        column_levels = table.columns.nlevels
+    table = result.table
+    column_levels = table.columns.nlevels
+    base_keys = list(result.column_keys)
+    base_lookup = {key: col for key, col in zip(base_keys, table.columns)}
+
+    nodes = _post_calculation_nodes(relevant, base_keys, column_levels)
+    labels = {node["key"]: node["label"] for node in nodes}
+    taken = set(table.columns)
+    for node in nodes:
+        if node["label"] in taken:
+            raise CalculationError(f"Coluna calculada '{node['name']}' duplica outra coluna da tabela.")
+        taken.add(node["label"])
+
+    column_lookup = {**base_lookup, **labels}
+    for node in nodes:
+        node["inputs"] = _post_calculation_inputs(node, table, column_lookup)
+        node["depends"] = [key for key in node["inputs"] if key in labels]
+
+    # Final layout first: each calculated column goes right after the last column
+    # it references (at the time it is declared), otherwise at the end.
+    order = list(base_keys)
+    for node in nodes:
+        positions = [order.index(key) for key in node["inputs"] if key in order]
+        order.insert((max(positions) + 1) if positions else len(order), node["key"])
+    final_labels = [column_lookup[key] for key in order]
+    if column_levels > 1:
+        header = pd.MultiIndex.from_tuples(final_labels, names=table.columns.names)
     else:
-        column_levels = 1
+        header = pd.Index(final_labels, name=table.columns.name)
 
-    column_keys = list(result.column_keys)
-    column_lookup = {key: col for key, col in zip(column_keys, table.columns)}
+    # One preallocated matrix in final column order; every node writes its own slot.
+    matrix = np.full((len(table.index), len(order)), np.nan)
+    slots = {key: position for position, key in enumerate(order)}
+    for key, label in base_lookup.items():
+        matrix[:, slots[key]] = pd.to_numeric(table[label], errors="coerce").to_numpy(dtype=float)
+    work = pd.DataFrame(matrix, index=table.index, columns=header, copy=False)
 
-    for calc in relevant:
-        operands = calc.get("inputs") or []
-        operation = (calc.get("operation") or "add").lower()
+    for node in _topological_order(nodes):
+        calc = node["calc"]
         options = calc.get("options") or {}
-        referenced_keys: List[str] = []
-        if operation == "expression":
-            result_series, referenced_keys = _evaluate_expression_series(
-                table,
+        if node["operation"] == "expression":
+            result_series, _ = _evaluate_expression_series(
+                work,
                 options.get("expression"),
                 stage="post",
                 column_lookup=column_lookup,
@@ -504,35 +1533,22 @@ def apply_post_calculations(
             result_series = _apply_decimals(result_series, options)
         else:
             series_list = [
-                _resolve_post_operand(table, column_lookup, operand)
-                for operand in operands
+                _resolve_post_operand(work, column_lookup, operand)
+                for operand in calc.get("inputs") or []
             ]
-            result_series = _evaluate_operation(
-                series_list,
-                calc.get("operation"),
-                options,
-            )
-            referenced_keys = [
-                operand.get("columnKey")
-                for operand in operands
-                if operand.get("type", "column") == "column"
-            ]
-
-        result_key = calc.get("resultKey") or calc.get("id") or f"calc::{len(column_keys)}"
-        new_label = _build_calculated_column_label(calc.get("name") or result_key, column_levels)
-
-        table[new_label] = result_series
-        current_columns = list(table.columns)
-        current_columns.remove(new_label)
-
-        positions = [column_keys.index(key) for key in referenced_keys if key in column_keys]
-        insert_pos = (max(positions) + 1) if positions else len(column_keys)
-
-        current_columns.insert(insert_pos, new_label)
-        table = table[current_columns]
-
-        column_keys.insert(insert_pos, result_key)
-        column_lookup[result_key] = new_label
+            result_series = _evaluate_operation(series_list, calc.get("operation"), options)
+        matrix[:, slots[node["key"]]] = pd.to_numeric(result_series, errors="coerce").to_numpy(
+            dtype=float
+        )
+    table = work
+
+    merged_totals = None
+    if result.metadata.get("totals") == "merged":
+        merged_totals = {
+            "rows": pd.Series(result.row_totals, index=result.table.index, dtype=float),
+            "columns": pd.Series(result.column_totals, index=result.table.columns, dtype=float),
+            "grand": result.grand_total,
+        }
 
     updated = _create_pivot_result_from_grouped(
         dataset_id=result.dataset_id,
@@ -543,13 +1559,90 @@ def apply_post_calculations(
         value_format=result.value_format,
         grouped=table,
         summary_values=result.summary_values,
+        merged_totals=merged_totals,
     )
     updated.summary_value = result.summary_value
+    updated.metadata = copy.deepcopy(result.metadata)
     updated.calculations["pre"] = copy.deepcopy(result.calculations.get("pre", []))
     updated.calculations["post"] = copy.deepcopy(relevant)
     return updated
 
 
+def _post_calculation_nodes(
+    calculations: List[Dict[str, Any]], base_keys: List[str], column_levels: int
+) -> List[Dict[str, Any]]:
+    nodes: List[Dict[str, Any]] = []
+    for position, calc in enumerate(calculations):
+        operation = (calc.get("operation") or "add").lower()
+        key = calc.get("resultKey") or calc.get("id") or f"calc::{len(base_keys) + position}"
+        if any(node["key"] == key for node in nodes) or key in base_keys:
+            raise CalculationError(f"Chave de coluna calculada '{key}' repetida.")
+        inputs: List[str] = []
+        if operation == "expression":
+            try:
+                tokens = parse_expression((calc.get("options") or {}).get("expression") or "").tokens
+            except ExpressionError as exc:
+                raise CalculationError(str(exc)) from exc
+            inputs = [token.strip() for token in tokens]
+        else:
+            inputs = [
+                operand.get("columnKey")
+                for operand in calc.get("inputs") or []
+                if (operand or {}).get("type", "column") == "column"
+            ]
+        name = calc.get("name") or key
+        nodes.append(
+            {
+                "calc": calc,
+                "key": key,
+                "name": name,
+                "label": _build_calculated_column_label(name, column_levels),
+                "operation": operation,
+                "inputs": inputs,
+            }
+        )
+    return nodes
+
+
+def _post_calculation_inputs(
+    node: Dict[str, Any], table: pd.DataFrame, column_lookup: Dict[str, Any]
+) -> List[str]:
+    """Column keys read by ``node`` (base or calculated columns)."""
+    keys: List[str] = []
+    for reference in node["inputs"]:
+        key: Optional[str] = reference
+        if node["operation"] == "expression":
+            label, key = _match_post_column(column_lookup, table, reference)
+            if key is None:
+                key = next((k for k, value in column_lookup.items() if value == label), None)
+        if key is not None and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def _topological_order(nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Nodes ordered so every calculated column is evaluated after its inputs."""
+    by_key = {node["key"]: node for node in nodes}
+    pending = {node["key"]: len(node["depends"]) for node in nodes}
+    dependents: Dict[str, List[str]] = {key: [] for key in by_key}
+    for node in nodes:
+        for key in node["depends"]:
+            dependents[key].append(node["key"])
+    ready = [node["key"] for node in nodes if not pending[node["key"]]]
+    ordered: List[Dict[str, Any]] = []
+    while ready:
+        key = ready.pop(0)
+        ordered.append(by_key[key])
+        for dependent in dependents[key]:
+            pending[dependent] -= 1
+            if not pending[dependent]:
+                ready.append(dependent)
+    if len(ordered) < len(nodes):
+        cycle = ", ".join(str(by_key[key]["name"]) for key, count in pending.items() if count)
+        raise CalculationError(f"Dependência circular entre colunas calculadas: {cycle}.")
+    return ordered
+
+
 def suggest_measures(frame: pd.DataFrame) -> List[str]:
     numeric_cols = frame.select_dtypes(include=["number", "bool"]).columns.tolist()
     if numeric_cols:
@@ -569,9 +1662,6 @@ def _flatten_header(header: Any) -> str:
     return str(header)
 
 
-EXPRESSION_PLACEHOLDER = re.compile(r"\{([^{}]+)\}")
-
-
 def _match_post_column(
     column_lookup: Dict[str, Any],
     table: pd.DataFrame,
@@ -608,97 +1698,77 @@ def _evaluate_expression_series(
     stage: str,
     column_lookup: Optional[Dict[str, Any]] = None,
 ) -> Tuple[pd.Series, List[str]]:
-    expr = (expression or "").strip()
-    if not expr:
-        raise CalculationError("Expressão personalizada não foi informada.")
+    try:
+        parsed = parse_expression(expression or "")
+    except ExpressionError as exc:
+        raise CalculationError(str(exc)) from exc
 
-    token_to_var: Dict[str, str] = {}
-    series_map: Dict[str, pd.Series] = {}
     referenced_keys: List[str] = []
-
-    def resolve_pre_series(token: str) -> pd.Series:
-        if token not in frame.columns:
-            raise CalculationError(f"Coluna '{token}' não encontrada na expressão.")
-        return pd.to_numeric(frame[token], errors="coerce")
-
-    def resolve_post_series(token: str) -> pd.Series:
+    binding: List[Any] = []
+    for token in parsed.tokens:
+        if stage == "pre":
+            if token not in frame.columns:
+                raise CalculationError(f"Coluna '{token}' não encontrada na expressão.")
+            binding.append(token)
+            continue
         if column_lookup is None:
             raise CalculationError("Não há colunas disponíveis para calcular a expressão.")
         label, key = _match_post_column(column_lookup, frame, token)
-        series = pd.to_numeric(frame[label], errors="coerce")
         if key and key not in referenced_keys:
             referenced_keys.append(key)
-        return series
-
-    def replace_placeholder(match: re.Match[str]) -> str:
-        token = match.group(1).strip()
-        if not token:
-            raise CalculationError("A expressão contém identificadores vazios.")
-        if token not in token_to_var:
-            var_name = f"__col_{len(token_to_var)}"
-            token_to_var[token] = var_name
-            if stage == "pre":
-                series_map[var_name] = resolve_pre_series(token)
-            else:
-                series_map[var_name] = resolve_post_series(token)
-        return token_to_var[token]
-
-    transformed = EXPRESSION_PLACEHOLDER.sub(replace_placeholder, expr)
-
-    if not token_to_var:
-        try:
-            constant_value = float(pd.eval(expr, engine="python"))
-        except Exception:
-            try:
-                constant_value = float(eval(expr, {"__builtins__": {}}, {}))
-            except Exception as exc:  # pragma: no cover - defensive
-                raise CalculationError("Expressão personalizada inválida.") from exc
-        index = frame.index
-        return _series_from_constant(constant_value, index), referenced_keys
+        binding.append(label)
 
     try:
-        result = pd.eval(
-            transformed,
-            local_dict=series_map,
-            global_dict={"__builtins__": {}},
-            engine="python",
-        )
+        compiled = compile_expression(parsed.text, tuple(binding))
+        arrays = [column_values(frame[column], kind) for column, kind in compiled.columns]
+        result = compiled.evaluate(arrays)
+    except ExpressionError as exc:
+        raise CalculationError(str(exc)) from exc
     except Exception as exc:  # pragma: no cover - runtime safety
         raise CalculationError("Erro ao avaliar a expressão personalizada.") from exc
 
-    if isinstance(result, (int, float)):
-        reference_series = next(iter(series_map.values()))
-        series = _series_from_constant(result, reference_series.index)
-    elif isinstance(result, pd.Series):
-        series = result
-    else:
-        try:
-            series = pd.Series(result, index=frame.index)
-        except Exception as exc:
-            raise CalculationError("Expressão personalizada retornou um resultado inválido.") from exc
+    if np.ndim(result) == 0:
+        if isinstance(result, str):
+            return pd.Series(result, index=frame.index, dtype=object), referenced_keys
+        value = float(result)
+        return _series_from_constant(np.nan if np.isinf(value) else value, frame.index), referenced_keys
+    result = np.asarray(result)
+    if result.dtype.kind == "f":
+        result = np.where(np.isinf(result), np.nan, result)
+    return pd.Series(result, index=frame.index), referenced_keys
+
 
-    series = series.replace([np.inf, -np.inf], np.nan)
-    return series, referenced_keys
+def _export_labels(result: PivotResult) -> Tuple[List[str], List[str]]:
+    row_labels = result.rows[:] if result.rows else ["Medida"]
+    column_labels = [_flatten_header(header) for header in result.column_headers]
+    if not column_labels and result.measures:
+        column_labels = result.measures[:]
+    return row_labels, column_labels
 
 
-def pivot_result_to_dataframe(result: PivotResult) -> pd.DataFrame:
+def pivot_export_columns(result: PivotResult) -> List[str]:
+    """Header of the flat (exported) table of ``result``."""
     if result.table is None:
         summary = dict(result.summary_values) if result.summary_values else {}
-        if not summary:
-            key = result.measures[0] if result.measures else "Valor"
-            summary[key] = result.summary_value
-        return pd.DataFrame([summary])
+        return [str(key) for key in summary] or [result.measures[0] if result.measures else "Valor"]
+    row_labels, column_labels = _export_labels(result)
+    return row_labels + column_labels + ["Total"]
 
-    row_dim_count = len(result.rows)
-    row_labels = result.rows[:] if row_dim_count else ["Medida"]
 
-    column_labels = [_flatten_header(header) for header in result.column_headers]
-    if not column_labels and result.measures:
-        column_labels = result.measures[:]
-    if not column_labels:
-        column_labels = []
+def iter_pivot_rows(result: PivotResult) -> Iterator[List[Any]]:
+    """Rows of the flat table of ``result`` (row labels, cells, row total), then the totals row.
 
-    rows_data: List[List[Any]] = []
+    Rows are produced one at a time from the result, so exports can write
+    them as they come.
+    """
+    if result.table is None:
+        summary = dict(result.summary_values) if result.summary_values else {}
+        yield [_to_native(value) for value in summary.values()] if summary else [_to_native(result.summary_value)]
+        return
+
+    row_dim_count = len(result.rows)
+    row_labels, column_labels = _export_labels(result)
+    width = len(column_labels)
     for idx, values in enumerate(result.values):
         header_values = result.row_headers[idx] if idx < len(result.row_headers) else []
         if row_dim_count:
@@ -708,17 +1778,18 @@ def pivot_result_to_dataframe(result: PivotResult) -> pd.DataFrame:
         else:
             labels = [_flatten_header(header_values) if header_values else (result.measures[idx] if idx < len(result.measures) else "Total")]
         const_values = [_to_native(val) for val in values]
-        if len(const_values) < len(column_labels):
-            const_values.extend([None] * (len(column_labels) - len(const_values)))
+        if len(const_values) < width:
+            const_values.extend([None] * (width - len(const_values)))
         total_value = result.row_totals[idx] if idx < len(result.row_totals) else None
-        rows_data.append(labels + const_values + [total_value])
+        yield labels + const_values + [_to_native(total_value)]
 
     total_labels = ["Total"] + ["" for _ in range(len(row_labels) - 1)]
     totals = [_to_native(val) for val in result.column_totals]
-    if len(totals) < len(column_labels):
-        totals.extend([None] * (len(column_labels) - len(totals)))
-    totals.append(result.grand_total)
-    rows_data.append(total_labels + totals)
+    if len(totals) < width:
+        totals.extend([None] * (width - len(totals)))
+    totals.append(_to_native(result.grand_total))
+    yield total_labels + totals
+
 
-    columns = row_labels + column_labels + ["Total"]
-    return pd.DataFrame(rows_data, columns=columns)
+def pivot_result_to_dataframe(result: PivotResult) -> pd.DataFrame:
+    return pd.DataFrame(list(iter_pivot_rows(result)), columns=pivot_export_columns(result))
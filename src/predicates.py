@@ -0,0 +1,206 @@
+"""Filter predicates: member lists plus ranges, exclusions, dates, null checks and text matching.
+
+A filter is either a list of members (``["2024", "2025"]``, compared as text)
+or an object whose operators are all required::
+
+    {"gte": 100000}                      {"between": ["2025-01-01", "2025-06-30"]}
+    {"year": [2024, 2025]}               {"notIn": ["Cancelado"], "isNull": false}
+    {"contains": "obra"}                 {"startsWith": "10"}
+
+Each operator compiles to one vectorized mask over the column.
+"""
+from __future__ import annotations
+
+import re
+import warnings
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .expressions import column_values
+
+FilterValue = Union[List[str], Dict[str, Any]]
+
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte", "between")
+OPERATORS = ("in", "notIn", *RANGE_OPERATORS, "year", "contains", "startsWith", "isNull")
+
+_DAY_FIRST = re.compile(r"^\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}")
+
+
+class FilterError(ValueError):
+    """Raised when a filter predicate is invalid."""
+
+
+def is_predicate(value: Any) -> bool:
+    return isinstance(value, dict)
+
+
+def _bound_value(column: str, operator: str, value: Any) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise FilterError(f"Valor inválido em '{operator}' do filtro de '{column}'.")
+    return value
+
+
+def normalize_filter(column: str, value: Any) -> Optional[FilterValue]:
+    """Validated filter for ``column``, or ``None`` when it restricts nothing.
+
+    A predicate with only ``in`` becomes a plain member list.
+    """
+    if isinstance(value, list):
+        keep = [str(item) for item in value if item is not None]
+        return keep or None
+    if not isinstance(value, dict):
+        return None
+    predicate: Dict[str, Any] = {}
+    for operator, argument in value.items():
+        if operator not in OPERATORS:
+            raise FilterError(
+                f"Operador de filtro '{operator}' desconhecido para '{column}'. "
+                f"Opções: {', '.join(OPERATORS)}."
+            )
+        if argument is None:
+            continue
+        if operator in ("in", "notIn"):
+            if not isinstance(argument, list):
+                raise FilterError(f"'{operator}' do filtro de '{column}' deve ser uma lista.")
+            members = [str(item) for item in argument if item is not None]
+            if members:
+                predicate[operator] = members
+        elif operator == "between":
+            if not isinstance(argument, list) or len(argument) != 2:
+                raise FilterError(f"'between' do filtro de '{column}' deve ser uma lista [início, fim].")
+            predicate[operator] = [
+                None if bound is None else _bound_value(column, operator, bound) for bound in argument
+            ]
+        elif operator in RANGE_OPERATORS:
+            predicate[operator] = _bound_value(column, operator, argument)
+        elif operator == "year":
+            years = argument if isinstance(argument, list) else [argument]
+            try:
+                predicate[operator] = sorted({int(year) for year in years})
+            except (TypeError, ValueError) as exc:
+                raise FilterError(f"'year' do filtro de '{column}' deve conter anos inteiros.") from exc
+        elif operator == "isNull":
+            if not isinstance(argument, bool):
+                raise FilterError(f"'isNull' do filtro de '{column}' deve ser true ou false.")
+            predicate[operator] = argument
+        elif str(argument):
+            predicate[operator] = str(argument).lower()
+    if list(predicate) == ["in"]:
+        return predicate["in"]
+    return predicate or None
+
+
+def range_bounds(predicate: Dict[str, Any]) -> List[tuple]:
+    """``(operator, bound)`` pairs of the range operators, ``between`` split in two."""
+    bounds = []
+    for operator in RANGE_OPERATORS:
+        if operator not in predicate:
+            continue
+        if operator == "between":
+            low, high = predicate[operator]
+            bounds.extend(
+                pair for pair in (("gte", low), ("lte", high)) if pair[1] is not None
+            )
+        else:
+            bounds.append((operator, predicate[operator]))
+    return bounds
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def range_kind(series: pd.Series, bounds: List[tuple]) -> str:
+    """Whether ``series`` is compared to the bounds as numbers or as dates."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "date"
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "number"
+    return "number" if all(_is_number(bound) for _, bound in bounds) else "date"
+
+
+def parse_bound(kind: str, value: Any, column: str) -> Any:
+    """A range bound as a float or a ``datetime64[ns]`` comparable with the column."""
+    if kind == "number":
+        try:
+            return float(value)
+        except (TypeError, ValueError) as exc:
+            raise FilterError(f"Valor '{value}' inválido para o filtro numérico de '{column}'.") from exc
+    text = str(value)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            stamp = pd.to_datetime(text, dayfirst=bool(_DAY_FIRST.match(text)))
+    except (TypeError, ValueError) as exc:
+        raise FilterError(f"Data '{value}' inválida para o filtro de '{column}'.") from exc
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert(None)
+    return stamp.to_datetime64().astype("datetime64[ns]")
+
+
+def _compare(values: np.ndarray, operator: str, bound: Any) -> np.ndarray:
+    if operator == "gt":
+        return values > bound
+    if operator == "gte":
+        return values >= bound
+    if operator == "lt":
+        return values < bound
+    return values <= bound
+
+
+def _range_mask(series: pd.Series, predicate: Dict[str, Any]) -> np.ndarray:
+    bounds = range_bounds(predicate)
+    kind = range_kind(series, bounds)
+    values = column_values(series, kind)
+    mask = np.ones(len(series), dtype=bool)
+    for operator, bound in bounds:
+        mask &= _compare(values, operator, parse_bound(kind, bound, str(series.name)))
+    return mask
+
+
+def predicate_mask(series: pd.Series, predicate: Dict[str, Any]) -> np.ndarray:
+    """Boolean mask of the values of ``series`` satisfying every operator of ``predicate``.
+
+    ``in``/``notIn`` compare the text of the values like member filters (so a
+    missing value is kept by ``notIn``); ranges, ``year`` and text matching
+    never match a missing value.
+    """
+    mask = np.ones(len(series), dtype=bool)
+    if any(operator in predicate for operator in RANGE_OPERATORS):
+        mask &= _range_mask(series, predicate)
+    text: Optional[pd.Series] = None
+    for operator, argument in predicate.items():
+        if operator in RANGE_OPERATORS:
+            continue
+        if operator == "isNull":
+            mask &= series.isna().to_numpy() == argument
+        elif operator == "year":
+            if pd.api.types.is_numeric_dtype(series):
+                raise FilterError(f"O filtro 'year' requer uma coluna de datas ('{series.name}').")
+            dates = column_values(series, "date")
+            years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+            mask &= ~np.isnat(dates) & np.isin(years, argument)
+        else:
+            if text is None:
+                text = series.astype(str)
+            if operator == "in":
+                mask &= text.isin(argument).to_numpy()
+            elif operator == "notIn":
+                mask &= ~text.isin(argument).to_numpy()
+            else:
+                lowered = text.str.lower()
+                matched = (
+                    lowered.str.contains(argument, regex=False)
+                    if operator == "contains"
+                    else lowered.str.startswith(argument)
+                )
+                mask &= matched.to_numpy(dtype=bool) & series.notna().to_numpy()
+    return mask
@@ -0,0 +1,329 @@
+"""Mergeable sketches backing the approximate pivot aggregators."""
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+HLL_MIN_PRECISION = 4
+HLL_MAX_PRECISION = 16
+HLL_DEFAULT_PRECISION = int(os.getenv("SAIKU_HLL_PRECISION", "12"))
+
+
+class SketchError(ValueError):
+    """Raised when a sketch is configured with invalid parameters."""
+
+
+def hash_series(series: pd.Series) -> np.ndarray:
+    """Return stable 64-bit hashes for the values of ``series``."""
+    if series.dtype == object:
+        # Hashing Python strings dominates; hash each distinct value only once.
+        codes, uniques = pd.factorize(series)
+        hashed = pd.util.hash_pandas_object(pd.Series(uniques), index=False)
+        return hashed.to_numpy(dtype=np.uint64)[codes]
+    return pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+
+
+def _leading_zeros(values: np.ndarray) -> np.ndarray:
+    result = np.zeros(values.shape, dtype=np.uint8)
+    work = values.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = work < np.uint64(1 << (64 - shift))
+        result[mask] += shift
+        work[mask] <<= np.uint64(shift)
+    result[values == 0] = 64
+    return result
+
+
+def hll_relative_error(precision: int) -> float:
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def resolve_hll_precision(options: Optional[Dict[str, Any]]) -> int:
+    """Pick the register precision from ``precision`` or a target ``relativeError``."""
+    options = options or {}
+    precision: Any = options.get("precision")
+    relative_error = options.get("relativeError")
+    if precision is None and relative_error is not None:
+        try:
+            error = float(relative_error)
+        except (TypeError, ValueError):
+            raise SketchError("Valor de 'relativeError' inválido.")
+        if error <= 0:
+            raise SketchError("Valor de 'relativeError' deve ser positivo.")
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+    if precision is None:
+        precision = HLL_DEFAULT_PRECISION
+    try:
+        precision = int(precision)
+    except (TypeError, ValueError):
+        raise SketchError("Valor de 'precision' inválido.")
+    return min(max(precision, HLL_MIN_PRECISION), HLL_MAX_PRECISION)
+
+
+@dataclass
+class HyperLogLogState:
+    """HyperLogLog registers for many groups at once.
+
+    Registers are kept sparse as ``(group, register, rank)`` triples, so memory
+    grows with the input rather than with ``groups * 2**precision``. Two states
+    with the same precision merge by taking the per-register maximum.
+    """
+
+    precision: int
+    groups: np.ndarray
+    registers: np.ndarray
+    ranks: np.ndarray
+
+    @classmethod
+    def from_hashes(
+        cls, hashes: np.ndarray, codes: np.ndarray, precision: int
+    ) -> "HyperLogLogState":
+        registers = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+        remainder = hashes << np.uint64(precision)
+        ranks = np.minimum(_leading_zeros(remainder) + 1, 64 - precision + 1)
+        state = cls(precision, codes.astype(np.int64), registers, ranks.astype(np.uint8))
+        return state.compact()
+
+    @classmethod
+    def from_series(
+        cls, series: pd.Series, codes: np.ndarray, precision: int
+    ) -> "HyperLogLogState":
+        valid = series.notna().to_numpy()
+        return cls.from_hashes(hash_series(series[valid]), codes[valid], precision)
+
+    @classmethod
+    def concat(cls, states: Iterable["HyperLogLogState"]) -> "HyperLogLogState":
+        states = list(states)
+        precisions = {state.precision for state in states}
+        if len(precisions) != 1:
+            raise SketchError("Sketches HyperLogLog com precisões diferentes não podem ser combinados.")
+        merged = cls(
+            precisions.pop(),
+            np.concatenate([state.groups for state in states]),
+            np.concatenate([state.registers for state in states]),
+            np.concatenate([state.ranks for state in states]),
+        )
+        return merged.compact()
+
+    def compact(self) -> "HyperLogLogState":
+        if not len(self.groups):
+            return self
+        size = 1 << self.precision
+        keys = self.groups * size + self.registers
+        best = pd.Series(self.ranks).groupby(keys, sort=False).max()
+        keys = best.index.to_numpy(dtype=np.int64)
+        return HyperLogLogState(
+            self.precision, keys // size, keys % size, best.to_numpy(dtype=np.uint8)
+        )
+
+    def regroup(self, mapping: np.ndarray) -> "HyperLogLogState":
+        """Merge groups following ``mapping`` (old group code -> new group code)."""
+        return HyperLogLogState(
+            self.precision, mapping[self.groups], self.registers, self.ranks
+        ).compact()
+
+    @property
+    def relative_error(self) -> float:
+        return hll_relative_error(self.precision)
+
+    def estimate(self, ngroups: int) -> np.ndarray:
+        size = 1 << self.precision
+        if size == 16:
+            alpha = 0.673
+        elif size == 32:
+            alpha = 0.697
+        elif size == 64:
+            alpha = 0.709
+        else:
+            alpha = 0.7213 / (1.0 + 1.079 / size)
+
+        weights = np.ldexp(1.0, -self.ranks.astype(np.int64))
+        inverse = np.bincount(self.groups, weights=weights, minlength=ngroups)
+        filled = np.bincount(self.groups, minlength=ngroups)
+        empty = size - filled
+        raw = alpha * size * size / (inverse + empty)
+        linear = size * np.log(size / np.maximum(empty, 1))
+        result = np.where((raw <= 2.5 * size) & (empty > 0), linear, raw)
+        result[filled == 0] = 0.0
+        return result
+
+
+QUANTILE_DEFAULT_COMPRESSION = float(os.getenv("SAIKU_QUANTILE_COMPRESSION", "200"))
+QUANTILE_EXACT_LIMIT = int(os.getenv("SAIKU_QUANTILE_EXACT_LIMIT", "4096"))
+
+
+def resolve_quantile(options: Optional[Dict[str, Any]], default: Optional[float]) -> float:
+    """Read the target quantile from ``percentile`` (0-100) or ``quantile`` (0-1)."""
+    options = options or {}
+    value: Any
+    if options.get("quantile") is not None:
+        value = options.get("quantile")
+        scale = 1.0
+    elif options.get("percentile") is not None:
+        value = options.get("percentile")
+        scale = 100.0
+    elif default is not None:
+        return default
+    else:
+        value = 90
+        scale = 100.0
+    try:
+        quantile = float(value) / scale
+    except (TypeError, ValueError):
+        raise SketchError("Valor de percentil inválido.")
+    if not 0.0 <= quantile <= 1.0:
+        raise SketchError("O percentil deve estar entre 0 e 100.")
+    return quantile
+
+
+def resolve_compression(options: Optional[Dict[str, Any]]) -> float:
+    value = (options or {}).get("compression", QUANTILE_DEFAULT_COMPRESSION)
+    try:
+        compression = float(value)
+    except (TypeError, ValueError):
+        raise SketchError("Valor de 'compression' inválido.")
+    if compression < 10:
+        raise SketchError("Valor de 'compression' deve ser pelo menos 10.")
+    return compression
+
+
+def _group_starts(groups: np.ndarray) -> np.ndarray:
+    boundaries = np.flatnonzero(np.diff(groups)) + 1
+    return np.concatenate(([0], boundaries)) if len(groups) else boundaries
+
+
+@dataclass
+class QuantileState:
+    """Mergeable quantile sketch for many groups at once (t-digest style).
+
+    Centroids are stored as flat ``(group, mean, weight)`` arrays sorted by
+    group and mean. Groups with up to ``exact_limit`` values keep every value
+    (weight 1), so their quantiles match pandas' linear interpolation exactly.
+    Larger groups are folded into at most ~``compression / 2`` centroids
+    using the arcsine scale function, which keeps the tails fine-grained, and
+    always keep their minimum and maximum as singleton centroids.
+    """
+
+    compression: float
+    exact_limit: int
+    groups: np.ndarray
+    means: np.ndarray
+    weights: np.ndarray
+
+    @classmethod
+    def from_values(
+        cls,
+        values: np.ndarray,
+        codes: np.ndarray,
+        compression: float = QUANTILE_DEFAULT_COMPRESSION,
+        exact_limit: int = QUANTILE_EXACT_LIMIT,
+    ) -> "QuantileState":
+        valid = ~np.isnan(values)
+        state = cls(
+            compression,
+            exact_limit,
+            codes[valid].astype(np.int64),
+            values[valid],
+            np.ones(int(valid.sum()), dtype=float),
+        )
+        return state.compress()
+
+    @classmethod
+    def concat(cls, states: Iterable["QuantileState"]) -> "QuantileState":
+        states = list(states)
+        first = states[0]
+        merged = cls(
+            first.compression,
+            first.exact_limit,
+            np.concatenate([state.groups for state in states]),
+            np.concatenate([state.means for state in states]),
+            np.concatenate([state.weights for state in states]),
+        )
+        return merged.compress()
+
+    def regroup(self, mapping: np.ndarray) -> "QuantileState":
+        """Merge groups following ``mapping`` (old group code -> new group code)."""
+        return QuantileState(
+            self.compression,
+            self.exact_limit,
+            mapping[self.groups],
+            self.means,
+            self.weights,
+        ).compress()
+
+    @property
+    def is_exact(self) -> bool:
+        return bool(np.all(self.weights == 1.0))
+
+    def compress(self) -> "QuantileState":
+        if not len(self.groups):
+            return self
+        # Two cheap passes (float sort, then stable integer sort) beat np.lexsort here.
+        order = np.argsort(self.means)
+        order = order[np.argsort(self.groups[order], kind="stable")]
+        groups = self.groups[order]
+        means = self.means[order]
+        weights = self.weights[order]
+
+        starts = _group_starts(groups)
+        sizes = np.diff(np.concatenate((starts, [len(groups)])))
+        totals = np.add.reduceat(weights, starts)
+        group_index = np.repeat(np.arange(len(starts)), sizes)
+        position = np.arange(len(groups)) - starts[group_index]
+
+        cumulative = np.cumsum(weights)
+        before = cumulative - weights - (cumulative[starts] - weights[starts])[group_index]
+        total = totals[group_index]
+        q = (before + weights / 2.0) / total
+        scale = self.compression / (2.0 * math.pi)
+        buckets = np.floor(scale * (np.arcsin(np.clip(2.0 * q - 1.0, -1.0, 1.0)) + math.pi / 2.0))
+
+        last = position == sizes[group_index] - 1
+        buckets = np.where(position == 0, -1.0, buckets)
+        buckets = np.where(last & (position > 0), scale * math.pi + 1.0, buckets)
+        exact = total <= self.exact_limit
+        buckets = np.where(exact, position.astype(float), buckets)
+
+        change = (np.diff(groups) != 0) | (np.diff(buckets) != 0)
+        cluster_starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+        new_weights = np.add.reduceat(weights, cluster_starts)
+        new_means = np.add.reduceat(means * weights, cluster_starts) / new_weights
+        return QuantileState(
+            self.compression,
+            self.exact_limit,
+            groups[cluster_starts],
+            new_means,
+            new_weights,
+        )
+
+    def estimate(self, ngroups: int, quantile: float) -> np.ndarray:
+        result = np.full(ngroups, np.nan)
+        if not len(self.groups):
+            return result
+        groups, means, weights = self.groups, self.means, self.weights
+        starts = _group_starts(groups)
+        sizes = np.diff(np.concatenate((starts, [len(groups)])))
+        group_index = np.repeat(np.arange(len(starts)), sizes)
+
+        cumulative = np.cumsum(weights)
+        before = cumulative - weights - (cumulative[starts] - weights[starts])[group_index]
+        centers = before + (weights - 1.0) / 2.0
+        totals = np.add.reduceat(weights, starts)
+        targets = quantile * (totals - 1.0)
+
+        below = np.add.reduceat((centers <= targets[group_index]).astype(np.int64), starts)
+        left = starts + np.maximum(below, 1) - 1
+        right = np.minimum(left + 1, starts + sizes - 1)
+        span = centers[right] - centers[left]
+        fraction = np.divide(
+            targets - centers[left], span, out=np.zeros_like(span), where=span > 0
+        )
+        fraction = np.clip(fraction, 0.0, 1.0)
+        values = means[left] + fraction * (means[right] - means[left])
+        result[groups[starts]] = values
+        return result
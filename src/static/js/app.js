@@ -106,12 +106,65 @@ const state = {
 };
 
 let activeFilterField = null;
+let filterDialogSelection = new Set();
+let filterDialogRequest = 0;
+const FILTER_PAGE_SIZE = 200;
 let editingCalculation = null;
 
 function deepClone(value) {
   return JSON.parse(JSON.stringify(value ?? {}));
 }
 
+const conditionalResponses = new Map();
+const CONDITIONAL_CACHE_SIZE = 16;
+
+async function postJsonConditional(url, payload) {
+  // Resends the ETag of the last identical query; a 304 reuses its body.
+  const body = JSON.stringify(payload);
+  const key = `${url}\n${body}`;
+  const cached = conditionalResponses.get(key);
+  const headers = { 'Content-Type': 'application/json' };
+  if (cached) {
+    headers['If-None-Match'] = cached.etag;
+  }
+  const response = await fetch(url, { method: 'POST', headers, body });
+  if (response.status === 304 && cached) {
+    return { response, ok: true, data: deepClone(cached.data) };
+  }
+  const data = await response.json().catch(() => ({}));
+  const etag = response.headers.get('ETag');
+  conditionalResponses.delete(key);
+  if (response.ok && etag) {
+    conditionalResponses.set(key, { etag, data: deepClone(data) });
+    while (conditionalResponses.size > CONDITIONAL_CACHE_SIZE) {
+      conditionalResponses.delete(conditionalResponses.keys().next().value);
+    }
+  }
+  return { response, ok: response.ok, data };
+}
+
+const EXPORT_POLL_INTERVAL = 1000;
+
+async function waitForExportJob(job) {
+  // Polls a background export until its file is ready; null when redirected to login.
+  let current = job;
+  while (current.status === 'queued' || current.status === 'running') {
+    await new Promise((resolve) => setTimeout(resolve, EXPORT_POLL_INTERVAL));
+    const response = await fetch(current.statusUrl);
+    if (redirectToLoginIfNeeded(response)) {
+      return null;
+    }
+    current = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(current.error || 'Falha ao consultar a exportação.');
+    }
+  }
+  if (current.status !== 'done') {
+    throw new Error(current.error || 'Falha ao exportar.');
+  }
+  return current;
+}
+
 function insertExpressionToken(token) {
   if (!calcExpressionInput) return;
   const textarea = calcExpressionInput;
@@ -1850,18 +1903,11 @@ async function runPivot() {
 
   try {
     updateStatus('Executando consulta...', 'muted');
-    const response = await fetch('/api/pivot', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify(payload),
-    });
+    const { response, ok, data: result } = await postJsonConditional('/api/pivot', payload);
     if (redirectToLoginIfNeeded(response)) {
       return;
     }
-    const result = await response.json();
-    if (!response.ok) {
+    if (!ok) {
       throw new Error(result.error || 'Falha ao gerar tabela dinâmica.');
     }
     clearError();
@@ -1923,28 +1969,76 @@ function startNewQuery() {
   persistActiveLayout();
 }
 
-function getFilterOptions(field) {
+function getFacetPage(field, key) {
   const cache = getFilterValuesCache();
-  return cache[field] || [];
+  return cache[field] && cache[field].key === key ? cache[field].page : null;
 }
 
-function setFilterOptions(field, values) {
+function setFacetPage(field, key, page) {
   const cache = getFilterValuesCache();
-  cache[field] = values;
+  cache[field] = { key, page };
 }
 
-function buildFilterOption(value, isChecked) {
+function buildFilterOption(value, isChecked, count) {
   const label = document.createElement('label');
   const input = document.createElement('input');
   input.type = 'checkbox';
   input.value = value;
   input.checked = isChecked;
+  input.addEventListener('change', () => {
+    if (input.checked) {
+      filterDialogSelection.add(value);
+    } else {
+      filterDialogSelection.delete(value);
+    }
+  });
   label.appendChild(input);
   label.appendChild(document.createTextNode(value));
+  if (count !== undefined) {
+    const badge = document.createElement('span');
+    badge.className = 'filter-count';
+    badge.textContent = count.toLocaleString('pt-BR');
+    label.appendChild(badge);
+  }
   return label;
 }
 
-function renderFilterDialogOptions(field, values) {
+async function fetchFacetPage(field, search, offset) {
+  const filters = { ...state.filters };
+  delete filters[field];
+  const key = JSON.stringify(filters);
+  if (!search && offset === 0) {
+    const cached = getFacetPage(field, key);
+    if (cached) {
+      return cached;
+    }
+  }
+  const response = await fetch('/api/filter-values/facets', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      datasetId: state.datasetId,
+      fields: [{ field, search, offset, limit: FILTER_PAGE_SIZE }],
+      filters,
+    }),
+  });
+  if (redirectToLoginIfNeeded(response)) {
+    return null;
+  }
+  const result = await response.json();
+  if (!response.ok) {
+    throw new Error(result.error || 'Não foi possível carregar valores.');
+  }
+  const page = result.facets[field];
+  if (!search && offset === 0) {
+    setFacetPage(field, key, page);
+  }
+  return page;
+}
+
+function renderFilterDialogOptions(field) {
   filterDialogBody.innerHTML = '';
   const search = document.createElement('input');
   search.type = 'search';
@@ -1954,48 +2048,64 @@ function renderFilterDialogOptions(field, values) {
 
   const container = document.createElement('div');
   container.className = 'filter-options';
-  const selected = new Set(state.filters[field] || []);
-  values.forEach((value) => {
-    container.appendChild(buildFilterOption(value, selected.has(value)));
-  });
   filterDialogBody.appendChild(container);
 
-  search.addEventListener('input', () => {
-    const term = search.value.toLowerCase();
-    container.querySelectorAll('label').forEach((label) => {
-      const match = label.textContent.toLowerCase().includes(term);
-      label.style.display = match ? 'flex' : 'none';
+  const footer = document.createElement('div');
+  footer.className = 'filter-footer';
+  const summary = document.createElement('span');
+  summary.className = 'muted';
+  const more = document.createElement('button');
+  more.type = 'button';
+  more.className = 'tiny-button';
+  more.textContent = 'Carregar mais';
+  footer.appendChild(summary);
+  footer.appendChild(more);
+  filterDialogBody.appendChild(footer);
+
+  let offset = 0;
+  const load = async (reset) => {
+    const request = ++filterDialogRequest;
+    if (reset) {
+      offset = 0;
+    }
+    let page;
+    try {
+      page = await fetchFacetPage(field, search.value.trim(), offset);
+    } catch (error) {
+      container.innerHTML = `<p class="error">${error.message}</p>`;
+      return;
+    }
+    if (!page || request !== filterDialogRequest || activeFilterField !== field) {
+      return;
+    }
+    if (reset) {
+      container.innerHTML = '';
+    }
+    page.values.forEach(({ value, count }) => {
+      container.appendChild(buildFilterOption(value, filterDialogSelection.has(value), count));
     });
+    offset = page.offset + page.values.length;
+    summary.textContent = `${offset.toLocaleString('pt-BR')} de ${page.total.toLocaleString('pt-BR')} valores`;
+    more.classList.toggle('hidden', !page.hasMore);
+  };
+
+  let timer = null;
+  search.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(() => load(true), 200);
   });
+  more.addEventListener('click', () => load(false));
+  load(true);
 }
 
-async function openFilterDialog(field) {
+function openFilterDialog(field) {
   if (!state.datasetId) return;
   activeFilterField = field;
+  filterDialogSelection = new Set(state.filters[field] || []);
   filterDialogTitle.textContent = `Filtro: ${getFieldLabel(field)}`;
   dialogBackdrop.classList.remove('hidden');
   filterDialog.classList.remove('hidden');
-
-  const cache = getFilterValuesCache();
-  if (!cache[field]) {
-    try {
-      const params = new URLSearchParams({ datasetId: state.datasetId, field });
-      const response = await fetch(`/api/filter-values?${params.toString()}`);
-      if (redirectToLoginIfNeeded(response)) {
-        return;
-      }
-      const result = await response.json();
-      if (!response.ok) {
-        throw new Error(result.error || 'Não foi possível carregar valores.');
-      }
-      setFilterOptions(field, result.values || []);
-    } catch (error) {
-      filterDialogBody.innerHTML = `<p class="error">${error.message}</p>`;
-      return;
-    }
-  }
-
-  renderFilterDialogOptions(field, getFilterOptions(field));
+  renderFilterDialogOptions(field);
 }
 
 function closeFilterDialog() {
@@ -2022,9 +2132,7 @@ function applyFilterDialog() {
     closeFilterDialog();
     return;
   }
-  const selectedValues = Array.from(
-    filterDialogBody.querySelectorAll('input[type="checkbox"]:checked'),
-  ).map((input) => input.value);
+  const selectedValues = Array.from(filterDialogSelection);
 
   if (selectedValues.length) {
     state.filters[activeFilterField] = selectedValues;
@@ -2058,6 +2166,8 @@ async function exportPivot(format) {
     aggregator: aggregatorSelect.value || state.aggregations[0]?.id || 'sum',
     filters: state.filters,
     format,
+    // Excel and PDF are built by a background job; CSV streams right away.
+    background: format !== 'csv',
   };
   const calculationPayload = state.calculations || { pre: [], post: [] };
   payload.preCalculations = deepClone(calculationPayload.pre || []);
@@ -2082,10 +2192,26 @@ async function exportPivot(format) {
       throw new Error(errorBody.error || 'Falha ao exportar.');
     }
 
+    if (response.status === 202) {
+      const job = await waitForExportJob(await response.json());
+      if (!job) {
+        return;
+      }
+      const link = document.createElement('a');
+      link.href = job.downloadUrl;
+      link.download = job.filename || '';
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      updateStatus(`Arquivo (${format.toUpperCase()}) gerado com sucesso.`, 'success');
+      return;
+    }
+
     const blob = await response.blob();
     const url = URL.createObjectURL(blob);
     const disposition = response.headers.get('Content-Disposition');
-    let filename = `pivot.${format === 'excel' ? 'xlsx' : 'pdf'}`;
+    const extensions = { excel: 'xlsx', pdf: 'pdf', csv: 'csv' };
+    let filename = `pivot.${extensions[format] || format}`;
     if (disposition) {
       const match = /filename="?([^";]+)"?/i.exec(disposition);
       if (match) {
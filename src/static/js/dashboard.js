@@ -136,6 +136,56 @@ function redirectToLoginIfNeeded(response) {
   return false;
 }
 
+const conditionalResponses = new Map();
+const CONDITIONAL_CACHE_SIZE = 16;
+
+async function postJsonConditional(url, payload) {
+  // Resends the ETag of the last identical query; a 304 reuses its body.
+  const body = JSON.stringify(payload);
+  const key = `${url}\n${body}`;
+  const cached = conditionalResponses.get(key);
+  const headers = { 'Content-Type': 'application/json' };
+  if (cached) {
+    headers['If-None-Match'] = cached.etag;
+  }
+  const response = await fetch(url, { method: 'POST', headers, body });
+  if (response.status === 304 && cached) {
+    return { response, ok: true, data: JSON.parse(cached.text) };
+  }
+  const data = await response.json().catch(() => ({}));
+  const etag = response.headers.get('ETag');
+  conditionalResponses.delete(key);
+  if (response.ok && etag) {
+    conditionalResponses.set(key, { etag, text: JSON.stringify(data) });
+    while (conditionalResponses.size > CONDITIONAL_CACHE_SIZE) {
+      conditionalResponses.delete(conditionalResponses.keys().next().value);
+    }
+  }
+  return { response, ok: response.ok, data };
+}
+
+const EXPORT_POLL_INTERVAL = 1000;
+
+async function waitForExportJob(job) {
+  // Polls a background export until its file is ready; null when redirected to login.
+  let current = job;
+  while (current.status === 'queued' || current.status === 'running') {
+    await new Promise((resolve) => setTimeout(resolve, EXPORT_POLL_INTERVAL));
+    const response = await fetch(current.statusUrl);
+    if (redirectToLoginIfNeeded(response)) {
+      return null;
+    }
+    current = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(current.error || 'Falha ao consultar a exportação.');
+    }
+  }
+  if (current.status !== 'done') {
+    throw new Error(current.error || 'Falha na exportação.');
+  }
+  return current;
+}
+
 function setLoading(isLoading) {
   state.isLoading = isLoading;
   document.body.classList.toggle('loading', isLoading);
@@ -744,23 +794,16 @@ async function fetchDashboardData() {
   setLoading(true);
 
   try {
-    const response = await fetch('/api/dashboard/query', {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        datasetId: state.datasetId,
-        filters: state.filters,
-        scenario: state.scenario,
-        chartMode: state.chartMode,
-      }),
+    const { response, ok, data } = await postJsonConditional('/api/dashboard/query', {
+      datasetId: state.datasetId,
+      filters: state.filters,
+      scenario: state.scenario,
+      chartMode: state.chartMode,
     });
     if (redirectToLoginIfNeeded(response)) {
       return;
     }
-    const data = await response.json();
-    if (!response.ok) {
+    if (!ok) {
       throw new Error(data.error || 'Falha ao gerar o dashboard.');
     }
 
@@ -807,6 +850,8 @@ async function exportDashboardData(target, format) {
         scenario: state.scenario,
         target,
         format,
+        // PDF and PNG are rendered by a background job.
+        background: format !== 'csv',
       }),
     });
     if (redirectToLoginIfNeeded(response)) {
@@ -816,6 +861,19 @@ async function exportDashboardData(target, format) {
       const errorBody = await response.json().catch(() => ({}));
       throw new Error(errorBody.error || 'Falha na exportação.');
     }
+    if (response.status === 202) {
+      const job = await waitForExportJob(await response.json());
+      if (!job) {
+        return;
+      }
+      const link = document.createElement('a');
+      link.href = job.downloadUrl;
+      link.download = job.filename || '';
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      return;
+    }
     const blob = await response.blob();
     const disposition = response.headers.get('Content-Disposition');
     let filename = `${target}.${format}`;